@@ -2,9 +2,18 @@
 Milestone 2: Load-test harness for vLLM (OpenAI-compatible) server.
 
 - Constant arrival rate with gradual ramp-up.
-- Fixed workload: 200 input tokens (prompt_200.txt) / 200 output tokens, temperature=0.
+- Workload: SCENARIO (scenarios/registry.py), default fixed_200_200 = 200 input
+  tokens (prompt_200.txt) / 200 output tokens, temperature=0. Requests are
+  generated once per process and shared by all users; each user starts at its
+  own offset in the pool. Stats are named "/v1/chat/completions [<label>]"
+  (label = shape bucket or mode; "[200/200]" for the fixed scenario).
 - Metrics: RPS, p50/p95 latency, error rate (from Locust stats + optional JSON report).
 
+Env:
+  SCENARIO       Scenario spec, e.g. lognormal or chat_summarize?chat_share=0.5 (default fixed_200_200)
+  SCENARIO_SEED  Seed for the generated requests (default 0; same seed -> same requests)
+  SCENARIO_POOL  Requests generated per run (default 4096; users cycle through them)
+
 Usage (vLLM must be running on localhost:8000):
   locust -f loadtest/locustfile.py --host=http://localhost:8000
   # Headless, 10 min run, 20 users, spawn 2/sec, then open HTML report:
@@ -13,33 +22,46 @@ Usage (vLLM must be running on localhost:8000):
   # With ramp-up shape (see RampUpThenConstant shape below):
   locust -f loadtest/locustfile.py --host=http://localhost:8000 \
     --headless --run-time 10m
+  # Heavy-tailed lengths instead of 200/200:
+  SCENARIO=lognormal locust -f loadtest/locustfile.py --host=http://localhost:8000 --headless -u 20 -r 2
 """
 
+import itertools
 import os
 from locust import HttpUser, task
 
-# Import fixed 200/200 scenario
-from scenarios.fixed_200_200 import get_request_kwargs
+from scenarios.registry import DEFAULT_POOL_SIZE, DEFAULT_SCENARIO, load_pool
 
 # Base URL; override with --host when launching Locust
 HOST = os.environ.get("LOCUST_HOST", "http://localhost:8000")
+SCENARIO = os.environ.get("SCENARIO", DEFAULT_SCENARIO)
+SCENARIO_SEED = int(os.environ.get("SCENARIO_SEED", "0"))
+SCENARIO_POOL = int(os.environ.get("SCENARIO_POOL", str(DEFAULT_POOL_SIZE)))
+
+# Generate at import: a bad SCENARIO fails before any user starts
+load_pool(SCENARIO, SCENARIO_SEED, SCENARIO_POOL)
+_user_ids = itertools.count()
 
 
-class Fixed200200User(HttpUser):
-    """One user = repeated requests with fixed 200-in/200-out payload."""
+class ScenarioUser(HttpUser):
+    """One user = repeated requests from the SCENARIO pool (default fixed 200-in/200-out)."""
 
     abstract = False
 
     def on_start(self):
-        self.payload = get_request_kwargs()
+        self.pool = load_pool(SCENARIO, SCENARIO_SEED, SCENARIO_POOL)  # cached: shared by all users
+        # Spread users over the pool so they do not send the same request in lockstep
+        self.next = next(_user_ids) * 7919
 
     @task(1)
-    def chat_200_200(self):
-        """POST /v1/chat/completions with fixed prompt and max_tokens=200, temperature=0."""
+    def chat_completion(self):
+        """POST /v1/chat/completions with the next request of the scenario (temperature=0)."""
+        label, body = self.pool.get(self.next)
+        self.next += 1
         self.client.post(
             "/v1/chat/completions",
-            json=self.payload,
-            name="/v1/chat/completions [200/200]",
+            json=body,
+            name=f"/v1/chat/completions [{label}]",
         )
 
 
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Open-loop load generator (asyncio) next to the closed-loop Locust harness.
+
+Locust users (locustfile.py) send their next request only after the previous one
+returned, so when the server slows down the offered load drops with it and the
+wait is never measured (coordinated omission). Here requests are sent on a
+schedule fixed before the run, whatever the server does, and latency is timed
+from the *intended* send time: a stall shows up as the queue it really causes.
+
+Arrival processes (--arrival):
+  constant  one request every 1/--rate s
+  poisson   exponential gaps, mean rate --rate
+  onoff     bursts: Poisson at --rate for --on-sec, then --off-rate for --off-sec
+  trace     replay recorded arrivals (--trace, repeatable; time-scaled by
+            --speedup): locust *_stats_history.csv, CSV with a "timestamp"
+            column, or one epoch timestamp per line (scripts/replay_scaling.py
+            formats). CSV columns prompt_tokens / max_tokens, when present, set
+            each request's shape
+Requests: --scenario (scenarios/registry.py: fixed_200_200, lognormal,
+chat_summarize, shared_prefix, mix?shapes=...), pre-generated from --seed;
+--mix "prompt:max_tokens:weight,..." is short for --scenario "mix?shapes=...".
+Default the fixed 200/200.
+
+Outputs (experiments/runs/openloop_[<tag>_]<scenario>_<timestamp>_*):
+  summary.json    scenario, config, achieved rate, errors by kind, latency /
+                  service time / TTFT percentiles overall and per request label
+  timeseries.csv  per second: scheduled, completed, errors, in flight at the end
+                  of the second, p50/p95/p99/max latency of that second's
+                  completions, completion tokens
+  latency.hgrm    HdrHistogram percentile distribution (ms) of latency from the
+                  intended send time; service.hgrm from the actual send time
+                  (what a closed-loop tool reports); ttft.hgrm with --stream.
+                  Plot with the HdrHistogram plotter
+                  (https://hdrhistogram.github.io/HdrHistogram/plotFiles.html)
+
+Usage (from the repo root or loadtest/):
+  python loadtest/openloop.py --url http://localhost:8001 --arrival poisson --rate 20 --duration 120
+  python loadtest/openloop.py --arrival onoff --rate 60 --on-sec 10 --off-sec 20 --stream
+  python loadtest/openloop.py --arrival trace --trace experiments/runs/locust_2026-02-05_083957_stats_history.csv
+  python loadtest/openloop.py --rate 10 --mix "200:200:0.6,1000:100:0.3,50:500:0.1"
+  python loadtest/openloop.py --rate 5 --scenario "chat_summarize?chat_share=0.5"
+
+Send lag (actual minus intended send time) is reported too: if it grows, the
+generator itself is the bottleneck and the numbers are not trustworthy.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import json
+import math
+import random
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import httpx
+
+LOADTEST_DIR = Path(__file__).resolve().parent
+REPO_ROOT = LOADTEST_DIR.parent
+OUT_DIR = REPO_ROOT / "experiments" / "runs"
+sys.path.insert(0, str(LOADTEST_DIR))
+sys.path.insert(0, str(REPO_ROOT))
+
+from scenarios.registry import (  # noqa: E402
+    DEFAULT_POOL_SIZE,
+    DEFAULT_SCENARIO,
+    PromptBuilder,
+    ScenarioPool,
+    load_pool,
+    scenario_tag,
+)
+from scripts.replay_scaling import load_trace  # noqa: E402
+
+START_DELAY_SEC = 0.2  # build tasks / warm the event loop before the first intended send
+
+
+class HdrHistogram:
+    """Counts with `significant_digits` precision over any range (HdrHistogram-style), in microseconds."""
+
+    def __init__(self, significant_digits: int = 3) -> None:
+        self.significant_digits = significant_digits
+        self._exact_below = 10 ** significant_digits
+        self.counts: dict[int, int] = {}
+        self.total = 0
+        self.max_us = 0
+        self._sum = 0.0
+        self._sum_sq = 0.0
+
+    def _bucket(self, us: int) -> int:
+        """Highest value equivalent to us at this precision."""
+        if us < self._exact_below:
+            return us
+        unit = 10 ** (len(str(us)) - self.significant_digits)
+        return us // unit * unit + unit - 1
+
+    def record(self, seconds: float) -> None:
+        us = max(0, round(seconds * 1e6))
+        b = self._bucket(us)
+        self.counts[b] = self.counts.get(b, 0) + 1
+        self.total += 1
+        self.max_us = max(self.max_us, us)
+        self._sum += us
+        self._sum_sq += us * us
+
+    def _at(self, percentile: float) -> tuple[int, int]:
+        """(bucket value us, cumulative count) of the percentile (0..1)."""
+        target = max(1, math.ceil(percentile * self.total))
+        cumulative = 0
+        for value, count in sorted(self.counts.items()):
+            cumulative += count
+            if cumulative >= target:
+                return value, cumulative
+        return self.max_us, self.total
+
+    def value_at_ms(self, percentile: float) -> float:
+        if not self.total:
+            return 0.0
+        return min(self._at(percentile)[0], self.max_us) / 1000.0
+
+    @property
+    def mean_ms(self) -> float:
+        return self._sum / self.total / 1000.0 if self.total else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "count": self.total,
+            "mean_ms": round(self.mean_ms, 2),
+            **{f"p{p:g}_ms": round(self.value_at_ms(p / 100), 2) for p in (50, 90, 95, 99, 99.9)},
+            "max_ms": round(self.max_us / 1000.0, 2),
+        }
+
+    def hgrm(self, ticks_per_half_distance: int = 5) -> str:
+        """Percentile distribution in HdrHistogram's text format (values in ms)."""
+        lines = [f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>17}", ""]
+        if self.total:
+            k = 0
+            while True:
+                p = 1.0 - 0.5 ** (k / ticks_per_half_distance)
+                value, cumulative = self._at(p)
+                if cumulative >= self.total:
+                    break
+                lines.append(f"{value / 1000.0:12.3f} {p:14.12f} {cumulative:10d} {1 / (1 - p):17.2f}")
+                k += 1
+            lines.append(f"{self.max_us / 1000.0:12.3f} {1.0:14.12f} {self.total:10d}")
+        mean = self.mean_ms
+        var = self._sum_sq / self.total / 1e6 - mean * mean if self.total else 0.0
+        lines += [
+            f"#[Mean    = {mean:12.3f}, StdDeviation   = {math.sqrt(max(0.0, var)):12.3f}]",
+            f"#[Max     = {self.max_us / 1000.0:12.3f}, Total count    = {self.total:12d}]",
+            f"#[Buckets = {len(self.counts):12d}, SubBuckets     = {self._exact_below:12d}]",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+@dataclass
+class Result:
+    """One request; times are seconds since the run started."""
+
+    label: str
+    intended: float
+    sent: float = 0.0
+    first_token: float | None = None
+    done: float = 0.0
+    status: int = 0
+    error: str = ""
+    completion_tokens: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return not self.error
+
+    @property
+    def latency(self) -> float:
+        return self.done - self.intended
+
+
+# --- Arrival processes: offsets (s) from the start of the run ---
+
+
+def constant_arrivals(rate: float, duration: float) -> list[float]:
+    return [i / rate for i in range(int(rate * duration))]
+
+
+def poisson_arrivals(rate: float, duration: float, rng: random.Random) -> list[float]:
+    out, t = [], rng.expovariate(rate)
+    while t < duration:
+        out.append(t)
+        t += rng.expovariate(rate)
+    return out
+
+
+def onoff_arrivals(
+    rate: float, duration: float, on_sec: float, off_sec: float, off_rate: float, rng: random.Random
+) -> list[float]:
+    """Poisson at rate during ON periods and off_rate during OFF periods, starting ON."""
+    out, start, on = [], 0.0, True
+    while start < duration:
+        length = min(on_sec if on else off_sec, duration - start)
+        r = rate if on else off_rate
+        if r > 0:
+            out.extend(start + t for t in poisson_arrivals(r, length, rng))
+        start += length
+        on = not on
+    return out
+
+
+def trace_requests(path: Path) -> list[tuple[float, tuple[int, int] | None]]:
+    """(epoch arrival, shape if the CSV records prompt_tokens / max_tokens) from a trace file."""
+    with path.open() as f:
+        header = f.readline()
+        if "prompt_tokens" in header and "max_tokens" in header and "timestamp" in header:
+            f.seek(0)
+            return [
+                (float(row["timestamp"]), (int(row["prompt_tokens"]), int(row["max_tokens"])))
+                for row in csv.DictReader(f)
+            ]
+    return [(t, None) for t in load_trace(path)]
+
+
+def build_schedule(args: argparse.Namespace, pool: ScenarioPool) -> list[tuple[float, str, dict]]:
+    """(intended offset, label, body) per request; trace shapes override the scenario's."""
+    rng = random.Random(args.seed)
+    if args.arrival == "trace":
+        if not args.trace:
+            raise SystemExit("--arrival trace needs --trace FILE")
+        rows = sorted((r for path in args.trace for r in trace_requests(path)), key=lambda r: r[0])
+        if not rows:
+            raise SystemExit("trace is empty")
+        t0 = rows[0][0]
+        prompts = PromptBuilder()
+        schedule = []
+        for i, (t, shape) in enumerate(rows):
+            if args.duration and (t - t0) / args.speedup >= args.duration:
+                break
+            label, body = (f"{shape[0]}/{shape[1]}", prompts.body(i, *shape)) if shape else pool.get(i)
+            schedule.append(((t - t0) / args.speedup, label, body))
+        return schedule
+    duration = args.duration or 60.0
+    if args.arrival == "constant":
+        offsets = constant_arrivals(args.rate, duration)
+    elif args.arrival == "poisson":
+        offsets = poisson_arrivals(args.rate, duration, rng)
+    else:
+        offsets = onoff_arrivals(args.rate, duration, args.on_sec, args.off_sec, args.off_rate, rng)
+    return [(t, *pool.get(i)) for i, t in enumerate(offsets)]
+
+
+# --- Runner ---
+
+
+async def _send(
+    client: httpx.AsyncClient, body: dict, stream: bool, result: Result, clock
+) -> None:
+    """POST one completion and fill in result (times from clock())."""
+    result.sent = clock()
+    try:
+        async with client.stream("POST", "/v1/chat/completions", json=body) as r:
+            result.status = r.status_code
+            if r.status_code != 200:
+                await r.aread()
+                result.error = f"http_{r.status_code}"
+            elif stream:
+                # Count SSE events on raw bytes: decoding every line costs the generator
+                # enough CPU to lag its own schedule at high rates
+                carry, finished = b"", False
+                async for chunk in r.aiter_raw():
+                    data = carry + chunk
+                    cut = data.rfind(b"\n") + 1  # complete lines only; the rest waits for the next chunk
+                    complete, carry = data[:cut], data[cut:]
+                    events = complete.count(b"data: {")
+                    if events and result.first_token is None:
+                        result.first_token = clock()
+                    result.completion_tokens += events
+                    finished = finished or b"data: [DONE]" in complete
+                if not finished:
+                    result.error = "truncated"
+            else:
+                data = json.loads(await r.aread())
+                result.completion_tokens = int((data.get("usage") or {}).get("completion_tokens", 0))
+    except httpx.TimeoutException:
+        result.error = "timeout"
+    except (httpx.HTTPError, ValueError) as e:
+        result.error = type(e).__name__
+    result.done = clock()
+
+
+async def run(args: argparse.Namespace, schedule: list[tuple[float, str, dict]]) -> list[Result]:
+    loop = asyncio.get_running_loop()
+    start = loop.time() + START_DELAY_SEC
+
+    def clock() -> float:
+        return loop.time() - start
+
+    headers = dict(h.split(":", 1) for h in args.header)
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    results: list[Result] = []
+    tasks = set()
+    async with httpx.AsyncClient(base_url=args.url, headers=headers, limits=limits, timeout=args.timeout) as client:
+        for offset, label, body in schedule:
+            delay = offset - clock()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            result = Result(label, offset)
+            results.append(result)
+            if args.stream:
+                body = {**body, "stream": True}  # pool bodies are shared: never modify them
+            task = asyncio.create_task(_send(client, body, args.stream, result, clock))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+    return results
+
+
+# --- Reports ---
+
+
+def _percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(p * len(sorted_values)) - 1))]
+
+
+def timeseries(results: list[Result]) -> list[dict]:
+    """Per-second rows (by completion time for latency / errors, by intended time for scheduled)."""
+    seconds = int(max((r.done for r in results), default=0.0)) + 1
+    rows = [{"second": s, "scheduled": 0, "completed": 0, "errors": 0, "in_flight": 0,
+             "completion_tokens": 0, "_lat": []} for s in range(seconds)]
+    for r in results:
+        rows[min(seconds - 1, max(0, int(r.intended)))]["scheduled"] += 1
+        row = rows[min(seconds - 1, max(0, int(r.done)))]
+        if r.ok:
+            row["completed"] += 1
+            row["completion_tokens"] += r.completion_tokens
+            row["_lat"].append(r.latency * 1000)
+        else:
+            row["errors"] += 1
+        # In flight at the end of each second between intended send and completion
+        for s in range(max(0, int(r.intended)), min(seconds, int(r.done))):
+            rows[s]["in_flight"] += 1
+    for row in rows:
+        lat = sorted(row.pop("_lat"))
+        for p in (50, 95, 99):
+            row[f"p{p}_ms"] = round(_percentile(lat, p / 100), 1)
+        row["max_ms"] = round(lat[-1], 1) if lat else 0.0
+    return rows
+
+
+def summarize(args: argparse.Namespace, results: list[Result]) -> tuple[dict, dict[str, HdrHistogram]]:
+    hists = {"latency": HdrHistogram(), "service": HdrHistogram()}
+    if args.stream:
+        hists["ttft"] = HdrHistogram()
+    per_label: dict[str, HdrHistogram] = {}
+    errors: dict[str, int] = {}
+    lag = HdrHistogram()
+    for r in results:
+        lag.record(max(0.0, r.sent - r.intended))
+        if not r.ok:
+            errors[r.error] = errors.get(r.error, 0) + 1
+            continue
+        hists["latency"].record(r.latency)
+        hists["service"].record(r.done - r.sent)
+        if args.stream and r.first_token is not None:
+            hists["ttft"].record(r.first_token - r.intended)
+        per_label.setdefault(r.label, HdrHistogram()).record(r.latency)
+    span = max((r.intended for r in results), default=0.0)
+    end = max((r.done for r in results), default=0.0) or 1.0
+    ok = sum(1 for r in results if r.ok)
+    summary = {
+        "requests": len(results),
+        "ok": ok,
+        "errors": errors,
+        "error_rate": round(1 - ok / len(results), 4) if results else 0.0,
+        "offered_rps": round((len(results) - 1) / span, 2) if span > 0 else 0.0,
+        "achieved_rps": round(ok / end, 2),
+        "completion_tokens_per_sec": round(sum(r.completion_tokens for r in results if r.ok) / end, 1),
+        **{name: h.summary() for name, h in hists.items()},
+        "per_label": {name: h.summary() for name, h in sorted(per_label.items())},
+        "send_lag": lag.summary(),
+    }
+    return summary, hists
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Open-loop load generator (latency from intended send time)")
+    parser.add_argument("--url", default="http://localhost:8000", help="Gateway or vLLM base URL")
+    parser.add_argument("--arrival", choices=("constant", "poisson", "onoff", "trace"), default="poisson")
+    parser.add_argument("--rate", type=float, default=10.0, help="Requests/s (onoff: during ON)")
+    parser.add_argument("--duration", type=float, default=0.0, help="Seconds (default 60; trace: whole trace)")
+    parser.add_argument("--on-sec", type=float, default=10.0)
+    parser.add_argument("--off-sec", type=float, default=20.0)
+    parser.add_argument("--off-rate", type=float, default=0.0, help="Requests/s during OFF")
+    parser.add_argument("--trace", type=Path, action="append", default=[])
+    parser.add_argument("--speedup", type=float, default=1.0, help="Trace time compression (2 = twice as fast)")
+    parser.add_argument("--scenario", default=DEFAULT_SCENARIO, help="Scenario spec (scenarios/registry.py)")
+    parser.add_argument("--mix", default="", help="prompt:max_tokens:weight,... (short for --scenario mix?shapes=)")
+    parser.add_argument("--pool", type=int, default=DEFAULT_POOL_SIZE, help="Requests generated before cycling")
+    parser.add_argument("--stream", action="store_true", help="SSE requests; adds TTFT")
+    parser.add_argument("--header", action="append", default=[], help="Extra header 'Name: value' (repeatable)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--max-connections", type=int, default=1024)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tag", default="")
+    parser.add_argument("--out-dir", type=Path, default=OUT_DIR)
+    args = parser.parse_args()
+    if args.rate <= 0 and args.arrival != "trace":
+        parser.error("--rate must be positive")
+
+    if args.mix:
+        args.scenario = f"mix?shapes={args.mix}"
+    try:
+        pool = load_pool(args.scenario, args.seed, args.pool)
+    except ValueError as e:
+        parser.error(str(e))
+    schedule = build_schedule(args, pool)
+    if not schedule:
+        print("Empty schedule", file=sys.stderr)
+        return 1
+    print(f"Open loop: {len(schedule)} requests over {schedule[-1][0]:.0f}s ({args.arrival}, {args.scenario})"
+          f" -> {args.url}")
+    results = asyncio.run(run(args, schedule))
+
+    summary, hists = summarize(args, results)
+    summary["scenario"] = args.scenario
+    summary["config"] = {k: [str(p) for p in v] if k == "trace" else str(v) if isinstance(v, Path) else v
+                         for k, v in vars(args).items()}
+    lat = summary["latency"]
+    print(f"OK {summary['ok']}/{summary['requests']}  errors {summary['errors'] or 0}  "
+          f"offered {summary['offered_rps']}/s  achieved {summary['achieved_rps']}/s")
+    print(f"Latency from intended send: p50 {lat['p50_ms']} ms  p95 {lat['p95_ms']} ms  "
+          f"p99 {lat['p99_ms']} ms  max {lat['max_ms']} ms")
+    svc = summary["service"]
+    print(f"Service time (closed-loop view): p50 {svc['p50_ms']} ms  p99 {svc['p99_ms']} ms")
+    if "ttft" in summary:
+        print(f"TTFT: p50 {summary['ttft']['p50_ms']} ms  p99 {summary['ttft']['p99_ms']} ms")
+    if summary["send_lag"]["p99_ms"] > 50:
+        print(f"WARNING: send lag p99 {summary['send_lag']['p99_ms']} ms, the generator is falling behind")
+
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    tag = f"{args.tag}_" if args.tag else ""
+    prefix = args.out_dir / f"openloop_{tag}{scenario_tag(args.scenario)}_{time.strftime('%Y-%m-%d_%H%M%S')}"
+    Path(f"{prefix}_summary.json").write_text(json.dumps(summary, indent=2))
+    rows = timeseries(results)
+    with open(f"{prefix}_timeseries.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    for name, h in hists.items():
+        Path(f"{prefix}_{name}.hgrm").write_text(h.hgrm())
+    print(f"Saved: {prefix}_{{summary.json,timeseries.csv,{','.join(f'{n}.hgrm' for n in hists)}}}")
+    return 0 if summary["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
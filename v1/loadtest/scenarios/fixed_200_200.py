@@ -6,11 +6,15 @@ Fixed 200-in / 200-out scenario for throughput benchmarking (Milestone 2).
 """
 
 import os
+from functools import lru_cache
 from pathlib import Path
 
 
 def get_project_root() -> Path:
-    """Project root: assume we run from repo root or loadtest/."""
+    """Project root: two levels above this file, else the cwd (repo root or loadtest/)."""
+    root = Path(__file__).resolve().parents[2]
+    if (root / "configs" / "prompts").exists():
+        return root
     cwd = Path.cwd()
     if (cwd / "configs" / "prompts").exists():
         return cwd
@@ -19,8 +23,9 @@ def get_project_root() -> Path:
     return cwd
 
 
+@lru_cache(maxsize=1)
 def load_prompt_200() -> str:
-    """Load prompt from configs/prompts/prompt_200.txt. Fallback if file missing."""
+    """Load prompt from configs/prompts/prompt_200.txt once (all users share it). Fallback if file missing."""
     root = get_project_root()
     path = root / "configs" / "prompts" / "prompt_200.txt"
     if path.exists():
@@ -0,0 +1,56 @@
+"""
+Prompt / output length mix for load tests beyond the fixed 200/200 scenario.
+
+- Mix: "prompt_tokens:max_tokens:weight,..." e.g. "200:200:0.6,1000:100:0.3,50:500:0.1"
+  (chat, summarisation-like, generation-heavy). Weights need not sum to 1.
+- Prompts are built from configs/prompts/prompt_200.txt, repeated / cut to
+  prompt_tokens x CHARS_PER_TOKEN characters: the same chars / 4 estimate the
+  gateway uses (scripts/tokens.py), so real tokenizer counts differ somewhat.
+- Used by the "mix" scenario of scenarios/registry.py (--mix of openloop.py).
+"""
+
+from dataclasses import dataclass
+
+from scenarios.fixed_200_200 import load_prompt_200
+
+CHARS_PER_TOKEN = 4
+DEFAULT_MIX = "200:200:1"
+
+
+@dataclass(frozen=True)
+class Shape:
+    """One request shape of the mix."""
+
+    prompt_tokens: int
+    max_tokens: int
+    weight: float = 1.0
+
+    @property
+    def name(self) -> str:
+        return f"{self.prompt_tokens}/{self.max_tokens}"
+
+
+def parse_mix(spec: str) -> list[Shape]:
+    """ "200:200:0.7,1000:100:0.3" -> shapes; weight defaults to 1."""
+    shapes = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        fields = part.split(":")
+        if len(fields) not in (2, 3):
+            raise ValueError(f"bad length mix entry {part!r} (expected prompt:max_tokens[:weight])")
+        shape = Shape(int(fields[0]), int(fields[1]), float(fields[2]) if len(fields) == 3 else 1.0)
+        if shape.prompt_tokens <= 0 or shape.max_tokens <= 0 or shape.weight <= 0:
+            raise ValueError(f"bad length mix entry {part!r} (values must be positive)")
+        shapes.append(shape)
+    if not shapes:
+        raise ValueError("empty length mix")
+    return shapes
+
+
+def make_prompt(tokens: int, base: str | None = None) -> str:
+    """About `tokens` tokens of text (chars / CHARS_PER_TOKEN) from the 200/200 prompt."""
+    base = (base or load_prompt_200()).strip() + " "
+    chars = tokens * CHARS_PER_TOKEN
+    return (base * (chars // len(base) + 1))[:chars]
@@ -0,0 +1,194 @@
+"""
+Workload scenarios for the load harness (locustfile.py, openloop.py, scripts/tune_grid.py).
+
+A scenario spec is a name plus optional parameters, URL-query style:
+  fixed_200_200
+  lognormal?prompt_median=400&prompt_sigma=1.2
+  chat_summarize?chat_share=0.5
+  shared_prefix?families=4&prefix_tokens=800
+  mix?shapes=200:200:0.6,1000:100:0.3,50:500:0.1
+
+Scenarios (parameters and defaults in SCENARIOS below):
+  fixed_200_200   the Milestone 2 workload: prompt_200.txt, max_tokens=200
+  lognormal       heavy-tailed prompt and output lengths (lognormal around a
+                  median, clipped to [min_tokens, max_*])
+  chat_summarize  bimodal: short chat turns vs long documents summarised into
+                  short answers
+  shared_prefix   `families` long system prompts, each shared by many requests
+                  with short user suffixes (prefix caching, KV reuse)
+  mix             fixed shapes "prompt:max_tokens:weight,..." (length_mix.py)
+
+Requests are generated once per (spec, seed, pool size) into an immutable pool
+(load_pool, cached) that every user in the process walks from its own offset:
+no file I/O or prompt building per user, and the same seed gives the same
+requests on every run. Lengths are in estimated tokens (chars / 4, as
+scripts/tokens.py). max_model_len=N clips each request to fit; by default (0)
+nothing is clipped, so long tails reach the server's max_model_len handling.
+Each request carries a label (shape bucket or mode) that load tools report
+latency by.
+"""
+
+import random
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable
+from urllib.parse import parse_qsl
+
+from scenarios.fixed_200_200 import get_request_kwargs
+from scenarios.length_mix import make_prompt, parse_mix
+
+DEFAULT_SCENARIO = "fixed_200_200"
+DEFAULT_POOL_SIZE = 4096
+
+
+@dataclass(frozen=True)
+class ScenarioPool:
+    """Pre-generated requests of one scenario: (label, chat completion body), shared read-only."""
+
+    spec: str
+    seed: int
+    requests: tuple[tuple[str, dict], ...]
+
+    @property
+    def name(self) -> str:
+        return parse_spec(self.spec)[0]
+
+    def __len__(self) -> int:
+        return len(self.requests)
+
+    def get(self, i: int) -> tuple[str, dict]:
+        return self.requests[i % len(self.requests)]
+
+
+def _lognormal(rng: random.Random, median: float, sigma: float, low: int, high: int) -> int:
+    return max(low, min(high, round(rng.lognormvariate(0.0, sigma) * median)))
+
+
+def _bucket(tokens: int) -> int:
+    """Power-of-two bucket (upper bound) for labels: 64, 128, 256, ..."""
+    b = 64
+    while b < tokens:
+        b *= 2
+    return b
+
+
+def _fit(prompt: int, output: int, max_model_len: int, min_tokens: int) -> tuple[int, int]:
+    """Clip to max_model_len (0 = off): output first, then prompt."""
+    if max_model_len <= 0 or prompt + output <= max_model_len:
+        return prompt, output
+    output = max(min_tokens, min(output, max_model_len - prompt))
+    return max(min_tokens, max_model_len - output), output
+
+
+class PromptBuilder:
+    """Prompt text per length, built once per pool; numbered so the gateway cache does not answer."""
+
+    def __init__(self) -> None:
+        self._text: dict[int, str] = {}
+
+    def body(self, n: int, prompt_tokens: int, max_tokens: int, system: str = "") -> dict:
+        text = self._text.get(prompt_tokens)
+        if text is None:
+            text = self._text[prompt_tokens] = make_prompt(prompt_tokens)
+        text = f"#{n} {text}"[: len(text)]
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": text})
+        return {"model": "", "messages": messages, "max_tokens": max_tokens, "temperature": 0}
+
+
+def _fixed_200_200(rng: random.Random, size: int, p: dict) -> list[tuple[str, dict]]:
+    return [("200/200", get_request_kwargs())]
+
+
+def _lognormal_scenario(rng: random.Random, size: int, p: dict) -> list[tuple[str, dict]]:
+    prompts, out = PromptBuilder(), []
+    for n in range(size):
+        prompt = _lognormal(rng, p["prompt_median"], p["prompt_sigma"], p["min_tokens"], p["max_prompt"])
+        output = _lognormal(rng, p["output_median"], p["output_sigma"], p["min_tokens"], p["max_output"])
+        prompt, output = _fit(prompt, output, p["max_model_len"], p["min_tokens"])
+        out.append((f"p{_bucket(prompt)}/o{_bucket(output)}", prompts.body(n, prompt, output)))
+    return out
+
+
+def _chat_summarize(rng: random.Random, size: int, p: dict) -> list[tuple[str, dict]]:
+    prompts, out = PromptBuilder(), []
+    for n in range(size):
+        mode = "chat" if rng.random() < p["chat_share"] else "summarize"
+        prompt = _lognormal(rng, p[f"{mode}_prompt"], p["sigma"], p["min_tokens"], 8 * p[f"{mode}_prompt"])
+        output = _lognormal(rng, p[f"{mode}_output"], p["sigma"], p["min_tokens"], 8 * p[f"{mode}_output"])
+        prompt, output = _fit(prompt, output, p["max_model_len"], p["min_tokens"])
+        out.append((mode, prompts.body(n, prompt, output)))
+    return out
+
+
+def _shared_prefix(rng: random.Random, size: int, p: dict) -> list[tuple[str, dict]]:
+    families = max(1, int(p["families"]))
+    systems = [f"[family {k}] " + make_prompt(p["prefix_tokens"]) for k in range(families)]
+    prompts, out = PromptBuilder(), []
+    for n in range(size):
+        k = rng.randrange(families)
+        suffix = _lognormal(rng, p["suffix_median"], p["sigma"], p["min_tokens"], 8 * p["suffix_median"])
+        output = _lognormal(rng, p["output_median"], p["sigma"], p["min_tokens"], 8 * p["output_median"])
+        suffix, output = _fit(suffix, output, max(0, p["max_model_len"] - p["prefix_tokens"]), p["min_tokens"])
+        out.append((f"family{k}", prompts.body(n, suffix, output, system=systems[k])))
+    return out
+
+
+def _mix(rng: random.Random, size: int, p: dict) -> list[tuple[str, dict]]:
+    shapes = parse_mix(p["shapes"])
+    weights = [s.weight for s in shapes]
+    prompts = PromptBuilder()
+    return [
+        (s.name, prompts.body(n, s.prompt_tokens, s.max_tokens))
+        for n, s in enumerate(rng.choices(shapes, weights=weights, k=size))
+    ]
+
+
+# name -> (builder, default parameters); the defaults' types are how parameters are parsed
+SCENARIOS: dict[str, tuple[Callable[[random.Random, int, dict], list[tuple[str, dict]]], dict]] = {
+    "fixed_200_200": (_fixed_200_200, {}),
+    "lognormal": (_lognormal_scenario, {
+        "prompt_median": 200, "prompt_sigma": 1.0, "output_median": 150, "output_sigma": 0.8,
+        "min_tokens": 8, "max_prompt": 8192, "max_output": 2048, "max_model_len": 0,
+    }),
+    "chat_summarize": (_chat_summarize, {
+        "chat_share": 0.7, "chat_prompt": 120, "chat_output": 200, "summarize_prompt": 1500,
+        "summarize_output": 120, "sigma": 0.5, "min_tokens": 8, "max_model_len": 0,
+    }),
+    "shared_prefix": (_shared_prefix, {
+        "families": 8, "prefix_tokens": 400, "suffix_median": 50, "output_median": 100,
+        "sigma": 0.5, "min_tokens": 8, "max_model_len": 0,
+    }),
+    "mix": (_mix, {"shapes": "200:200:1"}),
+}
+
+
+def parse_spec(spec: str) -> tuple[str, dict]:
+    """ "lognormal?prompt_median=400" -> ("lognormal", defaults with prompt_median=400)."""
+    name, _, query = spec.strip().partition("?")
+    if name not in SCENARIOS:
+        raise ValueError(f"unknown scenario {name!r} (known: {', '.join(SCENARIOS)})")
+    params = dict(SCENARIOS[name][1])
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        if key not in params:
+            raise ValueError(f"scenario {name!r} has no parameter {key!r} (known: {', '.join(params) or 'none'})")
+        params[key] = type(params[key])(value)
+    return name, params
+
+
+def scenario_tag(spec: str) -> str:
+    """File-name friendly tag: the name, plus the parameters that differ from the defaults."""
+    name, params = parse_spec(spec)
+    defaults = SCENARIOS[name][1]
+    changed = [f"{k}{params[k]}" for k in params if params[k] != defaults[k]]
+    tag = "_".join([name, *changed])
+    return "".join(c if c.isalnum() or c in "_-." else "-" for c in tag)
+
+
+@lru_cache(maxsize=16)
+def load_pool(spec: str = DEFAULT_SCENARIO, seed: int = 0, size: int = DEFAULT_POOL_SIZE) -> ScenarioPool:
+    """Requests of spec, generated once per process (same seed -> same requests)."""
+    name, params = parse_spec(spec)
+    builder = SCENARIOS[name][0]
+    rng = random.Random(f"{name}:{seed}")
+    return ScenarioPool(spec, seed, tuple(builder(rng, max(1, size), params)))
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark: time-to-first-response (TTFR) through the gateway after the worker
+has gone idle, per tier the worker was in when the request arrived:
+
+  running  worker hot (control)
+  standby  worker asleep (STANDBY_AFTER_SEC elapsed) -> POST /wake_up
+  idle     worker stopped (IDLE_TIMEOUT_SEC elapsed) -> full process start
+
+Uses the stub worker (WORKER_BACKEND=mock), whose spawn / load / wake times are
+simulated with MOCK_SPAWN_SEC / MOCK_LOAD_SEC / MOCK_WAKE_SEC, so no GPU is
+needed. Pass the real numbers measured on your GPU to estimate the saving.
+
+Usage:
+  python scripts/bench_cold_start.py
+  python scripts/bench_cold_start.py --rounds 5 --spawn-sec 8 --load-sec 25 --wake-sec 1.5
+
+Saves experiments/runs/bench_cold_start_<timestamp>.json.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+OUT_DIR = REPO_ROOT / "experiments" / "runs"
+
+PAYLOAD = {"messages": [{"role": "user", "content": "hello"}], "max_tokens": 8}
+
+
+def _state(gateway: str) -> str:
+    return httpx.get(f"{gateway}/health", timeout=5.0).json().get("worker_state", "")
+
+
+def _wait_state(gateway: str, want: str, timeout: float) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if _state(gateway) == want:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    return False
+
+
+def _ttfr_ms(gateway: str) -> float:
+    t0 = time.perf_counter()
+    r = httpx.post(f"{gateway}/v1/chat/completions", json=PAYLOAD, timeout=600.0)
+    r.raise_for_status()
+    return (time.perf_counter() - t0) * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="TTFR after idle: running vs warm standby vs cold start")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--spawn-sec", type=float, default=2.0, help="Simulated process start (MOCK_SPAWN_SEC)")
+    parser.add_argument("--load-sec", type=float, default=5.0, help="Simulated model load (MOCK_LOAD_SEC)")
+    parser.add_argument("--wake-sec", type=float, default=0.5, help="Simulated /wake_up (MOCK_WAKE_SEC)")
+    parser.add_argument("--standby-after-sec", type=float, default=2.0)
+    parser.add_argument("--idle-timeout-sec", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=18001, help="Gateway port")
+    parser.add_argument("--worker-port", type=int, default=18000)
+    args = parser.parse_args()
+
+    gateway = f"http://127.0.0.1:{args.port}"
+    env = os.environ.copy()
+    env.update({
+        "ENABLE_SUPERVISOR": "1",
+        "WORKER_BACKEND": "mock",
+        "VLLM_URL": f"http://127.0.0.1:{args.worker_port}",
+        "VLLM_PORT": str(args.worker_port),
+        "MOCK_SPAWN_SEC": str(args.spawn_sec),
+        "MOCK_LOAD_SEC": str(args.load_sec),
+        "MOCK_WAKE_SEC": str(args.wake_sec),
+        "STANDBY_AFTER_SEC": str(args.standby_after_sec),
+        "IDLE_TIMEOUT_SEC": str(args.idle_timeout_sec),
+    })
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "scripts.gateway:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=REPO_ROOT,
+        env=env,
+    )
+    ttfr: dict[str, list[float]] = {"running": [], "standby": [], "idle": []}
+    try:
+        if not _wait_state(gateway, "idle", 15.0):
+            print("Gateway failed to start", file=sys.stderr)
+            return 1
+        slack = args.spawn_sec + args.load_sec + 30.0
+        for i in range(args.rounds):
+            # Cold: worker stopped
+            if not _wait_state(gateway, "idle", args.idle_timeout_sec + slack):
+                print("Worker never went idle", file=sys.stderr)
+                return 1
+            ttfr["idle"].append(_ttfr_ms(gateway))
+            ttfr["running"].append(_ttfr_ms(gateway))
+            # Warm standby: worker asleep
+            if not _wait_state(gateway, "standby", args.standby_after_sec + slack):
+                print("Worker never entered standby", file=sys.stderr)
+                return 1
+            ttfr["standby"].append(_ttfr_ms(gateway))
+            print(f"round {i + 1}: " + "  ".join(f"{k}={v[-1]:.0f}ms" for k, v in ttfr.items()))
+        metrics = httpx.get(f"{gateway}/metrics", timeout=5.0).text
+    finally:
+        proc.terminate()
+        proc.wait(timeout=60)
+
+    results = {
+        "config": vars(args),
+        "ttfr_ms": {
+            tier: {"median": round(statistics.median(v), 1), "max": round(max(v), 1), "samples": [round(x, 1) for x in v]}
+            for tier, v in ttfr.items()
+        },
+        "supervisor_metrics": [l for l in metrics.splitlines() if l.startswith(("gateway_worker_resume", "gateway_cold_start"))
+                               and ("_sum" in l or "_count" in l)],
+    }
+    for tier, r in results["ttfr_ms"].items():
+        print(f"{tier:>8}: median TTFR {r['median']:.0f} ms (max {r['max']:.0f} ms)")
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    out_file = OUT_DIR / f"bench_cold_start_{time.strftime('%Y-%m-%d_%H%M%S')}.json"
+    out_file.write_text(json.dumps(results, indent=2))
+    print(f"Saved: {out_file}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-request httpx.AsyncClient (old gateway behaviour) vs the shared
+pooled UpstreamClient, against a local mock vLLM server (no GPU needed).
+
+Usage:
+  python scripts/bench_upstream.py
+  python scripts/bench_upstream.py --requests 4000 --concurrency 128 --latency-ms 20
+
+Spawns `uvicorn scripts.mock_vllm:app` on --port, fires the fixed 200/200 payload
+with N concurrent senders in each mode, prints RPS and p50/p95, and saves
+experiments/runs/bench_upstream_<timestamp>.json.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+OUT_DIR = REPO_ROOT / "experiments" / "runs"
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.upstream import UpstreamClient, UpstreamConfig  # noqa: E402
+
+PAYLOAD = {
+    "model": "",
+    "messages": [{"role": "user", "content": "benchmark " * 200}],
+    "max_tokens": 200,
+    "temperature": 0,
+}
+
+
+def _percentile(sorted_vals: list[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    idx = min(len(sorted_vals) - 1, int(round(q * (len(sorted_vals) - 1))))
+    return sorted_vals[idx]
+
+
+async def _run(send, n_requests: int, concurrency: int) -> dict:
+    """Closed loop: `concurrency` senders share n_requests; returns RPS, p50/p95 (ms), errors."""
+    latencies: list[float] = []
+    errors = 0
+    remaining = n_requests
+
+    async def sender():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            t0 = time.perf_counter()
+            try:
+                status = await send()
+                if status != 200:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(sender() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": n_requests,
+        "errors": errors,
+        "elapsed_sec": round(elapsed, 3),
+        "rps": round(n_requests / elapsed, 2),
+        "p50_ms": round(_percentile(latencies, 0.50), 2),
+        "p95_ms": round(_percentile(latencies, 0.95), 2),
+    }
+
+
+async def bench(base_url: str, n_requests: int, concurrency: int) -> dict:
+    async def per_request():
+        async with httpx.AsyncClient() as client:
+            r = await client.post(f"{base_url}/v1/chat/completions", json=PAYLOAD, timeout=120.0)
+            return r.status_code
+
+    upstream = UpstreamClient(UpstreamConfig.from_env())
+    await upstream.start()
+
+    async def shared():
+        r = await upstream.request("POST", base_url, "/v1/chat/completions", json=PAYLOAD)
+        return r.status_code
+
+    try:
+        # Warm-up so neither mode pays mock-server import/JIT costs
+        await _run(shared, min(100, n_requests), min(10, concurrency))
+        results = {
+            "per_request_client": await _run(per_request, n_requests, concurrency),
+            "shared_pool": await _run(shared, n_requests, concurrency),
+        }
+    finally:
+        await upstream.aclose()
+    return results
+
+
+def _wait_ready(base_url: str, timeout: float = 15.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/v1/models", timeout=1.0).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Per-request client vs shared upstream pool")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mock vLLM delay per request")
+    parser.add_argument("--port", type=int, default=18000)
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = os.environ.copy()
+    env["MOCK_LATENCY_MS"] = str(args.latency_ms)
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "scripts.mock_vllm:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=REPO_ROOT,
+        env=env,
+    )
+    try:
+        if not _wait_ready(base_url):
+            print("Mock vLLM failed to start", file=sys.stderr)
+            return 1
+        results = asyncio.run(bench(base_url, args.requests, args.concurrency))
+    finally:
+        mock.terminate()
+        mock.wait(timeout=10)
+
+    old, new = results["per_request_client"], results["shared_pool"]
+    results["config"] = vars(args)
+    results["rps_change_pct"] = round((new["rps"] / old["rps"] - 1) * 100, 1) if old["rps"] else None
+    results["p95_change_pct"] = round((new["p95_ms"] / old["p95_ms"] - 1) * 100, 1) if old["p95_ms"] else None
+
+    for name, r in (("per-request client", old), ("shared pool", new)):
+        print(f"{name:>18}: RPS={r['rps']:.1f} p50={r['p50_ms']:.1f}ms p95={r['p95_ms']:.1f}ms errors={r['errors']}")
+    print(f"RPS change: {results['rps_change_pct']:+.1f}%  p95 change: {results['p95_change_pct']:+.1f}%")
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    out_file = OUT_DIR / f"bench_upstream_{time.strftime('%Y-%m-%d_%H%M%S')}.json"
+    out_file.write_text(json.dumps(results, indent=2))
+    print(f"Saved: {out_file}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Exact-match response cache for deterministic (temperature=0) chat completions.
+
+Identical request bodies with temperature=0 produce identical completions, so
+the gateway can answer repeats without touching the GPU. Keys are a SHA-256 of
+the canonicalized JSON body (sorted keys, no whitespace); values are the
+serialized upstream JSON, so a hit is returned without re-encoding.
+
+Eviction: LRU once max_entries or max_bytes is exceeded, plus a TTL per entry.
+
+Env:
+  RESPONSE_CACHE       1 = enable (default off)
+  CACHE_MAX_ENTRIES    Max cached responses (default 1024)
+  CACHE_MAX_BYTES      Max total size of cached bodies (default 67108864 = 64 MiB)
+  CACHE_TTL_SEC        Entry lifetime in seconds (default 300)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+
+def canonical_key(body: dict[str, Any]) -> str:
+    """Stable hash of a request body: key order and whitespace do not matter."""
+    raw = json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def is_deterministic(body: dict[str, Any]) -> bool:
+    """True for greedy, single-choice, non-streaming requests (safe to cache/share).
+
+    A missing temperature means the server default (sampled), so it is not cached.
+    """
+    temperature = body.get("temperature")
+    if not isinstance(temperature, (int, float)) or temperature != 0:
+        return False
+    if body.get("stream"):
+        return False
+    return body.get("n", 1) == 1
+
+
+@dataclass
+class CacheConfig:
+    """Response cache bounds."""
+
+    enabled: bool = False
+    max_entries: int = 1024
+    max_bytes: int = 64 * 1024 * 1024
+    ttl_sec: float = 300.0
+
+    @classmethod
+    def from_env(cls) -> CacheConfig:
+        return cls(
+            enabled=os.environ.get("RESPONSE_CACHE", "").lower() in ("1", "true", "yes"),
+            max_entries=int(os.environ.get("CACHE_MAX_ENTRIES", "1024")),
+            max_bytes=int(os.environ.get("CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            ttl_sec=float(os.environ.get("CACHE_TTL_SEC", "300")),
+        )
+
+
+class ResponseCache:
+    """LRU + TTL cache of serialized 200 responses, bounded by entry count and bytes."""
+
+    def __init__(self, config: CacheConfig) -> None:
+        self.config = config
+        self._entries: OrderedDict[str, tuple[bytes, float]] = OrderedDict()  # key -> (body, expires_at)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = {"lru": 0, "ttl": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        content, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.evictions["ttl"] += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return content
+
+    def put(self, key: str, data: Any) -> bytes:
+        """Serialize and store data; returns the serialized body."""
+        content = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode()
+        if len(content) > self.config.max_bytes:
+            return content
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (content, time.monotonic() + self.config.ttl_sec)
+        self._bytes += len(content)
+        while len(self._entries) > self.config.max_entries or self._bytes > self.config.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions["lru"] += 1
+        return content
+
+    def _remove(self, key: str) -> None:
+        content, _ = self._entries.pop(key)
+        self._bytes -= len(content)
+
+    def metrics_lines(self) -> list[str]:
+        return [
+            "# HELP gateway_cache_requests_total Response cache lookups by result",
+            "# TYPE gateway_cache_requests_total counter",
+            f'gateway_cache_requests_total{{result="hit"}} {self.hits}',
+            f'gateway_cache_requests_total{{result="miss"}} {self.misses}',
+            f'gateway_cache_requests_total{{result="bypass"}} {self.bypassed}',
+            "# HELP gateway_cache_evictions_total Response cache evictions by reason",
+            "# TYPE gateway_cache_evictions_total counter",
+            *(f'gateway_cache_evictions_total{{reason="{r}"}} {n}' for r, n in self.evictions.items()),
+            "# HELP gateway_cache_entries Responses currently cached",
+            "# TYPE gateway_cache_entries gauge",
+            f"gateway_cache_entries {len(self._entries)}",
+            "# HELP gateway_cache_bytes Total size of cached response bodies",
+            "# TYPE gateway_cache_bytes gauge",
+            f"gateway_cache_bytes {self._bytes}",
+        ]
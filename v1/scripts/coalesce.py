@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Single-flight request coalescing for identical in-flight requests.
+
+Bursts often carry several identical temperature=0 bodies within a few hundred
+milliseconds. The first one (leader) goes upstream; later copies attach to the
+leader's task and share its result instead of costing another GPU sequence.
+
+The upstream call runs in its own task. Each waiter awaits it through
+asyncio.shield, so one waiter disconnecting does not cancel the others; the
+upstream task is cancelled only when the last waiter goes away.
+
+Env:
+  COALESCE_REQUESTS  1 = enable (default off). The gateway coalesces only after
+                     admission and degradation, keyed by priority class, degradation
+                     tier, deadline budget and scripts/cache.canonical_key of the body.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Share one upstream call between concurrent callers with the same key."""
+
+    def __init__(self) -> None:
+        self._flights: dict[str, _Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.cancelled = 0
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._flights
+
+    @property
+    def ratio(self) -> float:
+        """Fraction of coalescable requests answered by another request's upstream call."""
+        total = self.leaders + self.followers
+        return self.followers / total if total else 0.0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Return fn()'s result, reusing an in-flight call for the same key if there is one."""
+        flight = self._flights.get(key)
+        if flight is None:
+            task = asyncio.create_task(fn())
+            flight = self._flights[key] = _Flight(task)
+            task.add_done_callback(lambda _t, k=key, f=flight: self._forget(k, f))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:
+                # Last interested caller left: stop the upstream work too
+                flight.task.cancel()
+                self._forget(key, flight)
+                self.cancelled += 1
+                logger.info("Single-flight: all waiters gone, cancelled upstream call")
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def metrics_lines(self) -> list[str]:
+        return [
+            "# HELP gateway_coalesce_requests_total Coalescable requests by role (leader went upstream)",
+            "# TYPE gateway_coalesce_requests_total counter",
+            f'gateway_coalesce_requests_total{{role="leader"}} {self.leaders}',
+            f'gateway_coalesce_requests_total{{role="follower"}} {self.followers}',
+            "# HELP gateway_coalesce_ratio Followers / (leaders + followers)",
+            "# TYPE gateway_coalesce_ratio gauge",
+            f"gateway_coalesce_ratio {self.ratio:.4f}",
+            "# HELP gateway_coalesce_cancelled_total Upstream calls cancelled after every waiter left",
+            "# TYPE gateway_coalesce_cancelled_total counter",
+            f"gateway_coalesce_cancelled_total {self.cancelled}",
+            "# HELP gateway_coalesce_in_flight Distinct upstream calls currently shared",
+            "# TYPE gateway_coalesce_in_flight gauge",
+            f"gateway_coalesce_in_flight {len(self._flights)}",
+        ]
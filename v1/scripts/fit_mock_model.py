@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Fit the mock worker's performance model (scripts/mock_vllm.py, MOCK_ENGINE=batching)
+to real load-test runs, so offline benchmarks see GPU-like latency.
+
+Usage:
+  python scripts/fit_mock_model.py
+  python scripts/fit_mock_model.py --csv 'experiments/runs/locust_2026-02-05_08*_stats_history.csv'
+  python scripts/fit_mock_model.py --output-tokens 200 --prompt-tokens 200 --out configs/mock_perf.json
+
+Input: Locust *_stats_history.csv (one row per second: users, RPS, p50). The runs
+are closed-loop (no wait time), so requests in flight N = RPS x p50 (Little's law).
+
+Model (what the mock's engine loop does, summed over one request's lifetime):
+  a request of P prompt / O output tokens takes O engine steps of
+  step_ms + seq_ms x N, plus the prefill of its own prompt and of the ~N prompts
+  admitted meanwhile (each stalls one shared step):
+    p50(N) = O x (step_ms + seq_ms x N) + prefill_ms_per_token x P x (N + 1)
+  which is linear in N. Each run is fitted by least squares; the model written is
+  the median over runs (runs on other profiles / GPUs pull a mean around).
+  Prefill cost cannot be separated from step cost with a fixed 200/200 workload,
+  so it is taken from --prefill-ms-per-token.
+
+Rows with failures, or p50 under --min-latency-ms (cache hits, 429s), are skipped,
+as are runs with fewer than 5 usable rows.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import glob
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_CSV = "experiments/runs/*_stats_history.csv"
+DEFAULT_OUT = REPO_ROOT / "configs" / "mock_perf.json"
+MIN_POINTS = 5
+
+
+def load_points(path: Path, min_latency_ms: float) -> list[tuple[float, float]]:
+    """(requests in flight, p50 ms) per usable second of a run."""
+    points = []
+    with open(path) as f:
+        for row in csv.DictReader(f):
+            try:
+                rps = float(row["Requests/s"])
+                p50 = float(row["50%"])
+                failures = float(row["Failures/s"])
+            except (KeyError, ValueError):  # "N/A" before the first response
+                continue
+            if rps <= 0 or failures > 0 or p50 < min_latency_ms:
+                continue
+            points.append((rps * p50 / 1000.0, p50))
+    return points
+
+
+def linear_fit(points: list[tuple[float, float]]) -> tuple[float, float, float]:
+    """Least squares y = a + b x -> (a, b, r^2)."""
+    n = len(points)
+    mx = sum(x for x, _ in points) / n
+    my = sum(y for _, y in points) / n
+    sxx = sum((x - mx) ** 2 for x, _ in points)
+    syy = sum((y - my) ** 2 for _, y in points)
+    sxy = sum((x - mx) * (y - my) for x, y in points)
+    b = sxy / sxx if sxx else 0.0
+    r2 = sxy * sxy / (sxx * syy) if sxx and syy else 0.0
+    return my - b * mx, b, r2
+
+
+def fit_run(points: list[tuple[float, float]], args: argparse.Namespace) -> dict:
+    a, b, r2 = linear_fit(points)
+    prefill = args.prefill_ms_per_token * args.prompt_tokens
+    return {
+        "points": len(points),
+        "in_flight_max": round(max(x for x, _ in points), 1),
+        "p50_at_1_ms": round(a + b, 1),
+        "step_ms": max(0.0, (a - prefill) / args.output_tokens),
+        "seq_ms": max(0.0, (b - prefill) / args.output_tokens),
+        "r2": round(r2, 3),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Fit the mock vLLM performance model to load-test CSVs")
+    parser.add_argument("--csv", default=DEFAULT_CSV, help=f"Glob of Locust stats_history CSVs (default {DEFAULT_CSV})")
+    parser.add_argument("--output-tokens", type=int, default=200, help="Output tokens per request in the runs")
+    parser.add_argument("--prompt-tokens", type=int, default=200, help="Prompt tokens per request in the runs")
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0.01)
+    parser.add_argument("--min-latency-ms", type=float, default=20.0)
+    parser.add_argument("--out", type=Path, default=DEFAULT_OUT)
+    args = parser.parse_args()
+
+    pattern = args.csv if Path(args.csv).is_absolute() else str(REPO_ROOT / args.csv)
+    runs = {}
+    for path in sorted(glob.glob(pattern)):
+        points = load_points(Path(path), args.min_latency_ms)
+        if len(points) < MIN_POINTS:
+            print(f"skip {Path(path).name}: {len(points)} usable rows")
+            continue
+        runs[Path(path).name] = fit_run(points, args)
+    if not runs:
+        print(f"No usable runs in {pattern}", file=sys.stderr)
+        return 1
+
+    print(f"{'run':<52} {'rows':>5} {'N max':>6} {'step ms':>8} {'seq ms':>7} {'r2':>6}")
+    for name, r in runs.items():
+        print(f"{name:<52} {r['points']:>5} {r['in_flight_max']:>6} {r['step_ms']:>8.3f} {r['seq_ms']:>7.4f} {r['r2']:>6}")
+
+    model = {
+        "step_ms": round(statistics.median(r["step_ms"] for r in runs.values()), 4),
+        "seq_ms": round(statistics.median(r["seq_ms"] for r in runs.values()), 4),
+        "prefill_ms_per_token": args.prefill_ms_per_token,
+    }
+    for n in (1, 8, 20, 64):
+        p50 = args.output_tokens * (model["step_ms"] + model["seq_ms"] * n)
+        p50 += args.prefill_ms_per_token * args.prompt_tokens * (n + 1)
+        print(f"model p50 at {n:>2} in flight: {p50:7.1f} ms ({n / p50 * 1000:6.1f} req/s)")
+
+    out = {
+        **model,
+        "fitted_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "workload": {"prompt_tokens": args.prompt_tokens, "output_tokens": args.output_tokens},
+        "runs": {name: {k: round(v, 4) if isinstance(v, float) else v for k, v in r.items()} for name, r in runs.items()},
+    }
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps(out, indent=2) + "\n")
+    print(f"step_ms={model['step_ms']} seq_ms={model['seq_ms']} prefill_ms_per_token={model['prefill_ms_per_token']}")
+    print(f"Saved: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Traffic forecasting for predictive scale-up (used by scripts/supervisor.py and
+the offline replay in scripts/replay_scaling.py).
+
+- ArrivalRing: per-bucket request counts for the last `window_sec` (ring buffer)
+- DemandForecaster: two rate estimates, the larger wins
+    * EWMA: exponentially decaying arrival rate (time constant ewma_sec)
+    * seasonal: per time-of-day slot (slot_sec) rate, EWMA across days
+- PredictivePolicy:
+    * should_prewarm: seasonal expected arrivals in the next lead_sec >= threshold
+      (lead_sec ~ cold-start time, so the worker is ready when the burst lands);
+      the EWMA only describes traffic that already arrived, so it does not hold
+      the worker on its own
+    * idle_timeout: stretched towards idle_max_sec when another request is
+      likely within the base timeout, shrunk towards idle_min_sec when not
+
+All methods take `now` as epoch seconds so recorded traces can be replayed.
+
+Env:
+  PREDICTIVE_SCALING        1 = enable (default off)
+  FORECAST_SLOT_SEC         Seasonal slot width (default 900 = 15 min)
+  FORECAST_EWMA_SEC         EWMA time constant (default 300)
+  FORECAST_SEASONAL_ALPHA   Weight of the newest day in a slot's rate (default 0.3)
+  PREWARM_LEAD_SEC          Look-ahead for prewarm, ~ cold start time (default 120)
+  PREWARM_THRESHOLD         Expected arrivals in the lead window that trigger prewarm (default 0.5)
+  PREDICTIVE_IDLE_MIN_SEC   Shortest idle timeout when no traffic is expected (default 60)
+  PREDICTIVE_IDLE_MAX_SEC   Longest idle timeout when traffic is expected (default 900)
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import time
+from dataclasses import dataclass
+
+DAY_SEC = 86400
+
+
+class ArrivalRing:
+    """Request counts per bucket over a sliding window (fixed-size ring buffer)."""
+
+    def __init__(self, bucket_sec: float = 60.0, window_sec: float = DAY_SEC) -> None:
+        self.bucket_sec = bucket_sec
+        self._counts = [0] * max(1, int(window_sec // bucket_sec))
+        self._head: int | None = None  # absolute bucket number of the newest slot
+
+    def _advance(self, bucket: int) -> None:
+        if self._head is None:
+            self._head = bucket
+            return
+        if bucket <= self._head:
+            return
+        # Zero buckets skipped since the last arrival (at most one full lap)
+        for b in range(max(self._head + 1, bucket - len(self._counts) + 1), bucket + 1):
+            self._counts[b % len(self._counts)] = 0
+        self._head = bucket
+
+    def add(self, now: float, n: int = 1) -> None:
+        bucket = int(now // self.bucket_sec)
+        self._advance(bucket)
+        if self._head - bucket < len(self._counts):
+            self._counts[bucket % len(self._counts)] += n
+
+    def count_between(self, start: float, end: float) -> int:
+        """Arrivals in whole buckets covering [start, end) that are still in the window."""
+        if self._head is None:
+            return 0
+        first = int(start // self.bucket_sec)
+        last = int(math.ceil(end / self.bucket_sec)) - 1
+        first = max(first, self._head - len(self._counts) + 1)
+        last = min(last, self._head)
+        return sum(self._counts[b % len(self._counts)] for b in range(first, last + 1))
+
+    def rate(self, now: float, window_sec: float) -> float:
+        """Mean arrivals/s over the last window_sec."""
+        return self.count_between(now - window_sec, now) / window_sec if window_sec > 0 else 0.0
+
+
+@dataclass
+class ForecastConfig:
+    """Forecaster and predictive-policy knobs."""
+
+    enabled: bool = False
+    slot_sec: float = 900.0
+    ewma_sec: float = 300.0
+    seasonal_alpha: float = 0.3
+    lead_sec: float = 120.0
+    prewarm_threshold: float = 0.5
+    idle_min_sec: float = 60.0
+    idle_max_sec: float = 900.0
+
+    @classmethod
+    def from_env(cls) -> ForecastConfig:
+        return cls(
+            enabled=os.environ.get("PREDICTIVE_SCALING", "").lower() in ("1", "true", "yes"),
+            slot_sec=float(os.environ.get("FORECAST_SLOT_SEC", "900")),
+            ewma_sec=float(os.environ.get("FORECAST_EWMA_SEC", "300")),
+            seasonal_alpha=float(os.environ.get("FORECAST_SEASONAL_ALPHA", "0.3")),
+            lead_sec=float(os.environ.get("PREWARM_LEAD_SEC", "120")),
+            prewarm_threshold=float(os.environ.get("PREWARM_THRESHOLD", "0.5")),
+            idle_min_sec=float(os.environ.get("PREDICTIVE_IDLE_MIN_SEC", "60")),
+            idle_max_sec=float(os.environ.get("PREDICTIVE_IDLE_MAX_SEC", "900")),
+        )
+
+
+class DemandForecaster:
+    """EWMA + time-of-day seasonal arrival-rate forecast."""
+
+    def __init__(self, config: ForecastConfig) -> None:
+        self.config = config
+        self.ring = ArrivalRing(bucket_sec=min(60.0, config.slot_sec), window_sec=DAY_SEC)
+        self._n_slots = max(1, int(DAY_SEC // config.slot_sec))
+        self.seasonal: list[float | None] = [None] * self._n_slots  # arrivals/s per slot, None = never seen
+        self._ewma_rate = 0.0
+        self._ewma_at: float | None = None
+        self._slot_start: float | None = None  # epoch start of the slot being accumulated
+
+    def _slot_of(self, now: float) -> int:
+        tm = time.localtime(now)
+        return int((tm.tm_hour * 3600 + tm.tm_min * 60 + tm.tm_sec) // self.config.slot_sec) % self._n_slots
+
+    def _roll(self, now: float) -> None:
+        """Fold every slot that ended before `now` into the seasonal table."""
+        slot_sec = self.config.slot_sec
+        if self._slot_start is None:
+            self._slot_start = now - (now % slot_sec)
+            return
+        rolled = 0
+        while self._slot_start + slot_sec <= now and rolled < self._n_slots:
+            start = self._slot_start
+            observed = self.ring.count_between(start, start + slot_sec) / slot_sec
+            idx = self._slot_of(start)
+            prev = self.seasonal[idx]
+            a = self.config.seasonal_alpha
+            self.seasonal[idx] = observed if prev is None else (1 - a) * prev + a * observed
+            self._slot_start += slot_sec
+            rolled += 1
+        if self._slot_start + slot_sec <= now:  # idle for more than a day: jump ahead
+            self._slot_start = now - (now % slot_sec)
+
+    def record(self, now: float) -> None:
+        """One request arrived at `now`."""
+        self._roll(now)
+        self.ring.add(now)
+        self._ewma_rate = self.ewma_rate(now) + 1.0 / self.config.ewma_sec
+        self._ewma_at = now
+
+    def ewma_rate(self, now: float) -> float:
+        if self._ewma_at is None:
+            return 0.0
+        return self._ewma_rate * math.exp(-max(0.0, now - self._ewma_at) / self.config.ewma_sec)
+
+    def seasonal_rate(self, now: float, horizon_sec: float) -> float:
+        """Highest learned slot rate over [now, now + horizon]."""
+        self._roll(now)
+        best = 0.0
+        t = now
+        while True:
+            rate = self.seasonal[self._slot_of(t)]
+            if rate is not None and rate > best:
+                best = rate
+            if t >= now + horizon_sec:
+                break
+            t = min(now + horizon_sec, t + self.config.slot_sec)
+        return best
+
+    def expected_arrivals(self, now: float, horizon_sec: float) -> float:
+        rate = max(self.ewma_rate(now), self.seasonal_rate(now, horizon_sec))
+        return rate * horizon_sec
+
+
+class PredictivePolicy:
+    """Scale decisions derived from DemandForecaster."""
+
+    def __init__(self, config: ForecastConfig) -> None:
+        self.config = config
+        self.forecaster = DemandForecaster(config)
+        self.prewarms = 0
+
+    def record(self, now: float) -> None:
+        self.forecaster.record(now)
+
+    def should_prewarm(self, now: float) -> bool:
+        """True if a request is expected within the lead window (start the worker now)."""
+        lead = self.config.lead_sec
+        return self.forecaster.seasonal_rate(now, lead) * lead >= self.config.prewarm_threshold
+
+    def idle_timeout(self, now: float, base_sec: float) -> float:
+        """
+        Scale the idle timeout by P(another request within base_sec), Poisson:
+        p=0 -> idle_min_sec, p=1 -> idle_max_sec.
+        """
+        expected = self.forecaster.expected_arrivals(now, base_sec)
+        p = 1.0 - math.exp(-expected)
+        lo, hi = self.config.idle_min_sec, max(self.config.idle_min_sec, self.config.idle_max_sec)
+        return lo + (hi - lo) * p
+
+    def metrics_lines(self, now: float, base_sec: float) -> list[str]:
+        return [
+            "# HELP gateway_forecast_rate Forecast arrival rate (req/s) by estimator",
+            "# TYPE gateway_forecast_rate gauge",
+            f'gateway_forecast_rate{{model="ewma"}} {self.forecaster.ewma_rate(now):.6f}',
+            f'gateway_forecast_rate{{model="seasonal"}} {self.forecaster.seasonal_rate(now, self.config.lead_sec):.6f}',
+            "# HELP gateway_predictive_idle_timeout_seconds Idle timeout currently derived from the forecast",
+            "# TYPE gateway_predictive_idle_timeout_seconds gauge",
+            f"gateway_predictive_idle_timeout_seconds {self.idle_timeout(now, base_sec):.1f}",
+            "# HELP gateway_predictive_prewarms_total Worker starts triggered by the forecast (no request waiting)",
+            "# TYPE gateway_predictive_prewarms_total counter",
+            f"gateway_predictive_prewarms_total {self.prewarms}",
+        ]
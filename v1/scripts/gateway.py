@@ -10,27 +10,102 @@ Usage:
 
 Env:
   BATCH_WINDOW_MS   Delay before forwarding (0, 20, 50)
+  BATCH_MODE        fixed (window above) | dynamic (size/wait/deadline, see scripts/scheduler.py)
   VLLM_URL          vLLM worker URL (default http://localhost:8000)
+  VLLM_URLS         Comma-separated worker URLs to load-balance over (ROUTING_POLICY=
+                    least_outstanding|p2c|prefix_hash, EJECT_*, PREFIX_HASH_*; see
+                    scripts/upstream.py). Supervisor manages VLLM_URL only.
+  WORKER_POOL_MAX   >0 = run up to N local worker processes on consecutive ports and
+                    autoscale them on queue depth (WORKER_POOL_*, SCALE_*; see
+                    scripts/worker_pool.py); replaces VLLM_URL(S) and ENABLE_SUPERVISOR
   GATEWAY_PORT      Gateway port (default 8001)
   ENABLE_SUPERVISOR 1 = scale-to-zero (start worker on demand, stop after idle)
   IDLE_TIMEOUT_SEC  Idle seconds before stopping worker (default 180)
-  Q_MAX             Max queue depth before 429 (default 128)
+  STANDBY_AFTER_SEC Idle seconds before putting the worker to sleep (warm standby,
+                    vLLM --enable-sleep-mode; default 0 = off), SLEEP_LEVEL 1|2
+  MIN_WARM_WINDOWS  HH:MM-HH:MM[=running|standby],... keep the worker warm (local time)
+  PREDICTIVE_SCALING 1 = start the worker ahead of forecast traffic and scale the idle
+                    timeout with it (FORECAST_*, PREWARM_*, PREDICTIVE_IDLE_*; see scripts/forecast.py)
+  WORKER_BACKEND    vllm | mock (stub worker for scale-to-zero tests, see worker_process.py);
+                    worker output is kept in a ring buffer (WORKER_LOG_LINES), GET /admin/worker/logs
+  WORKER_PROFILE    configs/model_profiles/<name>.yaml for the supervised worker (default: VLLM_* env);
+                    POST /admin/profile?name=... swaps it blue/green without downtime
+                    (SWAP_*; see scripts/hotswap.py)
+  AUTO_PROFILE      1 = shift the worker along PROFILE_LADDER (aggressive,throughput,safe) on
+                    sustained overload / headroom (DOWNSHIFT_*, UPSHIFT_*; see
+                    scripts/profile_controller.py)
+  DRAIN_TIMEOUT_SEC Max seconds a managed worker gets to finish in-flight requests before
+                    SIGTERM (default 120)
+  Q_MAX             Max queue depth before 429 (default 128); initial limit when adaptive
+  ADMISSION_MODE    static | aimd | gradient (SLO_P95_MS, ADMISSION_*; see scripts/policies.py)
+  UPSTREAM_*        Shared connection pool to vLLM (see scripts/upstream.py)
+  RESPONSE_CACHE    1 = cache temperature=0 responses (CACHE_*, see scripts/cache.py)
+  COALESCE_REQUESTS 1 = share one upstream call between identical in-flight
+                    temperature=0 requests of the same class, degradation tier and deadline
+                    budget; every copy still passes admission (see scripts/coalesce.py)
+  PRIORITY_CLASSES  name:weight:admit_share:degrade_share,... highest first
+                    (default interactive:4:1.0:1.0,batch:1:0.5:0.5)
+  PRIORITY_API_KEYS api_key:class,... (class when no X-Priority header is sent)
+  RATE_LIMIT_RPS / RATE_LIMIT_TPS  Per-API-key (else per-IP) token buckets for requests/s and
+                    tokens/s; RATE_LIMIT_KEYS per-key overrides, RATE_LIMIT_BACKEND=memory|redis
+                    (shared across replicas; see scripts/ratelimit.py)
+  TOKEN_ADMISSION   1 = also admit against a token budget derived from the worker profile;
+                    prompts that clearly do not fit max_model_len are rejected (400) or
+                    truncated (MAX_MODEL_LEN_POLICY, MAX_MODEL_LEN_MARGIN, TOKEN_*; see scripts/tokens.py)
+  TRACING           Per-request phase traces, head (TRACE_SAMPLE_RATE) + tail (TRACE_SLOW_MS, 5xx)
+                    sampled; GET /admin/traces, TRACE_OTLP_FILE (see scripts/tracing.py)
+  DEGRADE_*         Trim max_tokens by estimated queue wait, per class; the applied tier is
+                    returned in X-Degradation-Tier (see scripts/policies.py)
+  PRIORITY_DEFAULT  Class for unlabelled requests (default: first class)
+  DEFAULT_DEADLINE_MS  Deadline for requests without an X-Deadline-Ms header (default 0 = none)
+
+Deadlines: X-Deadline-Ms (client time budget in ms) is carried through the batch
+queue. Requests that expire while queued are answered 504 without reaching vLLM,
+and the upstream timeout is capped at the remaining budget. If the client
+disconnects, the queued request or the upstream call is cancelled.
+
+Requests with "stream": true bypass the batching window and are relayed as
+text/event-stream chunk by chunk (no buffering of the full completion).
 """
 
 from __future__ import annotations
 
 import asyncio
+import json
 import logging
 import os
 import time
-from collections import deque
 from contextlib import asynccontextmanager
-from dataclasses import dataclass
-from typing import Any
+from typing import Callable
 
 import httpx
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+
+from scripts import tracing
+from scripts.cache import CacheConfig, ResponseCache, canonical_key, is_deterministic
+from scripts.coalesce import SingleFlight
+from scripts.hotswap import ProfileSwapper, SwapConfig
+from scripts.profile_controller import ControllerConfig, ProfileController
+from scripts.ratelimit import RateLimitConfig, RateLimiter
+from scripts.metrics import Registry
+from scripts.policies import (
+    DEFAULT_PRIORITY_CLASSES,
+    AdaptiveLimiter,
+    DegradationConfig,
+    DegradationEngine,
+    LimiterConfig,
+    PriorityClass,
+    check_admission,
+    classify_request,
+    parse_api_key_classes,
+    parse_priority_classes,
+)
+from scripts.scheduler import BatchScheduler, SchedulerConfig
+from scripts.tokens import TokenBudget, TokenConfig, TokenEstimator, fit_max_model_len
+from scripts.tracing import TraceConfig, Tracer
+from scripts.upstream import UpstreamClient, UpstreamConfig, UpstreamPool
+from scripts.worker_pool import AutoscaleConfig, WorkerPool
 
 # Config
 BATCH_WINDOW_MS = int(os.environ.get("BATCH_WINDOW_MS", "0"))
@@ -38,174 +113,634 @@ VLLM_URL = os.environ.get("VLLM_URL", "http://localhost:8000").rstrip("/")
 GATEWAY_PORT = int(os.environ.get("GATEWAY_PORT", "8001"))
 ENABLE_SUPERVISOR = os.environ.get("ENABLE_SUPERVISOR", "").lower() in ("1", "true", "yes")
 IDLE_TIMEOUT_SEC = float(os.environ.get("IDLE_TIMEOUT_SEC", "180"))
+STANDBY_AFTER_SEC = float(os.environ.get("STANDBY_AFTER_SEC", "0"))
+SLEEP_LEVEL = int(os.environ.get("SLEEP_LEVEL", "1"))
+MIN_WARM_WINDOWS = os.environ.get("MIN_WARM_WINDOWS", "")
+COALESCE_REQUESTS = os.environ.get("COALESCE_REQUESTS", "").lower() in ("1", "true", "yes")
 Q_MAX = int(os.environ.get("Q_MAX", "128"))
+DEFAULT_DEADLINE_MS = float(os.environ.get("DEFAULT_DEADLINE_MS", "0"))
+PRIORITY_CLASSES = parse_priority_classes(os.environ.get("PRIORITY_CLASSES", DEFAULT_PRIORITY_CLASSES))
+PRIORITY_API_KEYS = parse_api_key_classes(os.environ.get("PRIORITY_API_KEYS", ""))
+PRIORITY_DEFAULT = os.environ.get("PRIORITY_DEFAULT") or None
+AUTOSCALE = AutoscaleConfig.from_env()
+WORKER_PROFILE = os.environ.get("WORKER_PROFILE", "")
+TOKENS = TokenConfig.from_env()
+RATE_LIMIT = RateLimitConfig.from_env()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def _lifespan(app: FastAPI):
-    global _supervisor
-    if ENABLE_SUPERVISOR:
-        from scripts.supervisor import Supervisor
+    global _supervisor, _workers, _swapper, _profile_controller, _upstream, _scheduler, _cache
+    _upstream = UpstreamClient(UpstreamConfig.from_env())
+    await _upstream.start()
+    _tracer.start_export()
+    cache_config = CacheConfig.from_env()
+    if cache_config.enabled:
+        _cache = ResponseCache(cache_config)
+        logger.info("Response cache enabled: %s", cache_config)
+    sched_config = SchedulerConfig.from_env()
+    if sched_config.enabled:
+        _scheduler = BatchScheduler(sched_config, _dispatch, PRIORITY_CLASSES)
+        _scheduler.start()
+    if AUTOSCALE.enabled:
+        _workers = WorkerPool(AUTOSCALE, _pool, _get_queue_depth)
+        _workers.start()
+    elif ENABLE_SUPERVISOR:
+        from scripts.forecast import ForecastConfig, PredictivePolicy
+        from scripts.supervisor import Supervisor, parse_warm_windows
+        from scripts.worker_process import load_profile
+        forecast_config = ForecastConfig.from_env()
         _supervisor = Supervisor(
             worker_url=VLLM_URL,
             idle_timeout_sec=IDLE_TIMEOUT_SEC,
+            standby_after_sec=STANDBY_AFTER_SEC,
+            sleep_level=SLEEP_LEVEL,
+            warm_windows=parse_warm_windows(MIN_WARM_WINDOWS),
+            busy=lambda: _get_queue_depth() > 0,
+            policy=PredictivePolicy(forecast_config) if forecast_config.enabled else None,
+            in_flight=lambda: _pool.in_flight(VLLM_URL),
+            drain_timeout_sec=AUTOSCALE.drain_timeout_sec,
+            profile=load_profile(WORKER_PROFILE) if WORKER_PROFILE else None,
+            profile_name=WORKER_PROFILE or "env",
         )
         _supervisor.start_background_loop()
-        logger.info("Supervisor enabled (scale-to-zero), idle_timeout=%ss", IDLE_TIMEOUT_SEC)
+        _swapper = ProfileSwapper(
+            SwapConfig.from_env(), _pool, lambda: _supervisor, _set_supervisor, skip_ports={GATEWAY_PORT}
+        )
+        controller_config = ControllerConfig.from_env()
+        if controller_config.enabled:
+            if WORKER_PROFILE not in controller_config.ladder:
+                logger.warning("AUTO_PROFILE needs WORKER_PROFILE in %s; controller off", controller_config.ladder)
+            else:
+                _profile_controller = ProfileController(
+                    controller_config, _swapper, lambda: _supervisor, _pool, _get_queue_depth
+                )
+                _profile_controller.start()
+        logger.info(
+            "Supervisor enabled (scale-to-zero), idle_timeout=%ss standby_after=%ss warm_windows=%r",
+            IDLE_TIMEOUT_SEC, STANDBY_AFTER_SEC, MIN_WARM_WINDOWS,
+        )
     yield
+    if _scheduler is not None:
+        await _scheduler.aclose()
+        _scheduler = None
+    if _profile_controller is not None:
+        await _profile_controller.aclose()
+        _profile_controller = None
+    if _swapper is not None:
+        await _swapper.aclose()
+        _swapper = None
+    if _rate_limiter is not None:
+        await _rate_limiter.aclose()
+    # Drain in-flight upstream requests before the worker goes away
+    await _upstream.aclose()
     if _supervisor is not None:
-        _supervisor.stop_background_loop()
+        await _supervisor.shutdown()
         _supervisor = None
+    if _workers is not None:
+        await _workers.aclose()
+        _workers = None
+    await _tracer.aclose()
 
 
 app = FastAPI(title="LLM Gateway (M5+M6+M7)", lifespan=_lifespan)
 
 
-@dataclass
-class PendingRequest:
-    """Request waiting in batching queue."""
-
-    body: dict[str, Any]
-    received_at: float
-    future: asyncio.Future
-
-
 # Queue and state
-_pending: deque[PendingRequest] = deque()
-_flush_task: asyncio.Task | None = None
-_lock = asyncio.Lock()
+_scheduler: BatchScheduler | None = None
+_cache: ResponseCache | None = None
+_singleflight: SingleFlight | None = SingleFlight() if COALESCE_REQUESTS else None
 _in_flight = 0
 _supervisor = None
+_workers: WorkerPool | None = None
+_swapper: ProfileSwapper | None = None
+_profile_controller: ProfileController | None = None
+_upstream: UpstreamClient | None = None
+_pool = UpstreamPool.from_env(VLLM_URL, managed=AUTOSCALE.enabled)
+_limiter = AdaptiveLimiter(LimiterConfig.from_env(Q_MAX))
+_degrader = DegradationEngine(DegradationConfig.from_env(), PRIORITY_CLASSES)
+_token_estimator = TokenEstimator(TOKENS)
+# Budget follows the supervised worker's profile (swaps included); otherwise VLLM_* env
+_token_budget = TokenBudget(TOKENS, lambda: _supervisor.profile if _supervisor is not None else None)
+_max_len_results = {"rejected": 0, "truncated": 0}  # prompts that did not fit max_model_len
+_rate_limiter: RateLimiter | None = RateLimiter(RATE_LIMIT) if RATE_LIMIT.enabled else None
+_tracer = Tracer(TraceConfig.from_env())
 _worker_ready_timeout = 300  # max seconds to wait for worker on cold start
+_upstream_timeout_sec = 120.0  # cap for requests without a deadline
+_disconnect_poll_sec = 0.25  # how often a waiting request checks whether its client is gone
+
+# Gateway-side latency distributions and per-request counters (rendered by /metrics)
+_metrics = Registry()
+_request_hist = _metrics.histogram(
+    "gateway_request_duration_seconds",
+    "End-to-end time in the gateway, request received to last byte (streams: stream closed)",
+    ("class", "stream"),
+)
+_upstream_hist = _metrics.histogram(
+    "gateway_upstream_duration_seconds",
+    "Time from sending to a worker to its complete answer (or stream end)",
+)
+_ttft_hist = _metrics.histogram(
+    "gateway_stream_ttft_seconds",
+    "Time from request received to first streamed chunk",
+)
+_itl_hist = _metrics.histogram(
+    "gateway_stream_inter_token_seconds",
+    "Gap between consecutive streamed chunks (one chunk ~ one token for vLLM)",
+)
+_responses = _metrics.counter("gateway_responses_total", "Chat completion responses by HTTP status", ("status",))
+_rejections = _metrics.counter(
+    "gateway_rejections_total", "Requests turned away before reaching a worker, by reason", ("reason",)
+)
+_tier_requests = _metrics.counter(
+    "gateway_degradation_tier_requests_total", "Requests by applied degradation tier", ("class", "tier")
+)
+_stream_disconnects = 0
+_client_disconnects = 0
+_deadline_timeouts = 0  # upstream calls cut off by the request deadline
+# Admission decisions per priority class: {class: {"admitted": n, "rejected": n}}
+_class_admission = {c.name: {"admitted": 0, "rejected": 0} for c in PRIORITY_CLASSES}
 
 
 def _get_queue_depth() -> int:
     """Queue depth = pending in batch queue + in-flight."""
-    return len(_pending) + _in_flight
+    return (_scheduler.pending_count if _scheduler is not None else 0) + _in_flight
 
 
-async def _forward_to_vllm(client: httpx.AsyncClient, body: dict) -> tuple[int, dict]:
-    """Forward single request to vLLM, return (status_code, response_json)."""
+def _request_deadline(request: Request) -> float | None:
+    """Absolute deadline (time.monotonic()) from X-Deadline-Ms or DEFAULT_DEADLINE_MS."""
     try:
-        r = await client.post(
-            f"{VLLM_URL}/v1/chat/completions",
-            json=body,
-            timeout=120.0,
-        )
-        return r.status_code, r.json() if r.headers.get("content-type", "").startswith("application/json") else {}
+        budget_ms = float(request.headers.get("x-deadline-ms") or DEFAULT_DEADLINE_MS)
+    except ValueError:
+        budget_ms = DEFAULT_DEADLINE_MS
+    if budget_ms <= 0:
+        return None
+    return time.monotonic() + budget_ms / 1000.0
+
+
+def _upstream_timeout(deadline: float | None) -> float:
+    """Upstream timeout: the remaining budget, never more than the fixed cap."""
+    if deadline is None:
+        return _upstream_timeout_sec
+    return min(_upstream_timeout_sec, deadline - time.monotonic())
+
+
+async def _forward_to_vllm(body: dict, deadline: float | None = None) -> tuple[int, dict]:
+    """Forward single request to a vLLM worker, return (status_code, response_json).
+
+    A connect error means the worker never saw the request, so it is retried once
+    on another worker.
+    """
+    global _deadline_timeouts
+    attempts = max(1, min(2, len(_pool.endpoints)))
+    for attempt in range(attempts):
+        timeout = _upstream_timeout(deadline)
+        if timeout <= 0:
+            return 504, {"error": "deadline exceeded"}
+        try:
+            ep = _pool.pick(body)
+        except RuntimeError as e:  # managed pool scaled to zero / all draining
+            return 503, {"error": str(e)}
+        started_at = _pool.begin(ep)
+        ok = False
+        trace = tracing.current()
+        if trace is not None:
+            trace.mark("dispatched")
+            trace.attrs["upstream.endpoint"] = ep.url
+        try:
+            r = await _upstream.request("POST", ep.url, "/v1/chat/completions", json=body, timeout=timeout)
+            ok = r.status_code < 500
+            data = r.json() if r.headers.get("content-type", "").startswith("application/json") else {}
+            if r.status_code == 200:
+                _degrader.on_completion((data.get("usage") or {}).get("completion_tokens"))
+            return r.status_code, data
+        except httpx.ConnectError as e:
+            if attempt + 1 == attempts:
+                return 500, {"error": str(e)}
+        except httpx.TimeoutException as e:
+            if deadline is None or time.monotonic() < deadline:
+                return 500, {"error": str(e)}
+            # Out of budget, not a worker failure: the client has stopped waiting anyway
+            ok = True
+            _deadline_timeouts += 1
+            return 504, {"error": "deadline exceeded", "reason": "upstream did not finish in time"}
+        except Exception as e:
+            return 500, {"error": str(e)}
+        finally:
+            _pool.end(ep, started_at, ok)
+            _limiter.on_sample(time.monotonic() - started_at, ok)
+            _upstream_hist.observe(time.monotonic() - started_at)
+            tracing.mark("upstream_done")
+
+
+class _UpstreamStreamingResponse(StreamingResponse):
+    """StreamingResponse that always runs on_close, even when the client goes away.
+
+    Starlette stops iterating on disconnect without closing the generator; closing
+    the upstream stream here makes vLLM abort the generation immediately.
+    """
+
+    def __init__(self, content, on_close, **kwargs) -> None:
+        super().__init__(content, **kwargs)
+        self._on_close = on_close
+        self._after_close: list[Callable[[], None]] = []
+
+    def after_close(self, fn: Callable[[], None]) -> None:
+        """Run fn once the stream is closed (after the upstream is released)."""
+        self._after_close.append(fn)
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            await self._on_close()
+            for fn in self._after_close:
+                fn()
+
+
+class _StreamTokenCounter:
+    """Completion tokens of a relayed SSE stream, read from the events as they pass.
+
+    Counts choices[].delta.content events (vLLM sends about one per token), so role-only,
+    usage-only and [DONE] events do not count; a final usage.completion_tokens
+    (stream_options.include_usage) wins, as on the non-stream path.
+    """
+
+    def __init__(self) -> None:
+        self._partial = b""
+        self.content_events = 0
+        self.usage_tokens: int | None = None
+
+    @property
+    def tokens(self) -> int:
+        return self.usage_tokens if self.usage_tokens is not None else self.content_events
+
+    def feed(self, chunk: bytes) -> None:
+        lines = (self._partial + chunk).split(b"\n")
+        self._partial = lines.pop()  # an event can be split across chunks
+        for line in lines:
+            if not line.startswith(b"data:"):
+                continue
+            payload = line[5:].strip()
+            if not payload or payload == b"[DONE]":
+                continue
+            try:
+                event = json.loads(payload)
+            except ValueError:
+                continue
+            usage = event.get("usage")
+            if isinstance(usage, dict) and isinstance(usage.get("completion_tokens"), int):
+                self.usage_tokens = usage["completion_tokens"]
+            for choice in event.get("choices") or ():
+                if (choice.get("delta") or {}).get("content"):
+                    self.content_events += 1
+
+
+async def _stream_from_vllm(
+    body: dict,
+    received_at: float,
+    deadline: float | None = None,
+    headers: dict | None = None,
+    on_done: Callable[[], None] = lambda: None,
+) -> Response:
+    """Relay an SSE completion from vLLM; counted in _in_flight until the stream closes.
+
+    on_done runs once the request no longer occupies the worker (stream closed or error).
+    """
+    global _in_flight
+    try:
+        ep = _pool.pick(body)
+    except RuntimeError as e:
+        on_done()
+        return JSONResponse({"error": str(e)}, status_code=503)
+    _in_flight += 1
+    started_at = _pool.begin(ep)
+    trace = tracing.current()
+    if trace is not None:
+        trace.mark("dispatched")
+        trace.attrs["upstream.endpoint"] = ep.url
+    stream_cm = _upstream.stream(
+        "POST", ep.url, "/v1/chat/completions", json=body, timeout=max(0.001, _upstream_timeout(deadline))
+    )
+    try:
+        r = await stream_cm.__aenter__()
     except Exception as e:
-        return 500, {"error": str(e)}
+        _in_flight -= 1
+        on_done()
+        _pool.end(ep, started_at, ok=False)
+        _limiter.on_sample(time.monotonic() - started_at, ok=False)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+    if r.status_code != 200 or not r.headers.get("content-type", "").startswith("text/event-stream"):
+        # Upstream error (e.g. 400 for max_model_len): pass it through unstreamed
+        try:
+            content = await r.aread()
+            return Response(content=content, status_code=r.status_code, media_type=r.headers.get("content-type"))
+        finally:
+            await stream_cm.__aexit__(None, None, None)
+            _in_flight -= 1
+            on_done()
+            _pool.end(ep, started_at, ok=r.status_code < 500)
+            _limiter.on_sample(time.monotonic() - started_at, ok=r.status_code < 500)
+
+    completed = False
+    counter = _StreamTokenCounter()
+
+    async def relay():
+        nonlocal completed
+        last = None
+        async for chunk in r.aiter_raw():
+            now = time.perf_counter()
+            if last is None:
+                _ttft_hist.observe(now - received_at)
+                if trace is not None:
+                    trace.mark("first_byte")
+            else:
+                _itl_hist.observe(now - last)
+            last = now
+            counter.feed(chunk)
+            yield chunk
+        completed = True
+
+    async def on_close():
+        global _in_flight, _stream_disconnects
+        if not completed:
+            _stream_disconnects += 1
+            logger.info("Stream closed before completion; cancelling upstream request")
+        await stream_cm.__aexit__(None, None, None)
+        _in_flight -= 1
+        on_done()
+        # A client disconnect is not the worker's fault
+        _pool.end(ep, started_at, ok=True)
+        _upstream_hist.observe(time.monotonic() - started_at)
+        if trace is not None:
+            trace.mark("upstream_done")
+        if completed:
+            _limiter.on_sample(time.monotonic() - started_at)
+            _degrader.on_completion(counter.tokens)
+
+    return _UpstreamStreamingResponse(
+        relay(),
+        on_close,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **(headers or {})},
+    )
+
+
+def _set_supervisor(supervisor) -> None:
+    """Blue/green swap promoted a new worker: requests now wake and wait for it."""
+    global _supervisor
+    _supervisor = supervisor
 
 
-async def _ensure_worker_ready() -> bool:
-    """If supervisor enabled, wait until worker is ready (or timeout). Returns True if ready."""
+async def _ensure_worker_ready(deadline: float | None = None) -> bool:
+    """If supervisor enabled, wait until worker is ready (or timeout). Returns True if ready.
+
+    Woken by the supervisor's state change, so the request goes out as soon as the
+    worker passes its healthcheck; never waits past the request deadline. With a
+    worker pool, waits for any replica (scaling up from zero if needed).
+    """
+    if _workers is not None:
+        return await _workers.ensure_ready(min(_worker_ready_timeout, _upstream_timeout(deadline)))
     if not ENABLE_SUPERVISOR or _supervisor is None:
         return True
     if _supervisor.is_ready():
         return True
-    for _ in range(_worker_ready_timeout):
-        await asyncio.sleep(1)
-        if _supervisor.is_ready():
-            return True
-    return False
-
-
-async def _flush_batch():
-    """Flush all pending requests: forward to vLLM in parallel."""
-    global _pending, _in_flight
-    async with _lock:
-        batch = list(_pending)
-        _pending.clear()
-    if not batch:
-        return
-    _in_flight += len(batch)
+    return await _supervisor.wait_until_ready(min(_worker_ready_timeout, _upstream_timeout(deadline)))
+
+
+async def _dispatch(body: dict, deadline: float | None = None) -> tuple[int, dict]:
+    """Forward one scheduled request, counting it in _in_flight while upstream."""
+    global _in_flight
+    _in_flight += 1
     try:
-        async with httpx.AsyncClient() as client:
-            tasks = [_forward_to_vllm(client, p.body) for p in batch]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-        for req, res in zip(batch, results):
-            if isinstance(res, Exception):
-                req.future.set_result(JSONResponse({"error": str(res)}, status_code=500))
-            else:
-                status, data = res
-                req.future.set_result(JSONResponse(content=data, status_code=status))
+        return await _forward_to_vllm(body, deadline)
+    finally:
+        _in_flight -= 1
+
+
+async def _send(body: dict, priority: str | None = None, deadline: float | None = None) -> tuple[int, dict]:
+    """Forward directly or through the batch scheduler (queued under priority class)."""
+    if _scheduler is None:
+        return await _dispatch(body, deadline)
+    return await _scheduler.submit(body, deadline=deadline, priority=priority)
+
+
+async def _shared_send(body: dict, priority: str, deadline: float | None, cost: int) -> tuple[int, dict]:
+    """Upstream call of a coalesced request; releases the leader's token reservation when it ends."""
+    try:
+        return await _send(body, priority, deadline)
     finally:
-        _in_flight -= len(batch)
+        _token_budget.release(cost)
+
 
+def _coalesce_key(body: dict, priority: str, tier: int, request: Request) -> str:
+    """Requests share a call only with the same body, class, degradation tier and deadline budget.
 
-def _schedule_flush():
-    """Schedule a flush after BATCH_WINDOW_MS."""
-    global _flush_task
+    Followers arrive after the leader, so with the same budget the shared deadline is
+    never later than their own.
+    """
+    budget_ms = request.headers.get("x-deadline-ms") or DEFAULT_DEADLINE_MS
+    return f"{priority}:{tier}:{budget_ms}:{canonical_key(body)}"
 
-    async def _delayed_flush():
-        await asyncio.sleep(BATCH_WINDOW_MS / 1000.0)
-        await _flush_batch()
 
-    _flush_task = asyncio.create_task(_delayed_flush())
+async def _unless_disconnected(request: Request, coro) -> tuple[int, dict] | None:
+    """Await coro, cancelling it (queue slot or upstream call) if the client disconnects.
+
+    Returns None when the client went away.
+    """
+    global _client_disconnects
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=_disconnect_poll_sec)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                _client_disconnects += 1
+                logger.info("Client disconnected while waiting; cancelling request")
+                return None
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def _client_gone() -> Response:
+    """Nobody reads this; 499 (nginx "client closed request") keeps access logs honest."""
+    return JSONResponse(status_code=499, content={"error": "client closed request"})
 
 
 @app.post("/v1/chat/completions")
 async def chat_completions(request: Request):
     """Proxy to vLLM with admission, degradation, optional batching and supervisor."""
+    received_at = time.perf_counter()
+    trace = _tracer.start(request.headers.get("traceparent"))
+    cls = classify_request(request.headers, PRIORITY_CLASSES, PRIORITY_API_KEYS, PRIORITY_DEFAULT)
+    response = await _chat_completions(request, cls, received_at)
+    status = response.status_code
+    _responses.inc(str(status))
+    if trace is not None:
+        trace.attrs["gateway.class"] = cls.name
+        response.headers["X-Trace-Id"] = trace.trace_id
+    if isinstance(response, _UpstreamStreamingResponse):
+        hist = _request_hist.labels(cls.name, "true")
+        response.after_close(lambda: hist.observe(time.perf_counter() - received_at))
+        response.after_close(lambda: _tracer.finish(trace, status))
+    else:
+        _request_hist.labels(cls.name, "false").observe(time.perf_counter() - received_at)
+        _tracer.finish(trace, status)
+    return response
+
+
+async def _chat_completions(request: Request, cls: PriorityClass, received_at: float) -> Response:
     body = await request.json()
+    deadline = _request_deadline(request)
+
+    # Response cache sits in front of admission: hits never take queue capacity
+    cache_key = None
+    if _cache is not None and is_deterministic(body):
+        cache_key = canonical_key(body)
+    if cache_key is not None:
+        cached = _cache.get(cache_key)
+        if cached is not None:
+            return Response(content=cached, media_type="application/json", headers={"X-Cache": "HIT"})
+    elif _cache is not None:
+        _cache.bypassed += 1
+
+    # Per-tenant request and token buckets, before the request can take a queue slot
+    if _rate_limiter is not None:
+        max_model_len = _token_budget.limits.max_model_len
+        requested = body.get("max_tokens") if isinstance(body.get("max_tokens"), int) else max_model_len
+        tokens = min(max_model_len, _token_estimator.prompt_tokens(body) + requested)
+        limited = await _rate_limiter.check(request.headers, request.client.host if request.client else None, tokens)
+        if not limited.allowed:
+            _rejections.inc("rate_" + limited.result)
+            return JSONResponse(
+                status_code=429,
+                content={"error": "rate limited", "reason": limited.result},
+                headers={"Retry-After": str(limited.retry_after_sec)},
+            )
 
     queue_depth = _get_queue_depth()
 
-    # M7: Admission control
-    from scripts.policies import check_admission, apply_degradation
-    admission = check_admission(queue_depth, q_max=Q_MAX)
+    # M7: Admission control (static Q_MAX or adaptive limit), scaled by the class's share.
+    # A higher class over the limit takes the slot of a queued lower-class request.
+    _limiter.observe_depth(queue_depth)
+    admission = check_admission(queue_depth, limiter=_limiter, share=cls.admit_share)
+    if not admission.admitted and _scheduler is not None and _scheduler.shed_lower_than(cls.name):
+        admission.admitted = True
+    _class_admission[cls.name]["admitted" if admission.admitted else "rejected"] += 1
     if not admission.admitted:
+        _rejections.inc("queue_limit")
         return JSONResponse(
             status_code=429,
             content={"error": "overload", "reason": admission.reason},
             headers={"Retry-After": str(admission.retry_after_sec)},
         )
 
-    # M6: Supervisor activity + wait for worker ready (cold start)
-    if ENABLE_SUPERVISOR and _supervisor is not None:
-        _supervisor.request_activity()
-        _supervisor.start_if_needed()
-        if not await _ensure_worker_ready():
+    # M7: Degradation by estimated queue wait (per-class thresholds)
+    degraded, tier = _degrader.apply(body, cls.name, queue_depth)
+    if degraded is not body:
+        body = degraded
+        cache_key = None  # truncated answer must not be served for the full request later
+    tier_headers = {"X-Degradation-Tier": str(tier)}
+    _tier_requests.inc(cls.name, str(tier))
+    trace = tracing.current()
+    if trace is not None:
+        trace.attrs["gateway.degradation_tier"] = tier
+
+    # Token cost (opt-in): prompt + max_tokens must fit max_model_len, then the token budget
+    cost = 0
+    if TOKENS.admission:
+        fit = fit_max_model_len(
+            body, _token_estimator, _token_budget.limits.max_model_len, TOKENS.overflow_policy, TOKENS.overflow_margin
+        )
+        if fit.error:
+            _max_len_results["rejected"] += 1
+            _rejections.inc("context_length")
+            return JSONResponse(status_code=400, content={"error": "context length exceeded", "message": fit.error})
+        if fit.truncated:
+            _max_len_results["truncated"] += 1
+            cache_key = None
+        body = fit.body
+        if not _token_budget.try_acquire(fit.cost, share=cls.admit_share):
+            _rejections.inc("token_budget")
             return JSONResponse(
-                status_code=503,
-                content={"error": "worker not ready", "message": "cold start timeout"},
-                headers={"Retry-After": "60"},
+                status_code=429,
+                content={"error": "overload", "reason": f"token budget {_token_budget.budget} exhausted"},
+                headers={"Retry-After": str(_token_budget.retry_after_sec(fit.cost, _degrader.tokens_per_sec))},
             )
+        cost = fit.cost
+    if trace is not None:
+        trace.mark("admitted")
+        trace.attrs["gen_ai.request.max_tokens"] = body.get("max_tokens", 0)
 
-    # M7: Degradation
-    body, tier = apply_degradation(body, queue_depth)
-
-    if BATCH_WINDOW_MS <= 0:
-        global _in_flight
-        _in_flight += 1
-        try:
-            async with httpx.AsyncClient() as client:
-                status, data = await _forward_to_vllm(client, body)
-            return JSONResponse(content=data, status_code=status)
-        finally:
-            _in_flight -= 1
+    stream_owns_cost = flight_owns_cost = False
+    try:
+        # M6: Supervisor activity + wait for worker ready (cold start)
+        if ENABLE_SUPERVISOR and _supervisor is not None:
+            _supervisor.request_activity()
+            _supervisor.start_if_needed()
+        if (ENABLE_SUPERVISOR and _supervisor is not None) or _workers is not None:
+            if not await _ensure_worker_ready(deadline):
+                _rejections.inc("worker_not_ready")
+                return JSONResponse(
+                    status_code=503,
+                    content={"error": "worker not ready", "message": "cold start timeout"},
+                    headers={"Retry-After": "60"},
+                )
+            if trace is not None:
+                trace.mark("worker_ready")
+
+        if body.get("stream"):
+            stream_owns_cost = True
+            return await _stream_from_vllm(
+                body, received_at, deadline, tier_headers, on_done=lambda: _token_budget.release(cost)
+            )
 
-    loop = asyncio.get_running_loop()
-    future: asyncio.Future = loop.create_future()
-    async with _lock:
-        _pending.append(PendingRequest(body=body, received_at=time.time(), future=future))
-        if _flush_task is None or _flush_task.done():
-            _schedule_flush()
-    return await future
+        if _singleflight is not None and is_deterministic(body):
+            # Identical admitted request already upstream: share its call. The call holds the
+            # leader's token reservation until it ends, however many waiters it has.
+            def lead():
+                nonlocal flight_owns_cost
+                flight_owns_cost = True
+                return _shared_send(body, cls.name, deadline, cost)
+
+            send = _singleflight.do(_coalesce_key(body, cls.name, tier, request), lead)
+        else:
+            send = _send(body, cls.name, deadline)
+        res = await _unless_disconnected(request, send)
+        if res is None:
+            return _client_gone()
+        status, data = res
+        if cache_key is not None and status == 200:
+            content = _cache.put(cache_key, data)
+            return Response(
+                content=content, media_type="application/json", headers={"X-Cache": "MISS", **tier_headers}
+            )
+        return JSONResponse(content=data, status_code=status, headers=tier_headers)
+    finally:
+        if not stream_owns_cost and not flight_owns_cost:
+            _token_budget.release(cost)
 
 
 @app.get("/health")
 async def health():
     """Health check."""
     out = {"status": "ok", "batch_window_ms": BATCH_WINDOW_MS}
+    if _scheduler is not None:
+        out["batch_mode"] = _scheduler.config.mode
     if ENABLE_SUPERVISOR and _supervisor is not None:
         out["worker_state"] = _supervisor.state.value
+    if _workers is not None:
+        out["worker_pool"] = {r.url: r.supervisor.state.value for r in _workers.replicas.values()}
     return out
 
 
-@app.get("/metrics")
+@app.get("/metrics", response_class=PlainTextResponse)
 async def metrics():
     """Prometheus-style metrics for queue, worker state, in-flight (M3/M6/M7)."""
     lines = [
@@ -217,23 +752,172 @@ async def metrics():
         f"gateway_in_flight {_in_flight}",
         "# HELP gateway_pending_batch Requests waiting in batching window",
         "# TYPE gateway_pending_batch gauge",
-        f"gateway_pending_batch {len(_pending)}",
+        f"gateway_pending_batch {_scheduler.pending_count if _scheduler is not None else 0}",
     ]
+    lines.extend([
+        "# HELP gateway_class_admission_total Admission decisions per priority class",
+        "# TYPE gateway_class_admission_total counter",
+        *(
+            f'gateway_class_admission_total{{class="{name}",result="{result}"}} {n}'
+            for name, counts in _class_admission.items()
+            for result, n in counts.items()
+        ),
+    ])
     if ENABLE_SUPERVISOR and _supervisor is not None:
-        state_val = {"idle": 0, "starting": 1, "running": 2, "stopping": 3}.get(_supervisor.state.value, -1)
+        state_val = {"idle": 0, "starting": 1, "running": 2, "stopping": 3, "standby": 4}.get(
+            _supervisor.state.value, -1
+        )
         lines.extend([
-            "# HELP gateway_worker_state 0=idle 1=starting 2=running 3=stopping (scale-to-zero)",
+            "# HELP gateway_worker_state 0=idle 1=starting 2=running 3=stopping 4=standby (scale-to-zero)",
             "# TYPE gateway_worker_state gauge",
             f"gateway_worker_state {state_val}",
         ])
+    if ENABLE_SUPERVISOR and _supervisor is not None:
+        lines.extend(_supervisor.metrics_lines())
+    if _workers is not None:
+        lines.extend(_workers.metrics_lines())
+    if _swapper is not None:
+        lines.extend(_swapper.metrics_lines())
+    if _profile_controller is not None:
+        lines.extend(_profile_controller.metrics_lines())
+    if _scheduler is not None:
+        lines.extend(_scheduler.metrics_lines())
+    if _cache is not None:
+        lines.extend(_cache.metrics_lines())
+    if _singleflight is not None:
+        lines.extend(_singleflight.metrics_lines())
+    lines.extend(_metrics.lines())
+    lines.extend(_tracer.metrics_lines())
+    lines.extend([
+        "# HELP gateway_stream_disconnects_total Streams closed before completion (upstream cancelled)",
+        "# TYPE gateway_stream_disconnects_total counter",
+        f"gateway_stream_disconnects_total {_stream_disconnects}",
+        "# HELP gateway_client_disconnects_total Non-streaming requests whose client left before the answer",
+        "# TYPE gateway_client_disconnects_total counter",
+        f"gateway_client_disconnects_total {_client_disconnects}",
+        "# HELP gateway_deadline_timeouts_total Upstream calls cut off because the request deadline passed",
+        "# TYPE gateway_deadline_timeouts_total counter",
+        f"gateway_deadline_timeouts_total {_deadline_timeouts}",
+    ])
+    lines.extend(_limiter.metrics_lines())
+    lines.extend(_degrader.metrics_lines(_get_queue_depth()))
+    lines.extend(_token_budget.metrics_lines())
+    if _rate_limiter is not None:
+        lines.extend(_rate_limiter.metrics_lines())
+    lines.extend([
+        "# HELP gateway_max_model_len_total Prompts that did not fit max_model_len (MAX_MODEL_LEN_POLICY)",
+        "# TYPE gateway_max_model_len_total counter",
+        *(f'gateway_max_model_len_total{{action="{action}"}} {n}' for action, n in _max_len_results.items()),
+    ])
+    lines.extend(_pool.metrics_lines())
+    if _upstream is not None:
+        lines.extend(_upstream.metrics_lines())
     return "\n".join(lines) + "\n"
 
 
+@app.post("/admin/prewarm")
+async def prewarm(wait: bool = False):
+    """Start / wake the worker ahead of expected traffic (?wait=true blocks until ready)."""
+    if not ENABLE_SUPERVISOR or _supervisor is None:
+        return JSONResponse(status_code=409, content={"error": "supervisor disabled"})
+    _supervisor.prewarm()
+    if wait:
+        await _supervisor.wait_until_ready(_worker_ready_timeout)
+    return {"worker_state": _supervisor.state.value}
+
+
+@app.get("/admin/profile")
+async def profile_status():
+    """Profile of the supervised worker, available profiles and the last swap."""
+    from scripts.worker_process import list_profiles
+
+    if _swapper is None:
+        return JSONResponse(status_code=409, content={"error": "supervisor disabled"})
+    return {
+        "profile": _supervisor.profile_name,
+        "settings": _supervisor.profile,
+        "worker_url": _supervisor.worker_url,
+        "profiles": list_profiles(),
+        "swap": _swapper.status(),
+        "auto": _profile_controller.status() if _profile_controller is not None else None,
+    }
+
+
+@app.post("/admin/profile")
+async def profile_swap(request: Request, name: str = "", wait: bool = False):
+    """Blue/green restart of the worker with profile `name` (JSON body: keys to override).
+
+    The profile can also be named in the body: {"profile": "throughput", "max_num_seqs": 32}.
+    """
+    if _swapper is None:
+        return JSONResponse(status_code=409, content={"error": "supervisor disabled"})
+    raw = await request.body()
+    try:
+        overrides = json.loads(raw) if raw.strip() else {}
+    except ValueError as e:  # json.JSONDecodeError, UnicodeDecodeError
+        return JSONResponse(status_code=400, content={"error": "invalid JSON body", "message": str(e)})
+    if not isinstance(overrides, dict):
+        return JSONResponse(
+            status_code=400,
+            content={"error": "invalid JSON body", "message": "expected an object of profile keys"},
+        )
+    overrides = dict(overrides)
+    body_name = overrides.pop("profile", None)
+    if body_name is not None:
+        if not isinstance(body_name, str) or not body_name:
+            return JSONResponse(
+                status_code=400, content={"error": "invalid JSON body", "message": '"profile" must be a profile name'}
+            )
+        if name and name != body_name:
+            return JSONResponse(
+                status_code=400,
+                content={"error": "invalid JSON body", "message": f"?name={name} and profile {body_name!r} differ"},
+            )
+        name = body_name
+    if not name and not overrides:
+        return JSONResponse(status_code=400, content={"error": "give ?name=<profile> and/or a JSON body"})
+    try:
+        record = _swapper.start(name, overrides)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except RuntimeError as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+    if wait:
+        await _swapper.wait()
+        return record.as_dict()
+    return JSONResponse(status_code=202, content=record.as_dict())
+
+
+@app.get("/admin/worker/logs")
+async def worker_logs(lines: int = 100):
+    """Tail of each managed worker's output (stdout + stderr), pid and exit code."""
+    if _workers is not None:
+        supervisors = [r.supervisor for r in _workers.replicas.values()]
+    elif _supervisor is not None:
+        supervisors = [_supervisor]
+    else:
+        return JSONResponse(status_code=409, content={"error": "no managed worker"})
+    return {"workers": [s.worker_status(lines) for s in supervisors]}
+
+
+@app.get("/admin/traces")
+async def traces(limit: int = 50, slow: bool = False):
+    """Newest kept request traces (?slow=true: only tail-sampled slow / failed ones)."""
+    return {
+        "sample_rate": _tracer.config.sample_rate,
+        "slow_ms": _tracer.config.slow_ms,
+        "traces": _tracer.recent(limit, slow_only=slow),
+    }
+
+
 @app.get("/v1/models")
 async def models():
     """Proxy to vLLM models list."""
-    async with httpx.AsyncClient() as client:
-        r = await client.get(f"{VLLM_URL}/v1/models", timeout=10.0)
+    try:
+        ep = _pool.pick()
+    except RuntimeError as e:
+        return JSONResponse(status_code=503, content={"error": str(e)})
+    r = await _upstream.request("GET", ep.url, "/v1/models", timeout=10.0)
     return JSONResponse(content=r.json(), status_code=r.status_code)
 
 
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Zero-downtime worker profile swap (blue/green restart).
+
+Worker-level knobs (max_num_seqs, max_num_batched_tokens, max_model_len, ...)
+need a vLLM restart. Instead of stopping the worker, ProfileSwapper:
+
+  1. starting  spawns a second (green) worker with the new profile on another
+               port and waits for it to pass the readiness probe; blue keeps
+               serving
+  2. shifting  adds green to the UpstreamPool and moves traffic over in
+               SWAP_STEPS (weight = green's share), SWAP_STEP_SEC per step;
+               per step it records requests/s, error rate and EWMA latency of
+               both workers. If green's error rate exceeds SWAP_MAX_ERROR_RATE
+               (after SWAP_MIN_REQUESTS requests) the swap is rolled back
+  3. draining  green becomes the supervised worker; blue leaves routing, gets
+               its in-flight requests finished (DRAIN_TIMEOUT_SEC) and is stopped
+
+A worker that is scaled to zero / in standby when green is ready has no traffic
+to shift: green takes over at once. The next swap moves back to the original
+port (blue and green alternate).
+
+Side by side, both workers hold their gpu_memory_utilization of the same GPU.
+When blue's and green's add up to more than 1.0 (the shipped profiles use
+0.85-0.9 each, so always on one 4GB card) green could not allocate its KV cache;
+the swap then runs stop-start instead: green becomes the supervised worker,
+blue drains and stops, then green starts. Requests wait for green as on a cold
+start. If green does not become ready, the previous profile is started again.
+
+Admin API (scripts/gateway.py, ENABLE_SUPERVISOR=1):
+  GET  /admin/profile                    current profile, available profiles, swap status
+  POST /admin/profile?name=throughput    start a swap (JSON body: profile keys to override;
+                                         ?wait=true blocks until it finishes)
+
+Env:
+  SWAP_STEPS              Green traffic share per step (default 0.1,0.25,0.5,1)
+  SWAP_STEP_SEC           Seconds per step (default 10)
+  SWAP_MAX_ERROR_RATE     Green error rate that rolls the swap back (default 0.05)
+  SWAP_MIN_REQUESTS       Green requests in a step before its error rate counts (default 10)
+  SWAP_READY_TIMEOUT_SEC  Max seconds for green to become ready (default 600)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Callable
+from urllib.parse import urlparse
+
+from scripts.supervisor import Supervisor, WorkerState
+from scripts.upstream import Endpoint, UpstreamPool
+from scripts.worker_process import gpu_memory_utilization, load_profile, profile_env
+
+logger = logging.getLogger(__name__)
+
+SWAP_STATES = ("idle", "starting", "shifting", "draining")
+
+
+@dataclass
+class SwapConfig:
+    """Traffic-shift schedule and rollback threshold."""
+
+    steps: tuple[float, ...] = (0.1, 0.25, 0.5, 1.0)
+    step_sec: float = 10.0
+    max_error_rate: float = 0.05
+    min_requests: int = 10
+    ready_timeout_sec: float = 600.0
+
+    @classmethod
+    def from_env(cls) -> SwapConfig:
+        raw = os.environ.get("SWAP_STEPS", "0.1,0.25,0.5,1")
+        steps = tuple(sorted(min(1.0, max(0.0, float(x))) for x in raw.split(",") if x.strip()))
+        return cls(
+            steps=steps if steps and steps[-1] == 1.0 else (*steps, 1.0),
+            step_sec=float(os.environ.get("SWAP_STEP_SEC", "10")),
+            max_error_rate=float(os.environ.get("SWAP_MAX_ERROR_RATE", "0.05")),
+            min_requests=int(os.environ.get("SWAP_MIN_REQUESTS", "10")),
+            ready_timeout_sec=float(os.environ.get("SWAP_READY_TIMEOUT_SEC", "600")),
+        )
+
+
+@dataclass
+class SwapStep:
+    """Traffic observed on both workers while green had `weight` of it."""
+
+    weight: float
+    duration_sec: float
+    blue_requests: int
+    blue_errors: int
+    green_requests: int
+    green_errors: int
+    blue_latency_ms: float
+    green_latency_ms: float
+
+    @property
+    def green_error_rate(self) -> float:
+        return self.green_errors / self.green_requests if self.green_requests else 0.0
+
+    def as_dict(self) -> dict:
+        d = asdict(self)
+        total = self.blue_requests + self.green_requests
+        d["rps"] = round(total / self.duration_sec, 2) if self.duration_sec > 0 else 0.0
+        d["error_rate"] = round((self.blue_errors + self.green_errors) / total, 4) if total else 0.0
+        d["green_error_rate"] = round(self.green_error_rate, 4)
+        return d
+
+
+@dataclass
+class SwapRecord:
+    """One swap: what was asked, where it got, and the per-step traffic."""
+
+    from_profile: str
+    to_profile: str
+    from_url: str
+    to_url: str
+    mode: str = "blue_green"  # blue_green | stop_start (not enough GPU memory for both)
+    started_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    result: str = "running"  # running | done | failed | rolled_back
+    reason: str = ""
+    steps: list[SwapStep] = field(default_factory=list)
+
+    def as_dict(self) -> dict:
+        d = {k: v for k, v in asdict(self).items() if k != "steps"}
+        d["steps"] = [s.as_dict() for s in self.steps]
+        return d
+
+
+def _port_free(port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # as uvicorn does; TIME_WAIT is fine
+        try:
+            s.bind(("", port))
+        except OSError:
+            return False
+    return True
+
+
+class ProfileSwapper:
+    """Blue/green restart of the supervised worker with a new profile."""
+
+    def __init__(
+        self,
+        config: SwapConfig,
+        pool: UpstreamPool,
+        get_active: Callable[[], Supervisor],
+        set_active: Callable[[Supervisor], None],
+        skip_ports: set[int] | None = None,
+    ) -> None:
+        self.config = config
+        self.pool = pool
+        self._get_active = get_active
+        self._set_active = set_active
+        self.skip_ports = skip_ports or set()
+        self.home_port = urlparse(get_active().worker_url).port
+        self.state = "idle"
+        self.green_weight = 0.0
+        self.last: SwapRecord | None = None
+        self.results = {"done": 0, "failed": 0, "rolled_back": 0}
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _green_url(self, blue_url: str) -> str:
+        """Original port if blue moved off it, else the next free port."""
+        u = urlparse(blue_url)
+        taken = {urlparse(e.url).port for e in self.pool.endpoints} | self.skip_ports | {u.port}
+        port = self.home_port
+        while port in taken or not _port_free(port):
+            port += 1
+        return f"{u.scheme}://{u.hostname}:{port}"
+
+    def start(self, name: str, overrides: dict | None = None) -> SwapRecord:
+        """Validate the profile and start the swap in the background.
+
+        ValueError: unknown profile / keys; RuntimeError: a swap is already running.
+        """
+        if self.running:
+            raise RuntimeError("a profile swap is already running")
+        profile = load_profile(name) if name else {}
+        profile.update(overrides or {})
+        profile_env(profile)  # reject unknown keys before spawning anything
+        label = name or "custom"
+        if overrides and name:
+            label = f"{name}+custom"
+        blue = self._get_active()
+        record = SwapRecord(
+            from_profile=blue.profile_name,
+            to_profile=label,
+            from_url=blue.worker_url,
+            to_url=self._green_url(blue.worker_url),
+        )
+        gpu = gpu_memory_utilization(blue.profile) + gpu_memory_utilization(profile)
+        if gpu > 1.0 + 1e-9:
+            record.mode = "stop_start"
+            logger.warning(
+                "Profile swap: blue + green gpu_memory_utilization = %.2f > 1.0, stopping blue before green starts",
+                gpu,
+            )
+        self.last = record
+        self._task = asyncio.create_task(self._run(record, profile))
+        return record
+
+    async def wait(self) -> None:
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        logger.info("Profile swap: %s", state)
+
+    async def _run(self, record: SwapRecord, profile: dict) -> None:
+        blue = self._get_active()
+        green_url = record.to_url
+        green = blue.sibling(green_url, profile, record.to_profile, in_flight=lambda: self.pool.in_flight(green_url))
+        try:
+            await self._swap(record, blue, green)
+        except asyncio.CancelledError:
+            record.result, record.reason = "failed", "cancelled"
+            await self._abort(blue, green)
+            raise
+        except Exception as e:
+            logger.exception("Profile swap failed: %s", e)
+            record.result, record.reason = "failed", str(e)
+            await self._abort(blue, green)
+        finally:
+            record.finished_at = time.time()
+            self.results[record.result] = self.results.get(record.result, 0) + 1
+            self.green_weight = 0.0
+            self._set_state("idle")
+            logger.info(
+                "Profile swap %s -> %s: %s %s", record.from_profile, record.to_profile, record.result, record.reason
+            )
+
+    async def _abort(self, blue: Supervisor, green: Supervisor) -> None:
+        """Back to blue only: green out of routing and stopped."""
+        if self._get_active() is green:
+            return  # already promoted; blue is the one going away
+        self.pool.remove_endpoint(green.worker_url)
+        blue_ep = self.pool.endpoint(blue.worker_url)
+        if blue_ep is not None:
+            blue_ep.weight = 1.0
+        await green.shutdown()
+
+    async def _swap(self, record: SwapRecord, blue: Supervisor, green: Supervisor) -> None:
+        cfg = self.config
+        if record.mode == "stop_start":
+            await self._stop_start(record, blue, green)
+            return
+        self._set_state("starting")
+        logger.info("Profile swap: starting %s on %s (profile %s)", record.to_profile, green.worker_url, green.profile)
+        green.start_background_loop()
+        green.start_if_needed()
+        if not await green.wait_until_ready(cfg.ready_timeout_sec):
+            record.result, record.reason = "failed", "new worker did not become ready"
+            await self._abort(blue, green)
+            return
+
+        blue_ep = self.pool.endpoint(blue.worker_url)
+        if blue.state == WorkerState.RUNNING and blue_ep is not None:
+            self._set_state("shifting")
+            green_ep = self.pool.add_endpoint(green.worker_url)
+            for weight in cfg.steps:
+                step = await self._shift(blue_ep, green_ep, weight)
+                record.steps.append(step)
+                logger.info("Profile swap: step %s", step.as_dict())
+                if step.green_requests >= cfg.min_requests and step.green_error_rate > cfg.max_error_rate:
+                    record.result = "rolled_back"
+                    record.reason = f"green error rate {step.green_error_rate:.1%} at weight {weight}"
+                    await self._abort(blue, green)
+                    return
+        # Promote green before blue leaves, so new requests wake / count against green
+        self._set_active(green)
+        self._set_state("draining")
+        self.pool.add_endpoint(green.worker_url).weight = 1.0
+        self.pool.remove_endpoint(blue.worker_url)
+        await blue.shutdown()
+        record.result = "done"
+
+    async def _stop_start(self, record: SwapRecord, blue: Supervisor, green: Supervisor) -> None:
+        """Blue out first, then green; back to blue's profile if green does not start."""
+        # Promote green first, so waiting requests wake green instead of restarting blue
+        self._set_active(green)
+        self._set_state("draining")
+        self.pool.add_endpoint(green.worker_url).weight = 1.0
+        self.pool.remove_endpoint(blue.worker_url)
+        await blue.shutdown()
+        self._set_state("starting")
+        logger.info("Profile swap: starting %s on %s (profile %s)", record.to_profile, green.worker_url, green.profile)
+        green.start_background_loop()
+        green.start_if_needed()
+        if await green.wait_until_ready(self.config.ready_timeout_sec):
+            record.result = "done"
+            return
+        record.result, record.reason = "failed", "new worker did not become ready; previous profile restarted"
+        self.pool.remove_endpoint(green.worker_url)
+        await green.shutdown()
+        restored = blue.sibling(
+            blue.worker_url, blue.profile, blue.profile_name, in_flight=lambda: self.pool.in_flight(blue.worker_url)
+        )
+        self._set_active(restored)
+        self.pool.add_endpoint(blue.worker_url).weight = 1.0
+        restored.start_background_loop()
+        restored.start_if_needed()
+
+    async def _shift(self, blue_ep: Endpoint, green_ep: Endpoint, weight: float) -> SwapStep:
+        """Route `weight` of the traffic to green for step_sec and measure both sides."""
+        self.green_weight = weight
+        green_ep.weight, blue_ep.weight = weight, 1.0 - weight
+        before = (blue_ep.requests_total, blue_ep.failures_total, green_ep.requests_total, green_ep.failures_total)
+        t0 = time.monotonic()
+        await asyncio.sleep(self.config.step_sec)
+        return SwapStep(
+            weight=weight,
+            duration_sec=round(time.monotonic() - t0, 2),
+            blue_requests=blue_ep.requests_total - before[0],
+            blue_errors=blue_ep.failures_total - before[1],
+            green_requests=green_ep.requests_total - before[2],
+            green_errors=green_ep.failures_total - before[3],
+            blue_latency_ms=round(blue_ep.ewma_latency_sec * 1000, 1),
+            green_latency_ms=round(green_ep.ewma_latency_sec * 1000, 1),
+        )
+
+    async def aclose(self) -> None:
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "green_weight": self.green_weight,
+            "last": self.last.as_dict() if self.last is not None else None,
+        }
+
+    def metrics_lines(self) -> list[str]:
+        active = self._get_active()
+        return [
+            "# HELP gateway_worker_profile Profile of the supervised worker (value always 1)",
+            "# TYPE gateway_worker_profile gauge",
+            f'gateway_worker_profile{{profile="{active.profile_name}"}} 1',
+            "# HELP gateway_profile_swap_state 0=idle 1=starting 2=shifting 3=draining",
+            "# TYPE gateway_profile_swap_state gauge",
+            f"gateway_profile_swap_state {SWAP_STATES.index(self.state)}",
+            "# HELP gateway_profile_swap_green_weight Share of traffic routed to the new worker during a swap",
+            "# TYPE gateway_profile_swap_green_weight gauge",
+            f"gateway_profile_swap_green_weight {self.green_weight}",
+            "# HELP gateway_profile_swaps_total Profile swaps by outcome",
+            "# TYPE gateway_profile_swaps_total counter",
+            *(f'gateway_profile_swaps_total{{result="{r}"}} {n}' for r, n in self.results.items()),
+        ]
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Minimal Prometheus instrumentation for the gateway (no prometheus_client).
+
+- Histogram: fixed buckets, O(log buckets) observe
+- HistogramVec / Counter: label values -> child / int, created on first use
+- Registry: renders every registered family in the text exposition format,
+  next to the hand-written gauges in gateway /metrics
+
+No locks: the gateway updates metrics from one asyncio event loop, and an
+update never awaits, so it cannot interleave with another. Overhead per call is
+measured by scripts/bench_metrics.py. parse_totals reads the same format back
+(vLLM /metrics scraped by scripts/profile_controller.py).
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left
+
+# Seconds; covers sub-ms inter-token gaps up to multi-second cold starts
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics: le = less-or-equal)."""
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+        labels: dict[str, str] | None = None,
+    ) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._label_str = ",".join(f'{k}="{v}"' for k, v in (labels or {}).items())
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot = +Inf
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect_left(self.buckets, value)] += 1
+        self._sum += value
+        self._count += 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def lines(self, header: bool = True) -> list[str]:
+        """Exposition lines; pass header=False for the 2nd+ labelled series of a family."""
+        out = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"] if header else []
+        prefix = f"{self._label_str}," if self._label_str else ""
+        suffix = f"{{{self._label_str}}}" if self._label_str else ""
+        cumulative = 0
+        for bound, n in zip(self.buckets, self._counts):
+            cumulative += n
+            out.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        out.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {self._count}')
+        out.append(f"{self.name}_sum{suffix} {self._sum}")
+        out.append(f"{self.name}_count{suffix} {self._count}")
+        return out
+
+
+def _label_str(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    return ",".join(f'{k}="{v}"' for k, v in zip(names, values))
+
+
+class HistogramVec:
+    """Histogram family with labels; one child Histogram per label-value tuple."""
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...],
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._children: dict[tuple[str, ...], Histogram] = {}
+
+    def labels(self, *values: str) -> Histogram:
+        child = self._children.get(values)
+        if child is None:
+            child = Histogram(self.name, self.help_text, self.buckets, dict(zip(self.labelnames, values)))
+            self._children[values] = child
+        return child
+
+    def lines(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for child in self._children.values():
+            out.extend(child.lines(header=False))
+        return out
+
+
+class Counter:
+    """Monotonic counter family: label-value tuple -> int."""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], int] = {}
+
+    def inc(self, *values: str, n: int = 1) -> None:
+        self._values[values] = self._values.get(values, 0) + n
+
+    def value(self, *values: str) -> int:
+        return self._values.get(values, 0)
+
+    def lines(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for values, n in self._values.items():
+            labels = _label_str(self.labelnames, values)
+            out.append(f"{self.name}{{{labels}}} {n}" if labels else f"{self.name} {n}")
+        return out
+
+
+class Registry:
+    """Metric families rendered together by lines()."""
+
+    def __init__(self) -> None:
+        self._metrics: list[Histogram | HistogramVec | Counter] = []
+
+    def counter(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram | HistogramVec:
+        metric = HistogramVec(name, help_text, labelnames, buckets) if labelnames else Histogram(name, help_text, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def lines(self) -> list[str]:
+        out: list[str] = []
+        for metric in self._metrics:
+            out.extend(metric.lines())
+        return out
+
+
+def parse_totals(text: str) -> dict[str, float]:
+    """Sample values summed over labels, by metric name (comments and bad lines skipped)."""
+    totals: dict[str, float] = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name_part, _, rest = line.partition("{") if "{" in line else line.partition(" ")
+        value = rest.rsplit("}", 1)[-1].split() if "{" in line else rest.split()
+        if not value:
+            continue
+        try:
+            totals[name_part.strip()] = totals.get(name_part.strip(), 0.0) + float(value[0])
+        except ValueError:
+            continue
+    return totals
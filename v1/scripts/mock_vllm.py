@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+"""
+Mock vLLM (OpenAI-compatible) server for offline gateway benchmarks.
+
+Answers /v1/models and /v1/chat/completions so gateway changes can be measured
+without a GPU. With "stream": true it emits one SSE chunk per token. Two engines:
+
+  fixed     (default) every request takes MOCK_LATENCY_MS, tokens stream every
+            MOCK_ITL_MS, however many run at once; it only stands in for the
+            network peer
+  batching  continuous batching like vLLM's scheduler: one engine loop runs
+            steps over at most VLLM_MAX_NUM_SEQS sequences. A step decodes one
+            token for every running sequence and prefills waiting prompts with
+            what is left of VLLM_MAX_NUM_BATCHED_TOKENS (chunked prefill), and
+            takes MOCK_STEP_MS + MOCK_SEQ_MS x sequences + MOCK_PREFILL_MS_PER_TOKEN
+            x prefilled tokens. So TTFT grows with queueing and prefill, ITL and
+            throughput with the batch size. Requests over max_num_seqs wait;
+            when the KV cache (MOCK_KV_CACHE_TOKENS) is full the newest
+            sequence is preempted and recomputed later. Prompts over
+            VLLM_MAX_MODEL_LEN get vLLM's 400.
+            Step costs come from MOCK_PERF_FILE, fitted to real runs by
+            scripts/fit_mock_model.py (configs/mock_perf.json); MOCK_STEP_MS etc.
+            override single values.
+
+Faults (both engines), per request: MOCK_ERROR_RATE answers MOCK_ERROR_STATUS,
+MOCK_STALL_RATE hangs MOCK_STALL_SEC before answering, MOCK_DISCONNECT_RATE ends
+a stream midway without [DONE]. POST /mock/faults {"error_rate": 0.1, ...}
+changes them at runtime ("unhealthy": true also fails /v1/models); GET shows them.
+
+Startup and sleep mode are simulated too, so scale-to-zero can be exercised
+without a GPU (WORKER_BACKEND=mock in scripts/worker_process.py):
+MOCK_SPAWN_SEC delays binding the port (interpreter + imports), MOCK_LOAD_SEC
+keeps /v1/models at 503 after that (weights / CUDA graphs), and POST /sleep,
+POST /wake_up, GET /is_sleeping mirror vLLM's --enable-sleep-mode endpoints.
+
+GET /metrics exports the vLLM gauges the profile controller watches:
+requests running / waiting, KV-cache usage and preemptions. The fixed engine
+approximates them (usage = running / VLLM_MAX_NUM_SEQS, a preemption whenever a
+request arrives with the batch already full); the batching engine reports its
+actual state, plus prompt / generation token counters.
+
+Usage:
+  uvicorn scripts.mock_vllm:app --port 8000
+  MOCK_LATENCY_MS=200 uvicorn scripts.mock_vllm:app --port 8000
+  MOCK_ENGINE=batching VLLM_MAX_NUM_SEQS=16 uvicorn scripts.mock_vllm:app --port 8000
+
+Env:
+  MOCK_ENGINE       fixed | batching (default fixed)
+  MOCK_LATENCY_MS   fixed: delay per completion / before first streamed token (default 50)
+  MOCK_ITL_MS       fixed: delay between streamed tokens (default 5)
+  MOCK_PERF_FILE    batching: fitted step costs (default configs/mock_perf.json)
+  MOCK_STEP_MS      batching: fixed cost of one engine step (default from the file, else 1.0)
+  MOCK_SEQ_MS       batching: added per running sequence per step (default file, else 0.05)
+  MOCK_PREFILL_MS_PER_TOKEN  batching: added per prefilled prompt token (default file, else 0.01)
+  MOCK_KV_CACHE_TOKENS       batching: KV cache size in tokens (default
+                    VLLM_MAX_NUM_SEQS x VLLM_MAX_MODEL_LEN, i.e. never preempts)
+  VLLM_MAX_NUM_SEQS / VLLM_MAX_NUM_BATCHED_TOKENS / VLLM_MAX_MODEL_LEN
+                    Worker profile limits (default 64 / 4096 / 512, set by worker_process.py)
+  MOCK_ERROR_RATE / MOCK_ERROR_STATUS      Fraction of requests failed, and with what (default 0 / 500)
+  MOCK_STALL_RATE / MOCK_STALL_SEC         Fraction of requests that hang first, and for how long (0 / 30)
+  MOCK_DISCONNECT_RATE                     Fraction of streams cut midway (default 0)
+  MOCK_MODEL        Model id reported by /v1/models (default Qwen/Qwen2.5-0.5B-Instruct)
+  MOCK_SPAWN_SEC    Delay before the server listens (default 0)
+  MOCK_LOAD_SEC     Seconds after listening before it reports ready (default 0)
+  MOCK_WAKE_SEC     Duration of POST /wake_up (default 0.5)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import os
+import random
+import time
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+MOCK_ENGINE = os.environ.get("MOCK_ENGINE", "fixed").lower()
+MOCK_LATENCY_MS = float(os.environ.get("MOCK_LATENCY_MS", "50"))
+MOCK_ITL_MS = float(os.environ.get("MOCK_ITL_MS", "5"))
+MOCK_MODEL = os.environ.get("MOCK_MODEL", "Qwen/Qwen2.5-0.5B-Instruct")
+MOCK_SPAWN_SEC = float(os.environ.get("MOCK_SPAWN_SEC", "0"))
+MOCK_LOAD_SEC = float(os.environ.get("MOCK_LOAD_SEC", "0"))
+MOCK_WAKE_SEC = float(os.environ.get("MOCK_WAKE_SEC", "0.5"))
+MAX_NUM_SEQS = int(os.environ.get("VLLM_MAX_NUM_SEQS", "64"))
+MAX_NUM_BATCHED_TOKENS = int(os.environ.get("VLLM_MAX_NUM_BATCHED_TOKENS", "4096"))
+MAX_MODEL_LEN = int(os.environ.get("VLLM_MAX_MODEL_LEN", "512"))
+CHARS_PER_TOKEN = 4.0  # same default as scripts/tokens.py
+MESSAGE_OVERHEAD_TOKENS = 4
+MAX_STEP_LAG_SEC = 0.05
+
+if MOCK_ENGINE not in ("fixed", "batching"):
+    raise ValueError(f"unknown MOCK_ENGINE {MOCK_ENGINE!r} (expected fixed or batching)")
+
+
+@dataclass
+class PerfModel:
+    """Cost of one engine step, in ms (fitted by scripts/fit_mock_model.py)."""
+
+    step_ms: float = 1.0
+    seq_ms: float = 0.05
+    prefill_ms_per_token: float = 0.01
+
+    @classmethod
+    def load(cls) -> PerfModel:
+        """MOCK_PERF_FILE (JSON with these keys) first, then MOCK_* env per value."""
+        model = cls()
+        path = Path(os.environ.get("MOCK_PERF_FILE", str(REPO_ROOT / "configs" / "mock_perf.json")))
+        if path.exists():
+            data = json.loads(path.read_text())
+            for f in fields(cls):
+                if f.name in data:
+                    setattr(model, f.name, float(data[f.name]))
+        for f in fields(cls):
+            env = os.environ.get(f"MOCK_{f.name.upper()}")
+            if env:
+                setattr(model, f.name, float(env))
+        return model
+
+    def step_sec(self, seqs: int, prefill_tokens: int) -> float:
+        return (self.step_ms + self.seq_ms * seqs + self.prefill_ms_per_token * prefill_tokens) / 1000.0
+
+
+@dataclass
+class Faults:
+    """Injected failures; mutable at runtime via POST /mock/faults."""
+
+    error_rate: float = 0.0
+    error_status: int = 500
+    stall_rate: float = 0.0
+    stall_sec: float = 30.0
+    disconnect_rate: float = 0.0
+    unhealthy: bool = False
+
+    @classmethod
+    def from_env(cls) -> Faults:
+        return cls(
+            error_rate=float(os.environ.get("MOCK_ERROR_RATE", "0")),
+            error_status=int(os.environ.get("MOCK_ERROR_STATUS", "500")),
+            stall_rate=float(os.environ.get("MOCK_STALL_RATE", "0")),
+            stall_sec=float(os.environ.get("MOCK_STALL_SEC", "30")),
+            disconnect_rate=float(os.environ.get("MOCK_DISCONNECT_RATE", "0")),
+        )
+
+    def update(self, values: dict) -> None:
+        for f in fields(self):
+            if f.name in values:
+                setattr(self, f.name, type(getattr(self, f.name))(values[f.name]))
+
+
+class _Seq:
+    """One request inside the batching engine."""
+
+    __slots__ = ("prompt_tokens", "max_tokens", "prefill_target", "prefilled", "generated", "changed", "done")
+
+    def __init__(self, prompt_tokens: int, max_tokens: int) -> None:
+        self.prompt_tokens = prompt_tokens
+        self.max_tokens = max_tokens
+        self.prefill_target = prompt_tokens  # prompt + tokens to recompute after a preemption
+        self.prefilled = 0
+        self.generated = 0
+        self.changed = asyncio.Event()  # set after every step that gave this sequence a token
+        self.done = False
+
+    @property
+    def kv_tokens(self) -> int:
+        if self.prefilled < self.prefill_target:
+            return self.prefilled
+        return self.prompt_tokens + self.generated
+
+
+class BatchingEngine:
+    """Continuous batching: a single loop of engine steps over the running sequences."""
+
+    def __init__(self, perf: PerfModel, max_num_seqs: int, max_batched_tokens: int, kv_cache_tokens: int) -> None:
+        self.perf = perf
+        self.max_num_seqs = max_num_seqs
+        self.max_batched_tokens = max_batched_tokens
+        self.kv_cache_tokens = kv_cache_tokens
+        self.waiting: deque[_Seq] = deque()
+        self.running: list[_Seq] = []
+        self.preemptions = 0
+        self.prompt_tokens_total = 0
+        self.generation_tokens_total = 0
+        self.steps = 0
+        self._task: asyncio.Task | None = None
+
+    def add(self, seq: _Seq) -> None:
+        self.waiting.append(seq)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    def abort(self, seq: _Seq) -> None:
+        """Drop a sequence whose client went away (vLLM aborts it too)."""
+        if seq.done:
+            return
+        seq.done = True
+        if seq in self.running:
+            self.running.remove(seq)
+        elif seq in self.waiting:
+            self.waiting.remove(seq)
+
+    @property
+    def kv_usage(self) -> float:
+        return min(1.0, sum(s.kv_tokens for s in self.running) / max(1, self.kv_cache_tokens))
+
+    def _schedule(self) -> tuple[list[_Seq], list[tuple[_Seq, int]]]:
+        """(decoding sequences, [(prefilling sequence, chunk)]) for the next step."""
+        decode = [s for s in self.running if s.prefilled >= s.prefill_target]
+        budget = self.max_batched_tokens - len(decode)
+        prefill = []
+        for s in self.running:
+            if s.prefilled < s.prefill_target and budget > 0:
+                chunk = min(budget, s.prefill_target - s.prefilled)
+                prefill.append((s, chunk))
+                budget -= chunk
+        kv_used = sum(s.kv_tokens for s in self.running)
+        while self.waiting and len(self.running) < self.max_num_seqs and budget > 0:
+            s = self.waiting[0]
+            if kv_used + s.prefill_target + 1 > self.kv_cache_tokens and self.running:
+                break  # no KV room: wait until a sequence finishes
+            self.waiting.popleft()
+            self.running.append(s)
+            chunk = min(budget, s.prefill_target)
+            prefill.append((s, chunk))
+            budget -= chunk
+            kv_used += s.prefill_target
+        return decode, prefill
+
+    def _preempt_overflow(self) -> None:
+        """Recompute-preempt the newest sequences until the KV cache fits again."""
+        while len(self.running) > 1 and sum(s.kv_tokens for s in self.running) > self.kv_cache_tokens:
+            s = self.running.pop()
+            s.prefill_target = s.prompt_tokens + s.generated
+            s.prefilled = 0
+            self.waiting.appendleft(s)
+            self.preemptions += 1
+
+    async def _loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_at = loop.time()
+        while self.waiting or self.running:
+            decode, prefill = self._schedule()
+            prefill_tokens = sum(chunk for _, chunk in prefill)
+            # Deadline-based: timer overshoot (~1 ms, the size of a step) is caught up on later
+            # steps instead of adding up over a long generation; lag beyond MAX_STEP_LAG_SEC is dropped
+            next_at = max(next_at, loop.time() - MAX_STEP_LAG_SEC)
+            next_at += self.perf.step_sec(len(decode) + len(prefill), prefill_tokens)
+            await asyncio.sleep(max(0.0, next_at - loop.time()))
+            self.steps += 1
+            self.prompt_tokens_total += prefill_tokens
+            emitted = [s for s in decode if not s.done]
+            for s, chunk in prefill:
+                s.prefilled += chunk
+                if s.prefilled >= s.prefill_target and not s.done:
+                    emitted.append(s)  # the step that completes prefill samples the next token
+            for s in emitted:
+                s.generated += 1
+                self.generation_tokens_total += 1
+                if s.generated >= s.max_tokens:
+                    s.done = True
+                    self.running.remove(s)
+                s.changed.set()
+            self._preempt_overflow()
+
+
+_perf = PerfModel.load()
+_engine = BatchingEngine(
+    _perf,
+    MAX_NUM_SEQS,
+    MAX_NUM_BATCHED_TOKENS,
+    int(os.environ.get("MOCK_KV_CACHE_TOKENS") or MAX_NUM_SEQS * MAX_MODEL_LEN),
+)
+_faults = Faults.from_env()
+
+# Runs at import, i.e. before uvicorn binds the port
+time.sleep(MOCK_SPAWN_SEC)
+_ready_at = time.monotonic() + MOCK_LOAD_SEC
+_sleeping = False
+_running = 0
+_preemptions = 0
+
+app = FastAPI(title="Mock vLLM")
+
+
+def _unavailable() -> JSONResponse | None:
+    if time.monotonic() < _ready_at:
+        return JSONResponse({"error": "model loading"}, status_code=503)
+    if _sleeping:
+        return JSONResponse({"error": "engine is sleeping"}, status_code=503)
+    if _faults.unhealthy:
+        return JSONResponse({"error": "engine dead (injected)"}, status_code=503)
+    return None
+
+
+def _error(message: str, status: int) -> JSONResponse:
+    """vLLM's error body."""
+    kind = "BadRequestError" if status < 500 else "InternalServerError"
+    return JSONResponse({"object": "error", "message": message, "type": kind, "code": status}, status_code=status)
+
+
+async def _injected_fault() -> JSONResponse | None:
+    """Error response or stall as configured; None to answer normally."""
+    r = random.random()
+    if r < _faults.error_rate:
+        return _error("injected fault", _faults.error_status)
+    if r < _faults.error_rate + _faults.stall_rate:
+        await asyncio.sleep(_faults.stall_sec)
+    return None
+
+
+def _max_tokens(body: dict) -> int:
+    return body["max_tokens"] if isinstance(body.get("max_tokens"), int) else 200
+
+
+def _prompt_tokens(body: dict) -> int:
+    """chars / 4 per message plus template overhead (the chars estimator of scripts/tokens.py)."""
+    total = 0
+    for m in body.get("messages") or []:
+        content = m.get("content") if isinstance(m, dict) else None
+        if isinstance(content, list):
+            content = "".join(p.get("text", "") for p in content if isinstance(p, dict))
+        total += math.ceil(len(content or "") / CHARS_PER_TOKEN) + MESSAGE_OVERHEAD_TOKENS
+    return max(1, total)
+
+
+def _completion(body: dict, text: str, prompt_tokens: int = 200, completion_tokens: int | None = None) -> dict:
+    """OpenAI chat.completion payload with a deterministic answer."""
+    completion_tokens = _max_tokens(body) if completion_tokens is None else completion_tokens
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model") or MOCK_MODEL,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "length",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+@app.get("/v1/models")
+async def models():
+    busy = _unavailable()
+    if busy is not None:
+        return busy
+    return {"object": "list", "data": [{"id": MOCK_MODEL, "object": "model", "owned_by": "mock"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    busy = _unavailable()
+    if busy is None:
+        busy = await _injected_fault()
+    if busy is not None:
+        return busy
+    if MOCK_ENGINE == "batching":
+        return await _batched_completion(request, body)
+    if body.get("stream"):
+        return StreamingResponse(_stream_chunks(body), media_type="text/event-stream")
+    _begin()
+    try:
+        await asyncio.sleep(MOCK_LATENCY_MS / 1000.0)
+    finally:
+        _end()
+    return JSONResponse(_completion(body, "mock " * 8))
+
+
+async def _batched_completion(request: Request, body: dict):
+    prompt = _prompt_tokens(body)
+    max_tokens = _max_tokens(body)
+    if prompt + max_tokens > MAX_MODEL_LEN:
+        return _error(
+            f"This model's maximum context length is {MAX_MODEL_LEN} tokens. However, you requested "
+            f"{prompt + max_tokens} tokens ({prompt} in the messages, {max_tokens} in the completion).",
+            400,
+        )
+    seq = _Seq(prompt, max(1, max_tokens))
+    _engine.add(seq)
+    if body.get("stream"):
+        return StreamingResponse(_stream_seq(body, seq), media_type="text/event-stream")
+    try:
+        while not seq.done:
+            await seq.changed.wait()
+            seq.changed.clear()
+    finally:
+        _engine.abort(seq)
+    return JSONResponse(_completion(body, "mock " * min(8, seq.generated), prompt, seq.generated))
+
+
+def _begin() -> None:
+    global _running, _preemptions
+    if _running >= MAX_NUM_SEQS:
+        _preemptions += 1
+    _running += 1
+
+
+def _end() -> None:
+    global _running
+    _running -= 1
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    labels = f'{{model_name="{MOCK_MODEL}"}}'
+    if MOCK_ENGINE == "batching":
+        running, waiting = len(_engine.running), len(_engine.waiting)
+        kv, preemptions = _engine.kv_usage, _engine.preemptions
+    else:
+        running, waiting = _running, max(0, _running - MAX_NUM_SEQS)
+        kv, preemptions = min(1.0, _running / MAX_NUM_SEQS), _preemptions
+    return "\n".join([
+        "# TYPE vllm:num_requests_running gauge",
+        f"vllm:num_requests_running{labels} {running}",
+        "# TYPE vllm:num_requests_waiting gauge",
+        f"vllm:num_requests_waiting{labels} {waiting}",
+        "# TYPE vllm:kv_cache_usage_perc gauge",
+        f"vllm:kv_cache_usage_perc{labels} {kv:.4f}",
+        "# TYPE vllm:num_preemptions_total counter",
+        f"vllm:num_preemptions_total{labels} {preemptions}",
+        "# TYPE vllm:prompt_tokens_total counter",
+        f"vllm:prompt_tokens_total{labels} {_engine.prompt_tokens_total}",
+        "# TYPE vllm:generation_tokens_total counter",
+        f"vllm:generation_tokens_total{labels} {_engine.generation_tokens_total}",
+    ]) + "\n"
+
+
+@app.get("/mock/faults")
+async def get_faults():
+    return {"engine": MOCK_ENGINE, "perf": asdict(_perf), "faults": asdict(_faults)}
+
+
+@app.post("/mock/faults")
+async def set_faults(request: Request):
+    """Change injected faults, e.g. {"error_rate": 0.2} or {"unhealthy": true}."""
+    try:
+        _faults.update(await request.json())
+    except (ValueError, TypeError) as e:
+        return _error(f"invalid faults: {e}", 400)
+    return asdict(_faults)
+
+
+@app.post("/sleep")
+async def sleep(level: int = 1):
+    global _sleeping
+    _sleeping = True
+    return JSONResponse({})
+
+
+@app.post("/wake_up")
+async def wake_up():
+    global _sleeping
+    if _sleeping:
+        await asyncio.sleep(MOCK_WAKE_SEC)
+        _sleeping = False
+    return JSONResponse({})
+
+
+@app.get("/is_sleeping")
+async def is_sleeping():
+    return {"is_sleeping": _sleeping}
+
+
+def _chunk(chunk_id: str, model: str, last: bool) -> str:
+    chunk = {
+        "id": chunk_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "delta": {"content": "mock "},
+                "finish_reason": "length" if last else None,
+            }
+        ],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+def _disconnect_after(n: int) -> int | None:
+    """Token index at which to cut the stream (injected disconnect), or None."""
+    if n > 1 and random.random() < _faults.disconnect_rate:
+        return random.randrange(1, n)
+    return None
+
+
+async def _stream_chunks(body: dict):
+    """SSE: one chat.completion.chunk per token, then [DONE] (vLLM wire format)."""
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+    model = body.get("model") or MOCK_MODEL
+    n = _max_tokens(body)
+    cut = _disconnect_after(n)
+    _begin()
+    try:
+        await asyncio.sleep(MOCK_LATENCY_MS / 1000.0)
+        for i in range(n):
+            if i == cut:
+                return
+            if i:
+                await asyncio.sleep(MOCK_ITL_MS / 1000.0)
+            yield _chunk(chunk_id, model, i == n - 1)
+        yield "data: [DONE]\n\n"
+    finally:
+        _end()
+
+
+async def _stream_seq(body: dict, seq: _Seq):
+    """SSE for the batching engine: one chunk per token as the engine steps produce them."""
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+    model = body.get("model") or MOCK_MODEL
+    cut = _disconnect_after(seq.max_tokens)
+    sent = 0
+    try:
+        while sent < seq.max_tokens:
+            await seq.changed.wait()
+            seq.changed.clear()
+            while sent < seq.generated:
+                if sent == cut:
+                    return
+                sent += 1
+                yield _chunk(chunk_id, model, sent == seq.max_tokens)
+        yield "data: [DONE]\n\n"
+    finally:
+        _engine.abort(seq)
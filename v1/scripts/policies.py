@@ -3,16 +3,41 @@
 Milestone 7: Admission control and degradation ladder.
 
 - If queue_depth > Q_MAX -> return 429 + Retry-After
-- Degradation ladder: reduce max_new_tokens, max_model_len, max_num_seqs
-  when under load to avoid overload
-- Log which degradation tier is active
+- Adaptive limit (ADMISSION_MODE=aimd|gradient): Q_MAX is only the starting point;
+  the admissible limit follows measured upstream latency vs the p95 SLO, in the
+  spirit of Netflix concurrency-limits. Retry-After comes from the drain rate.
+- Priority classes (PRIORITY_CLASSES): each class is admitted only up to its share
+  of the limit and degrades as if the queue were deeper, so low-priority traffic
+  is shed and truncated before interactive traffic is touched.
+- Degradation (DegradationEngine): cap max_tokens by the estimated queue wait
+  (queue depth x tokens per request / measured token throughput) instead of raw
+  depth. DEGRADE_TIERS evenly spaced caps between DEGRADE_MAX_TOKENS and
+  DEGRADE_MIN_TOKENS, from DEGRADE_WAIT_START_SEC to DEGRADE_WAIT_FULL_SEC of wait;
+  a tier is only left once the wait is DEGRADE_HYSTERESIS tiers below its threshold.
+  Per-class thresholds come from degrade_share or DEGRADE_POLICIES.
+- Log which degradation tier is active (on change; the gateway also returns it in
+  the X-Degradation-Tier header)
+
+Env:
+  DEGRADE_WAIT_START_SEC   Estimated wait where trimming starts (default 4)
+  DEGRADE_WAIT_FULL_SEC    Estimated wait where max_tokens reaches the floor (default 20)
+  DEGRADE_MAX_TOKENS       Top of the scale (tier 0 leaves requests as sent); assumed when a
+                           request sets no max_tokens (default 200)
+  DEGRADE_MIN_TOKENS       Cap at the last tier (default 64)
+  DEGRADE_TIERS            Number of steps between the two (default 8; more = smoother)
+  DEGRADE_HYSTERESIS       Tiers the wait must fall below a threshold to step down (default 0.5)
+  DEGRADE_TOKENS_PER_SEC   Throughput assumed until one is measured (default 1000)
+  DEGRADE_POLICIES         class:start_sec:full_sec:min_tokens,... overrides per priority class
+                           (default: global thresholds x the class's degrade_share)
 """
 
 from __future__ import annotations
 
-import copy
 import logging
-from dataclasses import dataclass
+import math
+import os
+import time
+from dataclasses import dataclass, field
 from typing import Any
 
 logger = logging.getLogger(__name__)
@@ -20,13 +45,14 @@ logger = logging.getLogger(__name__)
 # Default admission: reject when queue exceeds this (tune from M4 results)
 DEFAULT_Q_MAX = 128
 
-# Degradation tiers: (queue_low, queue_high] -> tier
+# Fixed ladder by queue depth (get_degradation_tier); the gateway uses DegradationEngine.
 # tier 0: no degradation
 # tier 1: max_new_tokens 200 -> 128
 # tier 2: also suggest max_model_len 512 -> 448 (applied at worker profile; here we only tweak request)
 # tier 3: further reduce (e.g. max_new_tokens 64)
 # We apply degradation by modifying the request body (max_tokens). max_model_len/max_num_seqs
-# are worker-level; for per-request we only have max_tokens and possibly truncation.
+# are worker-level; for per-request we only have max_tokens and possibly truncation. Worker-level
+# degradation (profile downshift via blue/green restart) is scripts/profile_controller.py.
 
 
 @dataclass
@@ -54,21 +80,231 @@ DEGRADATION_LADDER = [
 ]
 
 
-def check_admission(queue_depth: int, q_max: int | None = None) -> AdmissionResult:
+def check_admission(
+    queue_depth: int,
+    q_max: int | None = None,
+    limiter: AdaptiveLimiter | None = None,
+    share: float = 1.0,
+) -> AdmissionResult:
     """
-    If queue_depth > Q_MAX, reject with 429.
-    Returns AdmissionResult(admitted=False, retry_after_sec=...) when rejected.
+    If queue_depth > Q_MAX (or the limiter's live limit) x share, reject with 429.
+    Returns AdmissionResult(admitted=False, retry_after_sec=...) when rejected;
+    with a limiter, Retry-After is the time to drain the excess at the observed rate.
     """
-    limit = q_max if q_max is not None else DEFAULT_Q_MAX
+    if limiter is not None:
+        limit = limiter.limit
+    else:
+        limit = q_max if q_max is not None else DEFAULT_Q_MAX
+    limit = int(limit * share)
     if queue_depth <= limit:
         return AdmissionResult(admitted=True)
     return AdmissionResult(
         admitted=False,
-        retry_after_sec=60,
-        reason=f"queue_depth {queue_depth} > Q_MAX {limit}",
+        retry_after_sec=limiter.retry_after_sec(queue_depth) if limiter is not None else 60,
+        reason=f"queue_depth {queue_depth} > {'limit' if limiter is not None else 'Q_MAX'} {limit}",
     )
 
 
+@dataclass
+class PriorityClass:
+    """Traffic class: scheduling weight plus its share of admission/degradation thresholds."""
+
+    name: str
+    weight: int = 1  # DRR quantum (requests per round) in the batch scheduler
+    admit_share: float = 1.0  # admitted while queue_depth <= limit * admit_share
+    degrade_share: float = 1.0  # degrades as if queue_depth were queue_depth / degrade_share
+
+
+DEFAULT_PRIORITY_CLASSES = "interactive:4:1.0:1.0,batch:1:0.5:0.5"
+
+
+def parse_priority_classes(spec: str) -> list[PriorityClass]:
+    """
+    Parse "name:weight:admit_share:degrade_share,..." (highest priority first).
+    Missing fields keep their defaults, e.g. "interactive:4,batch".
+    """
+    classes = []
+    for item in spec.split(","):
+        parts = [p.strip() for p in item.split(":")]
+        if not parts[0]:
+            continue
+        cls = PriorityClass(name=parts[0])
+        if len(parts) > 1 and parts[1]:
+            cls.weight = max(1, int(parts[1]))
+        if len(parts) > 2 and parts[2]:
+            cls.admit_share = float(parts[2])
+        if len(parts) > 3 and parts[3]:
+            cls.degrade_share = float(parts[3])
+        classes.append(cls)
+    if not classes:
+        raise ValueError(f"PRIORITY_CLASSES {spec!r} defines no class")
+    return classes
+
+
+def parse_api_key_classes(spec: str) -> dict[str, str]:
+    """Parse "api_key:class,..." into {api_key: class}."""
+    out = {}
+    for item in spec.split(","):
+        key, sep, cls = item.strip().rpartition(":")
+        if sep and key:
+            out[key] = cls
+    return out
+
+
+def classify_request(
+    headers: Any,
+    classes: list[PriorityClass],
+    api_key_classes: dict[str, str],
+    default: str | None = None,
+) -> PriorityClass:
+    """
+    Pick the request's class: X-Priority header, else the API key's class, else default
+    (first class if unset). Unknown names fall back to the default as well.
+    """
+    by_name = {c.name: c for c in classes}
+    fallback = by_name.get(default or "", classes[0])
+    name = (headers.get("x-priority") or "").strip().lower()
+    if not name:
+        auth = headers.get("authorization") or ""
+        api_key = auth[7:].strip() if auth.lower().startswith("bearer ") else ""
+        name = api_key_classes.get(api_key, "")
+    return by_name.get(name, fallback)
+
+
+@dataclass
+class LimiterConfig:
+    """Adaptive admission settings (static = fixed Q_MAX, still drain-rate Retry-After)."""
+
+    mode: str = "static"
+    initial_limit: int = DEFAULT_Q_MAX
+    min_limit: int = 8
+    max_limit: int = 512
+    slo_p95_ms: float = 5000.0
+    window_samples: int = 32  # latency samples per adjustment
+    backoff: float = 0.9  # aimd: multiplicative decrease
+    tolerance: float = 1.5  # gradient: short/long latency ratio tolerated before shrinking
+    smoothing: float = 0.2  # gradient: weight of the new limit
+
+    @classmethod
+    def from_env(cls, q_max: int = DEFAULT_Q_MAX) -> LimiterConfig:
+        return cls(
+            mode=os.environ.get("ADMISSION_MODE", "static").lower(),
+            initial_limit=q_max,
+            min_limit=int(os.environ.get("ADMISSION_MIN_LIMIT", "8")),
+            max_limit=int(os.environ.get("ADMISSION_MAX_LIMIT", "512")),
+            slo_p95_ms=float(os.environ.get("SLO_P95_MS", "5000")),
+            window_samples=int(os.environ.get("ADMISSION_WINDOW_SAMPLES", "32")),
+        )
+
+
+class AdaptiveLimiter:
+    """
+    Admissible queue depth driven by observed upstream latency.
+
+    Every window_samples completions the window's p95 is compared with the SLO:
+    - aimd:     p95 > SLO or errors -> limit *= backoff; else, if the window actually
+                used the limit (peak depth >= limit / 2), limit += 1.
+    - gradient: gradient = clamp(tolerance * long_p95 / short_p95, 0.5, 1), further capped
+                by SLO / short_p95; new = limit * gradient + sqrt(limit), smoothed.
+    - static:   limit stays at initial_limit (Q_MAX).
+    The drain rate (completions/sec, EWMA) is tracked in every mode for Retry-After.
+    """
+
+    MODES = ("static", "aimd", "gradient")
+
+    def __init__(self, config: LimiterConfig) -> None:
+        if config.mode not in self.MODES:
+            raise ValueError(f"unknown ADMISSION_MODE {config.mode!r} (expected one of {self.MODES})")
+        self.config = config
+        self._limit = float(config.initial_limit)
+        self._window: list[float] = []
+        self._window_errors = 0
+        self._window_peak_depth = 0
+        self._long_p95: float | None = None
+        self._drain_rate = 0.0  # completions/sec
+        self._drain_count = 0
+        self._drain_since = time.monotonic()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def drain_rate(self) -> float:
+        return self._drain_rate
+
+    def observe_depth(self, queue_depth: int) -> None:
+        """Record the depth seen at admission (aimd only grows a limit that is in use)."""
+        if queue_depth > self._window_peak_depth:
+            self._window_peak_depth = queue_depth
+
+    def on_sample(self, latency_sec: float, ok: bool = True) -> None:
+        """Record one upstream completion."""
+        self._drain_count += 1
+        now = time.monotonic()
+        elapsed = now - self._drain_since
+        if elapsed >= 1.0:
+            rate = self._drain_count / elapsed
+            self._drain_rate = rate if self._drain_rate == 0.0 else 0.7 * self._drain_rate + 0.3 * rate
+            self._drain_count = 0
+            self._drain_since = now
+
+        if self.config.mode == "static":
+            return
+        self._window.append(latency_sec)
+        if not ok:
+            self._window_errors += 1
+        if len(self._window) >= self.config.window_samples:
+            self._adjust()
+
+    def _adjust(self) -> None:
+        window = sorted(self._window)
+        p95 = window[min(len(window) - 1, int(0.95 * len(window)))]
+        slo = self.config.slo_p95_ms / 1000.0
+        old = self._limit
+        if self.config.mode == "aimd":
+            if p95 > slo or self._window_errors:
+                new = old * self.config.backoff
+            elif self._window_peak_depth >= old / 2:
+                new = old + 1
+            else:
+                new = old
+        else:
+            long_p95 = self._long_p95 if self._long_p95 is not None else p95
+            gradient = max(0.5, min(1.0, self.config.tolerance * long_p95 / p95 if p95 > 0 else 1.0))
+            if p95 > slo:
+                gradient = min(gradient, max(0.5, slo / p95))
+            target = old * gradient + math.sqrt(old)
+            new = (1 - self.config.smoothing) * old + self.config.smoothing * target
+            self._long_p95 = p95 if self._long_p95 is None else 0.95 * self._long_p95 + 0.05 * p95
+        self._limit = max(self.config.min_limit, min(self.config.max_limit, new))
+        if int(self._limit) != int(old):
+            logger.info(
+                "Admission limit %s -> %s (%s, window p95=%.0fms, SLO=%.0fms, errors=%s)",
+                int(old), int(self._limit), self.config.mode, p95 * 1000, self.config.slo_p95_ms, self._window_errors,
+            )
+        self._window.clear()
+        self._window_errors = 0
+        self._window_peak_depth = 0
+
+    def retry_after_sec(self, queue_depth: int) -> int:
+        """Seconds until the excess over the limit drains at the observed rate (1..60)."""
+        if self._drain_rate <= 0:
+            return 60
+        excess = queue_depth - self.limit + 1
+        return max(1, min(60, math.ceil(excess / self._drain_rate)))
+
+    def metrics_lines(self) -> list[str]:
+        return [
+            "# HELP gateway_admission_limit Live admissible queue depth (adaptive limiter)",
+            "# TYPE gateway_admission_limit gauge",
+            f'gateway_admission_limit{{mode="{self.config.mode}"}} {self.limit}',
+            "# HELP gateway_drain_rate Upstream completions per second (EWMA), drives Retry-After",
+            "# TYPE gateway_drain_rate gauge",
+            f"gateway_drain_rate {self._drain_rate:.3f}",
+        ]
+
+
 def get_degradation_tier(queue_depth: int) -> DegradationTier:
     """
     Choose degradation tier from queue depth.
@@ -83,16 +319,195 @@ def get_degradation_tier(queue_depth: int) -> DegradationTier:
     return DEGRADATION_LADDER[3]
 
 
+def _cap_max_tokens(body: dict[str, Any], cap: int, default: int = 200) -> dict[str, Any]:
+    """body with max_tokens <= cap; the same object when nothing changes (no copy)."""
+    current = body.get("max_tokens") if isinstance(body.get("max_tokens"), int) else default
+    if current <= cap:
+        return body
+    # Only the top-level key changes, so a shallow copy keeps the caller's body intact
+    out = dict(body)
+    out["max_tokens"] = cap
+    return out
+
+
 def apply_degradation(body: dict[str, Any], queue_depth: int) -> tuple[dict[str, Any], DegradationTier]:
     """
-    Copy body and apply degradation (max_tokens) based on queue_depth.
-    Returns (modified_body, tier). Logs active tier.
+    Apply degradation (max_tokens) based on queue_depth, copying body only if it changes.
+    Returns (body, tier). Logs active tier.
     """
     tier = get_degradation_tier(queue_depth)
-    out = copy.deepcopy(body)
-    # OpenAI/vLLM: max_tokens in body; apply cap from tier
-    current = out.get("max_tokens") if isinstance(out.get("max_tokens"), int) else 200
-    if current > tier.max_new_tokens:
-        out["max_tokens"] = tier.max_new_tokens
+    out = _cap_max_tokens(body, tier.max_new_tokens)
+    if out is not body:
         logger.info("Degradation tier %s active (queue_depth=%s): %s", tier.tier, queue_depth, tier.description)
     return out, tier
+
+
+@dataclass
+class DegradationPolicy:
+    """Wait thresholds for one priority class."""
+
+    start_sec: float
+    full_sec: float
+    min_tokens: int
+
+
+@dataclass
+class DegradationConfig:
+    """Wait-driven max_tokens scaling (see module docstring)."""
+
+    wait_start_sec: float = 4.0
+    wait_full_sec: float = 20.0
+    max_tokens: int = 200
+    min_tokens: int = 64
+    tiers: int = 8
+    hysteresis: float = 0.5
+    tokens_per_sec: float = 1000.0
+    policies: dict[str, DegradationPolicy] = field(default_factory=dict)
+
+    @classmethod
+    def from_env(cls) -> DegradationConfig:
+        cfg = cls(
+            wait_start_sec=float(os.environ.get("DEGRADE_WAIT_START_SEC", "4")),
+            wait_full_sec=float(os.environ.get("DEGRADE_WAIT_FULL_SEC", "20")),
+            max_tokens=int(os.environ.get("DEGRADE_MAX_TOKENS", "200")),
+            min_tokens=int(os.environ.get("DEGRADE_MIN_TOKENS", "64")),
+            tiers=max(1, int(os.environ.get("DEGRADE_TIERS", "8"))),
+            hysteresis=float(os.environ.get("DEGRADE_HYSTERESIS", "0.5")),
+            tokens_per_sec=float(os.environ.get("DEGRADE_TOKENS_PER_SEC", "1000")),
+        )
+        cfg.policies = cfg.parse_policies(os.environ.get("DEGRADE_POLICIES", ""))
+        return cfg
+
+    def parse_policies(self, spec: str) -> dict[str, DegradationPolicy]:
+        """Parse "class:start_sec:full_sec:min_tokens,..."; missing fields keep the global value."""
+        out = {}
+        for item in spec.split(","):
+            parts = [p.strip() for p in item.split(":")]
+            if not parts[0]:
+                continue
+            policy = self.default_policy()
+            if len(parts) > 1 and parts[1]:
+                policy.start_sec = float(parts[1])
+            if len(parts) > 2 and parts[2]:
+                policy.full_sec = float(parts[2])
+            if len(parts) > 3 and parts[3]:
+                policy.min_tokens = int(parts[3])
+            out[parts[0]] = policy
+        return out
+
+    def default_policy(self, share: float = 1.0) -> DegradationPolicy:
+        return DegradationPolicy(self.wait_start_sec * share, self.wait_full_sec * share, self.min_tokens)
+
+
+class DegradationEngine:
+    """
+    Cap max_tokens by estimated queue wait, with per-class tiers and hysteresis.
+
+    Throughput is the completion tokens the gateway sees per second, kept as a slowly
+    decaying peak: quiet periods say little about capacity, so they must not make the
+    wait estimate look worse. Tokens per request is an EWMA of completion tokens.
+    """
+
+    CAPACITY_DECAY = 0.98  # per 1s window; a stale peak halves in ~35 busy seconds
+
+    def __init__(self, config: DegradationConfig, classes: list[PriorityClass]) -> None:
+        self.config = config
+        self.policies = {
+            c.name: config.policies.get(c.name) or config.default_policy(c.degrade_share) for c in classes
+        }
+        self.tier = {c.name: 0 for c in classes}
+        self.degraded = {c.name: 0 for c in classes}
+        self._tokens_per_sec = config.tokens_per_sec
+        self._tokens_per_request = float(config.max_tokens)
+        self._measured = False
+        self._window_tokens = 0
+        self._window_since = time.monotonic()
+
+    @property
+    def tokens_per_sec(self) -> float:
+        return self._tokens_per_sec
+
+    def on_completion(self, tokens: int | None) -> None:
+        """Record one finished upstream completion with `tokens` generated tokens."""
+        if not tokens or tokens <= 0:
+            return
+        self._tokens_per_request = 0.9 * self._tokens_per_request + 0.1 * tokens
+        now = time.monotonic()
+        if not self._measured and not self._window_tokens:
+            self._window_since = now  # first window starts with traffic, not at gateway start
+        self._window_tokens += tokens
+        elapsed = now - self._window_since
+        if elapsed >= 1.0:
+            rate = self._window_tokens / elapsed
+            if self._measured:
+                self._tokens_per_sec = max(rate, self._tokens_per_sec * self.CAPACITY_DECAY)
+            else:
+                # First measurement replaces the assumed DEGRADE_TOKENS_PER_SEC, slower or not
+                self._tokens_per_sec = rate
+                self._measured = True
+            self._window_tokens = 0
+            self._window_since = now
+
+    def estimated_wait_sec(self, queue_depth: int) -> float:
+        if self._tokens_per_sec <= 0:
+            return 0.0
+        return queue_depth * self._tokens_per_request / self._tokens_per_sec
+
+    def _raw_tier(self, wait: float, policy: DegradationPolicy) -> int:
+        n = self.config.tiers
+        if wait < policy.start_sec:
+            return 0
+        span = policy.full_sec - policy.start_sec
+        if span <= 0:
+            return n
+        # Tier k starts at start_sec + (k - 1) * span / (n - 1); tier n at full_sec
+        step = span / max(1, n - 1)
+        return min(n, 1 + int((wait - policy.start_sec) / step))
+
+    def _cap(self, tier: int, policy: DegradationPolicy) -> int:
+        hi, lo, n = self.config.max_tokens, min(self.config.max_tokens, policy.min_tokens), self.config.tiers
+        return round(hi - (hi - lo) * tier / n)
+
+    def tier_for(self, class_name: str, queue_depth: int) -> int:
+        """Class's tier at this depth: up at once, down only past the hysteresis margin."""
+        policy = self.policies[class_name]
+        wait = self.estimated_wait_sec(queue_depth)
+        current = self.tier[class_name]
+        new = self._raw_tier(wait, policy)
+        if new < current:
+            step = (policy.full_sec - policy.start_sec) / max(1, self.config.tiers - 1)
+            new = max(new, min(current, self._raw_tier(wait + self.config.hysteresis * step, policy)))
+        if new != current:
+            logger.info(
+                "Degradation tier %s -> %s for %s (estimated wait %.1fs, depth=%s, %.0f tok/s): max_tokens=%s",
+                current, new, class_name, wait, queue_depth, self._tokens_per_sec,
+                self._cap(new, policy) if new else "unchanged",
+            )
+            self.tier[class_name] = new
+        return new
+
+    def apply(self, body: dict[str, Any], class_name: str, queue_depth: int) -> tuple[dict[str, Any], int]:
+        """(body with max_tokens capped for the class's tier, tier); body is not copied at tier 0."""
+        tier = self.tier_for(class_name, queue_depth)
+        if tier == 0:
+            return body, 0
+        out = _cap_max_tokens(body, self._cap(tier, self.policies[class_name]), self.config.max_tokens)
+        if out is not body:
+            self.degraded[class_name] += 1
+        return out, tier
+
+    def metrics_lines(self, queue_depth: int) -> list[str]:
+        return [
+            "# HELP gateway_estimated_wait_seconds Queue depth x tokens per request / token throughput",
+            "# TYPE gateway_estimated_wait_seconds gauge",
+            f"gateway_estimated_wait_seconds {self.estimated_wait_sec(queue_depth):.3f}",
+            "# HELP gateway_token_throughput Completion tokens per second (decaying peak), drives degradation",
+            "# TYPE gateway_token_throughput gauge",
+            f"gateway_token_throughput {self._tokens_per_sec:.1f}",
+            "# HELP gateway_degradation_tier Degradation tier per priority class (0 = none)",
+            "# TYPE gateway_degradation_tier gauge",
+            *(f'gateway_degradation_tier{{class="{name}"}} {t}' for name, t in self.tier.items()),
+            "# HELP gateway_degraded_requests_total Requests whose max_tokens was capped",
+            "# TYPE gateway_degraded_requests_total counter",
+            *(f'gateway_degraded_requests_total{{class="{name}"}} {n}' for name, n in self.degraded.items()),
+        ]
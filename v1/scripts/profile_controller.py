@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Worker-level degradation: move the worker down / up the profile ladder.
+
+The request-level ladder (scripts/policies.py) can only trim max_tokens;
+max_num_seqs, max_num_batched_tokens and max_model_len need a worker restart.
+ProfileController watches overload signals every PROFILE_SCRAPE_SEC and, when
+they stay bad, restarts the worker on the next safer profile through the
+blue/green swap (scripts/hotswap.py), without an outage when the GPU has room for both:
+
+  signal               source                                  overload when >
+  queue_depth          gateway queue depth (queue + in flight) DOWNSHIFT_QUEUE_DEPTH
+  latency_ms           EWMA upstream latency of the worker     DOWNSHIFT_LATENCY_MS
+  kv_cache_usage       vLLM /metrics kv_cache_usage_perc       DOWNSHIFT_KV_USAGE
+  preemptions_per_sec  vLLM /metrics num_preemptions_total     DOWNSHIFT_PREEMPTIONS_PER_SEC
+
+Hysteresis:
+  down  any signal over its threshold for DOWNSHIFT_AFTER_SEC -> next safer profile
+  up    every signal under UPSHIFT_HEADROOM x its threshold for UPSHIFT_AFTER_SEC
+        -> next profile towards the ceiling
+  no decision within PROFILE_COOLDOWN_SEC of the previous one or while a swap runs.
+  A shift that fails (swap failed / rolled back, or could not start) is retried
+  only after a backoff: PROFILE_COOLDOWN_SEC doubled per consecutive failure, up
+  to PROFILE_FAILURE_BACKOFF_MAX_SEC; a completed shift resets it.
+
+A downshift fires while the worker is overloaded, and on one GPU the swap runs
+stop-start (scripts/hotswap.py: blue and green gpu_memory_utilization over 1.0),
+so requests wait for the new worker's cold start during the shift.
+
+The ceiling is the profile the operator chose (WORKER_PROFILE or the last
+manual POST /admin/profile): the controller never goes above it. Decisions are
+logged, kept in GET /admin/profile ("auto") and exported as
+gateway_profile_shifts_total / gateway_profile_controller_*.
+
+Env:
+  AUTO_PROFILE                    1 = enable (needs ENABLE_SUPERVISOR and WORKER_PROFILE on the ladder)
+  PROFILE_LADDER                  Profiles, most aggressive first (default aggressive,throughput,safe)
+  PROFILE_SCRAPE_SEC              Evaluation period (default 5)
+  DOWNSHIFT_QUEUE_DEPTH           Queue depth threshold (default 64)
+  DOWNSHIFT_LATENCY_MS            Latency threshold (default SLO_P95_MS or 5000)
+  DOWNSHIFT_KV_USAGE              KV-cache usage threshold, 0..1 (default 0.95)
+  DOWNSHIFT_PREEMPTIONS_PER_SEC   Preemption rate threshold (default 1)
+  DOWNSHIFT_AFTER_SEC             Sustained overload before a downshift (default 60)
+  UPSHIFT_AFTER_SEC               Sustained headroom before an upshift (default 600)
+  UPSHIFT_HEADROOM                Fraction of every threshold counted as headroom (default 0.5)
+  PROFILE_COOLDOWN_SEC            Min seconds between decisions (default 300)
+  PROFILE_FAILURE_BACKOFF_MAX_SEC Longest wait before retrying after failed shifts (default 3600)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+import httpx
+
+from scripts.hotswap import ProfileSwapper
+from scripts.metrics import parse_totals
+from scripts.supervisor import Supervisor, WorkerState
+from scripts.upstream import UpstreamPool
+
+logger = logging.getLogger(__name__)
+
+SIGNALS = ("queue_depth", "latency_ms", "kv_cache_usage", "preemptions_per_sec")
+
+
+@dataclass
+class ControllerConfig:
+    """Ladder, thresholds and timing of the profile controller."""
+
+    enabled: bool = False
+    ladder: tuple[str, ...] = ("aggressive", "throughput", "safe")
+    scrape_sec: float = 5.0
+    queue_depth: float = 64.0
+    latency_ms: float = 5000.0
+    kv_cache_usage: float = 0.95
+    preemptions_per_sec: float = 1.0
+    downshift_after_sec: float = 60.0
+    upshift_after_sec: float = 600.0
+    upshift_headroom: float = 0.5
+    cooldown_sec: float = 300.0
+    failure_backoff_max_sec: float = 3600.0
+
+    @classmethod
+    def from_env(cls) -> ControllerConfig:
+        raw = os.environ.get("PROFILE_LADDER", "aggressive,throughput,safe")
+        ladder = tuple(p.strip() for p in raw.split(",") if p.strip())
+        return cls(
+            enabled=os.environ.get("AUTO_PROFILE", "").lower() in ("1", "true", "yes"),
+            ladder=ladder,
+            scrape_sec=float(os.environ.get("PROFILE_SCRAPE_SEC", "5")),
+            queue_depth=float(os.environ.get("DOWNSHIFT_QUEUE_DEPTH", "64")),
+            latency_ms=float(os.environ.get("DOWNSHIFT_LATENCY_MS", os.environ.get("SLO_P95_MS", "5000"))),
+            kv_cache_usage=float(os.environ.get("DOWNSHIFT_KV_USAGE", "0.95")),
+            preemptions_per_sec=float(os.environ.get("DOWNSHIFT_PREEMPTIONS_PER_SEC", "1")),
+            downshift_after_sec=float(os.environ.get("DOWNSHIFT_AFTER_SEC", "60")),
+            upshift_after_sec=float(os.environ.get("UPSHIFT_AFTER_SEC", "600")),
+            upshift_headroom=float(os.environ.get("UPSHIFT_HEADROOM", "0.5")),
+            cooldown_sec=float(os.environ.get("PROFILE_COOLDOWN_SEC", "300")),
+            failure_backoff_max_sec=float(os.environ.get("PROFILE_FAILURE_BACKOFF_MAX_SEC", "3600")),
+        )
+
+    def threshold(self, signal: str) -> float:
+        return getattr(self, signal)
+
+
+class ProfileController:
+    """Sustained-overload downshift / sustained-headroom upshift along the profile ladder."""
+
+    def __init__(
+        self,
+        config: ControllerConfig,
+        swapper: ProfileSwapper,
+        get_active: Callable[[], Supervisor],
+        pool: UpstreamPool,
+        queue_depth: Callable[[], int],
+    ) -> None:
+        self.config = config
+        self.swapper = swapper
+        self._get_active = get_active
+        self.pool = pool
+        self._queue_depth = queue_depth
+        self.signals: dict[str, float] = {s: 0.0 for s in SIGNALS}
+        self.over: list[str] = []  # signals over threshold at the last evaluation
+        self.ceiling = get_active().profile_name  # operator's choice: never upshift past it
+        self._expected = self.ceiling  # profile the controller believes is running
+        self._over_since: float | None = None
+        self._headroom_since: float | None = None
+        self._last_decision = -float("inf")
+        self._preempt_prev: tuple[float, float] | None = None  # (monotonic, counter)
+        self.decisions: collections.deque[dict] = collections.deque(maxlen=50)
+        self.shifts = {"down": 0, "up": 0}
+        self.scrape_failures = 0
+        self.failed_shifts = 0
+        self._consecutive_failures = 0
+        self._retry_at = -float("inf")  # no shift before this (backoff after a failed one)
+        self._task: asyncio.Task | None = None
+
+    async def _scrape(self, client: httpx.AsyncClient, active: Supervisor, now: float) -> None:
+        """Update the signals from the gateway and the worker's /metrics."""
+        self.signals["queue_depth"] = float(self._queue_depth())
+        ep = self.pool.endpoint(active.worker_url)
+        self.signals["latency_ms"] = ep.ewma_latency_sec * 1000 if ep is not None else 0.0
+        try:
+            r = await client.get(f"{active.worker_url}/metrics", timeout=5.0)
+            r.raise_for_status()
+        except httpx.HTTPError as e:
+            self.scrape_failures += 1
+            logger.debug("Profile controller: scrape failed: %s", e)
+            return
+        totals = parse_totals(r.text)
+        # vLLM v1 name first, v0 (gpu_cache_usage_perc) as fallback
+        kv = totals.get("vllm:kv_cache_usage_perc", totals.get("vllm:gpu_cache_usage_perc", 0.0))
+        self.signals["kv_cache_usage"] = kv
+        preempted = totals.get("vllm:num_preemptions_total", totals.get("vllm:num_preemptions", 0.0))
+        if self._preempt_prev is not None and preempted >= self._preempt_prev[1] and now > self._preempt_prev[0]:
+            self.signals["preemptions_per_sec"] = (preempted - self._preempt_prev[1]) / (now - self._preempt_prev[0])
+        else:
+            self.signals["preemptions_per_sec"] = 0.0  # first sample or worker restarted
+        self._preempt_prev = (now, preempted)
+
+    def _decide(self, now: float, current: str) -> tuple[str, str] | None:
+        """(target profile, reason) when a shift is due, else None."""
+        cfg = self.config
+        self.over = [s for s in SIGNALS if cfg.threshold(s) > 0 and self.signals[s] > cfg.threshold(s)]
+        headroom = all(self.signals[s] < cfg.upshift_headroom * cfg.threshold(s) for s in SIGNALS if cfg.threshold(s) > 0)
+        self._over_since = (self._over_since or now) if self.over else None
+        self._headroom_since = (self._headroom_since or now) if headroom else None
+        if now - self._last_decision < cfg.cooldown_sec or now < self._retry_at:
+            return None
+        pos = cfg.ladder.index(current)
+        if self._over_since is not None and now - self._over_since >= cfg.downshift_after_sec:
+            if pos + 1 < len(cfg.ladder):
+                return cfg.ladder[pos + 1], "overload: " + ", ".join(
+                    f"{s}={self.signals[s]:.2f}>{cfg.threshold(s):g}" for s in self.over
+                )
+        ceiling = cfg.ladder.index(self.ceiling) if self.ceiling in cfg.ladder else 0
+        if self._headroom_since is not None and now - self._headroom_since >= cfg.upshift_after_sec and pos > ceiling:
+            return cfg.ladder[pos - 1], f"headroom for {now - self._headroom_since:.0f}s"
+        return None
+
+    def evaluate(self, now: float) -> None:
+        """One decision on the current signals (scrape first)."""
+        active = self._get_active()
+        current = active.profile_name
+        if current != self._expected:
+            last = self.swapper.last
+            if last is not None and last.to_profile == self._expected and last.result != "done":
+                self._expected = current
+                self._shift_failed(now, f"shift to {last.to_profile} {last.result} ({last.reason})")
+            else:
+                # Changed by hand (POST /admin/profile): that is the new ceiling
+                logger.info("Profile controller: operator switched to %s, new ceiling", current)
+                self.ceiling = self._expected = current
+        elif self._consecutive_failures and self.swapper.last is not None and self.swapper.last.result == "done":
+            self._consecutive_failures = 0
+        if current not in self.config.ladder:
+            return
+        decision = self._decide(now, current)
+        if decision is None:
+            return
+        target, reason = decision
+        direction = "down" if self.config.ladder.index(target) > self.config.ladder.index(current) else "up"
+        try:
+            self.swapper.start(target)
+        except (RuntimeError, ValueError) as e:
+            self._shift_failed(now, f"cannot shift {current} -> {target}: {e}")
+            return
+        self._expected = target
+        self._last_decision = now
+        self._over_since = self._headroom_since = None
+        self._preempt_prev = None
+        self.shifts[direction] += 1
+        record = {
+            "time": time.time(),
+            "from": current,
+            "to": target,
+            "direction": direction,
+            "reason": reason,
+            "signals": {k: round(v, 3) for k, v in self.signals.items()},
+        }
+        self.decisions.append(record)
+        logger.warning("Profile controller: %sshift %s -> %s (%s)", direction, current, target, reason)
+
+    def _shift_failed(self, now: float, reason: str) -> None:
+        """Back off before the next attempt: cooldown x 2^(failures - 1), capped."""
+        self.failed_shifts += 1
+        self._consecutive_failures += 1
+        backoff = min(
+            self.config.failure_backoff_max_sec,
+            self.config.cooldown_sec * 2 ** (self._consecutive_failures - 1),
+        )
+        self._retry_at = now + backoff
+        self._over_since = self._headroom_since = None
+        logger.warning(
+            "Profile controller: %s; %d failure(s) in a row, next shift in %.0fs",
+            reason, self._consecutive_failures, backoff,
+        )
+
+    async def _run(self) -> None:
+        async with httpx.AsyncClient() as client:
+            while True:
+                try:
+                    await asyncio.sleep(self.config.scrape_sec)
+                    active = self._get_active()
+                    if self.swapper.running or active.state != WorkerState.RUNNING:
+                        # Nothing to measure (scaled to zero / mid-swap): start the clocks afresh
+                        self._over_since = self._headroom_since = None
+                        self._preempt_prev = None
+                        continue
+                    now = time.monotonic()
+                    await self._scrape(client, active, now)
+                    self.evaluate(now)
+                except asyncio.CancelledError:
+                    break
+                except Exception as e:
+                    logger.exception("Profile controller error: %s", e)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+        logger.info("Profile controller started: ladder=%s ceiling=%s", self.config.ladder, self.ceiling)
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        return {
+            "ladder": list(self.config.ladder),
+            "ceiling": self.ceiling,
+            "signals": {k: round(v, 3) for k, v in self.signals.items()},
+            "over": self.over,
+            "failed_shifts": self.failed_shifts,
+            "retry_in_sec": round(max(0.0, self._retry_at - time.monotonic())),
+            "decisions": list(self.decisions),
+        }
+
+    def metrics_lines(self) -> list[str]:
+        return [
+            "# HELP gateway_profile_controller_signal Overload signals watched by the profile controller",
+            "# TYPE gateway_profile_controller_signal gauge",
+            *(f'gateway_profile_controller_signal{{signal="{s}"}} {v:.4f}' for s, v in self.signals.items()),
+            "# HELP gateway_profile_controller_overloaded 1 while any signal is over its downshift threshold",
+            "# TYPE gateway_profile_controller_overloaded gauge",
+            f"gateway_profile_controller_overloaded {int(bool(self.over))}",
+            "# HELP gateway_profile_shifts_total Automatic profile changes by direction",
+            "# TYPE gateway_profile_shifts_total counter",
+            *(f'gateway_profile_shifts_total{{direction="{d}"}} {n}' for d, n in self.shifts.items()),
+            "# HELP gateway_profile_shift_failures_total Automatic profile changes that failed or rolled back",
+            "# TYPE gateway_profile_shift_failures_total counter",
+            f"gateway_profile_shift_failures_total {self.failed_shifts}",
+            "# HELP gateway_profile_controller_backoff_seconds Seconds until a shift may be retried after failures",
+            "# TYPE gateway_profile_controller_backoff_seconds gauge",
+            f"gateway_profile_controller_backoff_seconds {max(0.0, self._retry_at - time.monotonic()):.0f}",
+            "# HELP gateway_profile_controller_scrape_failures_total Failed scrapes of the worker's /metrics",
+            "# TYPE gateway_profile_controller_scrape_failures_total counter",
+            f"gateway_profile_controller_scrape_failures_total {self.scrape_failures}",
+        ]
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Per-tenant rate limiting: token buckets for requests/s and tokens/s per API key.
+
+Admission (scripts/policies.py) protects the worker as a whole; one noisy client
+can still fill the queue. Every tenant (API key from "Authorization: Bearer",
+else the client IP) gets two buckets, checked together and charged only if both
+have room:
+  - requests  RATE_LIMIT_RPS per second, up to RATE_LIMIT_BURST at once
+  - tokens    RATE_LIMIT_TPS estimated prompt + max_tokens per second, up to
+              RATE_LIMIT_TOKEN_BURST (estimate from scripts/tokens.py)
+Buckets refill lazily on access (no background task), so a decision is O(1).
+
+Backends (RATE_LIMIT_BACKEND):
+  memory  per-process dict, least recently seen tenant evicted past RATE_LIMIT_MAX_KEYS
+  redis   shared by all gateway replicas (v2/k8s/redis.yaml); one Lua script per
+          decision refills and charges both buckets atomically. Needs the redis
+          package; falls back to memory if it is missing. If Redis is unreachable
+          requests are allowed (fail open) and counted as backend errors
+
+Tenant ids in metrics and logs are a short hash of the API key, never the key.
+
+Env:
+  RATE_LIMIT_RPS          Requests/s per tenant (default 0 = no request limit)
+  RATE_LIMIT_BURST        Request bucket size (default 2 x RPS, at least 1)
+  RATE_LIMIT_TPS          Tokens/s per tenant (default 0 = no token limit)
+  RATE_LIMIT_TOKEN_BURST  Token bucket size (default 10 x TPS)
+  RATE_LIMIT_KEYS         api_key:rps:tps,... per-key overrides (0 = unlimited)
+  RATE_LIMIT_BACKEND      memory | redis (default memory)
+  RATE_LIMIT_REDIS_URL    redis://host:6379/0 (default redis://localhost:6379/0)
+  RATE_LIMIT_MAX_KEYS     Tenants kept in memory (default 10000)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+RESULTS = ("allowed", "limited_requests", "limited_tokens")
+
+
+@dataclass
+class TenantLimit:
+    """Refill rates and bucket sizes for one tenant (rate 0 = unlimited)."""
+
+    rps: float = 0.0
+    burst: float = 1.0
+    tps: float = 0.0
+    token_burst: float = 0.0
+
+    @classmethod
+    def of(cls, rps: float, tps: float, burst: float = 0.0, token_burst: float = 0.0) -> TenantLimit:
+        return cls(
+            rps=rps,
+            burst=burst or max(1.0, 2 * rps),
+            tps=tps,
+            token_burst=token_burst or 10 * tps,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.rps > 0 or self.tps > 0
+
+
+@dataclass
+class RateLimitConfig:
+    """Default per-tenant limit, per-key overrides and the bucket backend."""
+
+    default: TenantLimit = field(default_factory=TenantLimit)
+    keys: dict[str, TenantLimit] = field(default_factory=dict)
+    backend: str = "memory"
+    redis_url: str = "redis://localhost:6379/0"
+    max_keys: int = 10000
+
+    @classmethod
+    def from_env(cls) -> RateLimitConfig:
+        default = TenantLimit.of(
+            rps=float(os.environ.get("RATE_LIMIT_RPS", "0")),
+            tps=float(os.environ.get("RATE_LIMIT_TPS", "0")),
+            burst=float(os.environ.get("RATE_LIMIT_BURST", "0")),
+            token_burst=float(os.environ.get("RATE_LIMIT_TOKEN_BURST", "0")),
+        )
+        backend = os.environ.get("RATE_LIMIT_BACKEND", "memory").lower()
+        if backend not in ("memory", "redis"):
+            raise ValueError(f"unknown RATE_LIMIT_BACKEND {backend!r} (expected memory or redis)")
+        return cls(
+            default=default,
+            keys=parse_key_limits(os.environ.get("RATE_LIMIT_KEYS", ""), default),
+            backend=backend,
+            redis_url=os.environ.get("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0"),
+            max_keys=int(os.environ.get("RATE_LIMIT_MAX_KEYS", "10000")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.default.enabled or any(limit.enabled for limit in self.keys.values())
+
+
+def parse_key_limits(spec: str, default: TenantLimit) -> dict[str, TenantLimit]:
+    """Parse "api_key:rps:tps,..."; a missing field keeps the default rate."""
+    out = {}
+    for item in spec.split(","):
+        parts = [p.strip() for p in item.split(":")]
+        if not parts[0]:
+            continue
+        rps = float(parts[1]) if len(parts) > 1 and parts[1] else default.rps
+        tps = float(parts[2]) if len(parts) > 2 and parts[2] else default.tps
+        out[parts[0]] = TenantLimit.of(rps, tps)
+    return out
+
+
+def tenant_of(headers: Any, client_host: str | None) -> tuple[str, str]:
+    """(api_key or "", tenant id): the id hashes the key so it can go into metrics."""
+    auth = headers.get("authorization") or ""
+    api_key = auth[7:].strip() if auth.lower().startswith("bearer ") else ""
+    if api_key:
+        return api_key, "key-" + hashlib.blake2b(api_key.encode(), digest_size=4).hexdigest()
+    return "", f"ip-{client_host or 'unknown'}"
+
+
+@dataclass
+class RateDecision:
+    """Outcome of one check; retry_after_sec is when the short bucket has room again."""
+
+    allowed: bool
+    result: str = "allowed"
+    retry_after_sec: int = 0
+
+
+def _take(state: list[float], now: float, limit: TenantLimit, tokens: int) -> RateDecision:
+    """
+    Refill both buckets to `now` and charge 1 request + `tokens` if both have room.
+    state = [request_level, token_level, last_refill]; mirrored by _REDIS_TAKE.
+    """
+    elapsed = max(0.0, now - state[2])
+    state[0] = min(limit.burst, state[0] + elapsed * limit.rps)
+    state[1] = min(limit.token_burst, state[1] + elapsed * limit.tps)
+    state[2] = now
+    if limit.rps > 0 and state[0] < 1:
+        return RateDecision(False, "limited_requests", max(1, math.ceil((1 - state[0]) / limit.rps)))
+    # A request larger than the whole bucket is admitted once the bucket is full
+    need = min(tokens, limit.token_burst)
+    if limit.tps > 0 and state[1] < need:
+        return RateDecision(False, "limited_tokens", max(1, math.ceil((need - state[1]) / limit.tps)))
+    if limit.rps > 0:
+        state[0] -= 1
+    if limit.tps > 0:
+        state[1] -= need
+    return RateDecision(True)
+
+
+class MemoryBuckets:
+    """Buckets in this process; O(1) per decision, LRU-bounded to max_keys tenants."""
+
+    name = "memory"
+
+    def __init__(self, max_keys: int = 10000) -> None:
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, list[float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    async def take(self, tenant: str, limit: TenantLimit, tokens: int) -> RateDecision:
+        now = time.monotonic()
+        state = self._buckets.get(tenant)
+        if state is None:
+            state = [limit.burst, limit.token_burst, now]  # new tenants start with full buckets
+            self._buckets[tenant] = state
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(tenant)
+        return _take(state, now, limit, tokens)
+
+    async def aclose(self) -> None:
+        pass
+
+
+# Same algorithm as _take, atomic in Redis. KEYS[1] = tenant hash;
+# ARGV = now, rps, burst, tps, token_burst, tokens. Returns {allowed, result index, retry_after}.
+_REDIS_TAKE = """
+local now, rps, burst = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tps, tburst, tokens = tonumber(ARGV[4]), tonumber(ARGV[5]), tonumber(ARGV[6])
+local s = redis.call('HMGET', KEYS[1], 'r', 't', 'ts')
+local r, t, ts = tonumber(s[1]) or burst, tonumber(s[2]) or tburst, tonumber(s[3]) or now
+local elapsed = math.max(0, now - ts)
+r = math.min(burst, r + elapsed * rps)
+t = math.min(tburst, t + elapsed * tps)
+local need = math.min(tokens, tburst)
+local res, retry = 0, 0
+if rps > 0 and r < 1 then
+  res, retry = 1, math.ceil((1 - r) / rps)
+elseif tps > 0 and t < need then
+  res, retry = 2, math.ceil((need - t) / tps)
+else
+  if rps > 0 then r = r - 1 end
+  if tps > 0 then t = t - need end
+end
+redis.call('HSET', KEYS[1], 'r', tostring(r), 't', tostring(t), 'ts', tostring(now))
+local full = 1
+if rps > 0 then full = math.max(full, burst / rps) end
+if tps > 0 then full = math.max(full, tburst / tps) end
+redis.call('EXPIRE', KEYS[1], math.ceil(full) + 1)
+return {res == 0 and 1 or 0, res, math.max(1, retry)}
+"""
+
+
+class RedisBuckets:
+    """Buckets shared by every gateway replica through one Redis."""
+
+    name = "redis"
+    PREFIX = "gateway:ratelimit:"
+
+    def __init__(self, url: str) -> None:
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url)
+        self._script = self._redis.register_script(_REDIS_TAKE)
+        self.errors = 0
+
+    def __len__(self) -> int:
+        return 0  # kept in Redis (keys expire once their buckets are full again)
+
+    async def take(self, tenant: str, limit: TenantLimit, tokens: int) -> RateDecision:
+        try:
+            # Wall clock: replicas share the bucket, monotonic clocks are per host
+            allowed, res, retry = await self._script(
+                keys=[self.PREFIX + tenant],
+                args=[time.time(), limit.rps, limit.burst, limit.tps, limit.token_burst, tokens],
+            )
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Rate limit backend error (allowing request): %s", e)
+            return RateDecision(True)
+        if allowed:
+            return RateDecision(True)
+        return RateDecision(False, RESULTS[int(res)], int(retry))
+
+    async def aclose(self) -> None:
+        await self._redis.aclose()
+
+
+def make_backend(config: RateLimitConfig) -> MemoryBuckets | RedisBuckets:
+    if config.backend == "redis":
+        try:
+            return RedisBuckets(config.redis_url)
+        except ImportError:
+            logger.warning("RATE_LIMIT_BACKEND=redis needs the redis package; using per-process buckets")
+    return MemoryBuckets(config.max_keys)
+
+
+class RateLimiter:
+    """Per-tenant decisions on top of a bucket backend, with per-tenant counters."""
+
+    def __init__(self, config: RateLimitConfig) -> None:
+        self.config = config
+        self.backend = make_backend(config)
+        # {tenant id: {result: n}}; same bound as the memory buckets
+        self.decisions: OrderedDict[str, dict[str, int]] = OrderedDict()
+
+    def limit_for(self, api_key: str) -> TenantLimit:
+        return self.config.keys.get(api_key, self.config.default) if api_key else self.config.default
+
+    async def check(self, headers: Any, client_host: str | None, tokens: int) -> RateDecision:
+        api_key, tenant = tenant_of(headers, client_host)
+        limit = self.limit_for(api_key)
+        if not limit.enabled:
+            return RateDecision(True)
+        decision = await self.backend.take(tenant, limit, tokens)
+        counts = self.decisions.get(tenant)
+        if counts is None:
+            counts = self.decisions[tenant] = dict.fromkeys(RESULTS, 0)
+            if len(self.decisions) > self.config.max_keys:
+                self.decisions.popitem(last=False)
+        else:
+            self.decisions.move_to_end(tenant)
+        counts[decision.result] += 1
+        if not decision.allowed and counts[decision.result] == 1:
+            logger.info("Rate limiting tenant %s (%s)", tenant, decision.result)
+        return decision
+
+    async def aclose(self) -> None:
+        await self.backend.aclose()
+
+    def metrics_lines(self) -> list[str]:
+        lines = [
+            "# HELP gateway_rate_limit_decisions_total Per-tenant rate limiter decisions",
+            "# TYPE gateway_rate_limit_decisions_total counter",
+            *(
+                f'gateway_rate_limit_decisions_total{{tenant="{tenant}",result="{result}"}} {n}'
+                for tenant, counts in self.decisions.items()
+                for result, n in counts.items()
+            ),
+            "# HELP gateway_rate_limit_tenants Tenants with buckets in this process",
+            "# TYPE gateway_rate_limit_tenants gauge",
+            f'gateway_rate_limit_tenants{{backend="{self.backend.name}"}} {len(self.backend)}',
+        ]
+        if isinstance(self.backend, RedisBuckets):
+            lines.extend([
+                "# HELP gateway_rate_limit_backend_errors_total Redis errors (requests allowed)",
+                "# TYPE gateway_rate_limit_backend_errors_total counter",
+                f"gateway_rate_limit_backend_errors_total {self.backend.errors}",
+            ])
+        return lines
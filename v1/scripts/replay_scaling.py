@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Replay request traces against scale-to-zero policies and compare cold starts
+and GPU-on time:
+
+  reactive    current Supervisor: start on the first request, stop after a
+              fixed IDLE_TIMEOUT_SEC
+  predictive  scripts/forecast.PredictivePolicy: prewarm ahead of forecast
+              traffic, idle timeout scaled by the forecast (FORECAST_* /
+              PREWARM_* / PREDICTIVE_IDLE_* env apply)
+
+Traces (--trace, repeatable, replayed in time order):
+  - locust *_stats_history.csv (arrivals from "Total Request Count" deltas)
+  - CSV with a "timestamp" column, or plain text with one epoch timestamp per line
+Without --trace a synthetic diurnal trace (working-hours bursts, quiet nights)
+of --synthetic-days is generated from --seed.
+
+Usage:
+  python scripts/replay_scaling.py
+  python scripts/replay_scaling.py --trace experiments/runs/locust_*_stats_history.csv --cold-start-sec 45
+
+Saves experiments/runs/replay_scaling_<timestamp>.json.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import math
+import random
+import sys
+import time
+from dataclasses import replace
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+OUT_DIR = REPO_ROOT / "experiments" / "runs"
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.forecast import ForecastConfig, PredictivePolicy  # noqa: E402
+
+
+def load_trace(path: Path) -> list[float]:
+    """Arrival timestamps (epoch seconds) from one trace file."""
+    with path.open() as f:
+        first = f.readline()
+        f.seek(0)
+        if "," not in first:
+            return [float(line) for line in f if line.strip()]
+        rows = list(csv.DictReader(f))
+    if rows and "Total Request Count" in rows[0]:
+        arrivals: list[float] = []
+        prev = 0
+        for row in rows:
+            if row.get("Name") != "Aggregated":
+                continue
+            total = int(row["Total Request Count"])
+            n, prev = max(0, total - prev), total
+            ts = float(row["Timestamp"])
+            # Spread the second's requests evenly over that second
+            arrivals.extend(ts + i / n for i in range(n))
+        return arrivals
+    return [float(row["timestamp"]) for row in rows]
+
+
+def synthetic_trace(days: int, seed: int, start: float) -> list[float]:
+    """Poisson arrivals: busy 09-18h with bursts, sparse evenings, near silent nights."""
+    rng = random.Random(seed)
+    arrivals = []
+    t = start
+    end = start + days * 86400
+    while t < end:
+        hour = time.localtime(t).tm_hour
+        if 9 <= hour < 18:
+            rate = 0.5 if rng.random() < 0.02 else 0.05  # req/s, occasional burst minute
+        elif 18 <= hour < 23:
+            rate = 0.005
+        else:
+            rate = 0.0003
+        minute_end = t + 60
+        while True:
+            t += rng.expovariate(rate)
+            if t >= minute_end:
+                t = minute_end
+                break
+            arrivals.append(t)
+    return arrivals
+
+
+class _Worker:
+    """Simulated worker: off -> starting (cold_start_sec) -> on; tracks GPU-on time."""
+
+    def __init__(self, cold_start_sec: float) -> None:
+        self.cold_start_sec = cold_start_sec
+        self.on_since: float | None = None  # process up (starting or on)
+        self.ready_at = 0.0
+        self.gpu_on_sec = 0.0
+
+    @property
+    def off(self) -> bool:
+        return self.on_since is None
+
+    def start(self, at: float) -> None:
+        self.on_since, self.ready_at = at, at + self.cold_start_sec
+
+    def stop(self, at: float) -> None:
+        self.gpu_on_sec += at - self.on_since
+        self.on_since = None
+
+
+def simulate(
+    arrivals: list[float],
+    cold_start_sec: float,
+    idle_timeout_sec: float,
+    policy: PredictivePolicy | None = None,
+    check_sec: float = 30.0,
+) -> dict:
+    """Replay one policy: supervisor checks every check_sec, requests start a cold worker."""
+    worker = _Worker(cold_start_sec)
+    last_activity: float | None = None
+    cold_starts = prewarm_starts = 0
+    waits: list[float] = []
+    next_check = arrivals[0]
+
+    def idle_timeout(at: float) -> float:
+        return policy.idle_timeout(at, idle_timeout_sec) if policy else idle_timeout_sec
+
+    def run_checks(until: float) -> None:
+        nonlocal next_check, last_activity, prewarm_starts
+        while next_check <= until:
+            t = next_check
+            next_check += check_sec
+            predicted = policy is not None and policy.should_prewarm(t)
+            if worker.off:
+                if predicted:
+                    worker.start(t)
+                    last_activity = t
+                    prewarm_starts += 1
+            elif not predicted and t - last_activity >= idle_timeout(t):
+                worker.stop(t)
+
+    for ts in arrivals:
+        run_checks(ts)
+        if policy:
+            policy.record(ts)
+        if worker.off:
+            worker.start(ts)
+            cold_starts += 1
+        if ts < worker.ready_at:
+            waits.append(worker.ready_at - ts)
+        last_activity = ts
+    # Let the last idle period play out
+    run_checks(arrivals[-1] + max(idle_timeout_sec, 3600.0))
+    if not worker.off:
+        worker.stop(next_check)
+
+    waits.sort()
+    span = arrivals[-1] - arrivals[0]
+    return {
+        "requests": len(arrivals),
+        "cold_starts": cold_starts,
+        "prewarm_starts": prewarm_starts,
+        "requests_delayed": len(waits),
+        "mean_wait_sec": round(sum(waits) / len(waits), 2) if waits else 0.0,
+        "p95_wait_sec": round(waits[int(0.95 * (len(waits) - 1))], 2) if waits else 0.0,
+        "gpu_on_hours": round(worker.gpu_on_sec / 3600, 3),
+        "gpu_on_fraction": round(worker.gpu_on_sec / span, 4) if span else 0.0,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Reactive vs predictive scale-to-zero on request traces")
+    parser.add_argument("--trace", type=Path, action="append", default=[])
+    parser.add_argument("--synthetic-days", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cold-start-sec", type=float, default=60.0)
+    parser.add_argument("--idle-timeout-sec", type=float, default=180.0, help="Reactive timeout / predictive base")
+    parser.add_argument("--check-sec", type=float, default=30.0, help="Supervisor re-evaluation period")
+    args = parser.parse_args()
+
+    if args.trace:
+        arrivals = sorted(t for path in args.trace for t in load_trace(path))
+        source = [str(p) for p in args.trace]
+    else:
+        day0 = math.floor(time.time() / 86400) * 86400
+        arrivals = synthetic_trace(args.synthetic_days, args.seed, day0)
+        source = f"synthetic:{args.synthetic_days}d seed={args.seed}"
+    if not arrivals:
+        print("Trace is empty", file=sys.stderr)
+        return 1
+
+    forecast_config = replace(ForecastConfig.from_env(), enabled=True)
+    results = {
+        "config": {**{k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items() if k != "trace"},
+                   "trace": source, "forecast": vars(forecast_config)},
+        "reactive": simulate(arrivals, args.cold_start_sec, args.idle_timeout_sec, None, args.check_sec),
+        "predictive": simulate(
+            arrivals, args.cold_start_sec, args.idle_timeout_sec, PredictivePolicy(forecast_config), args.check_sec
+        ),
+    }
+    for name in ("reactive", "predictive"):
+        r = results[name]
+        print(
+            f"{name:>10}: cold_starts={r['cold_starts']} prewarms={r['prewarm_starts']} "
+            f"delayed={r['requests_delayed']} (p95 wait {r['p95_wait_sec']}s) gpu_on={r['gpu_on_hours']}h"
+        )
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    out_file = OUT_DIR / f"replay_scaling_{time.strftime('%Y-%m-%d_%H%M%S')}.json"
+    out_file.write_text(json.dumps(results, indent=2))
+    print(f"Saved: {out_file}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
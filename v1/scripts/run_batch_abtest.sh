@@ -1,12 +1,16 @@
 #!/usr/bin/env bash
-# Milestone 5: A/B test batching window (0 vs 20 vs 50 ms).
+# Milestone 5: A/B test batching window (0 vs 20 vs 50 ms) and dynamic batching.
 #
 # Prerequisites: vLLM worker running (./scripts/run_vllm_worker.sh)
 #
 # Usage:
 #   ./scripts/run_batch_abtest.sh
+#   ABTEST_CONFIGS="fixed:20 dynamic:20" ./scripts/run_batch_abtest.sh
 #
-# Runs load test 3 times: window=0, 20, 50 ms. Saves results to experiments/runs/
+# Each config is MODE:WINDOW_MS. fixed = BATCH_WINDOW_MS window (original),
+# dynamic = size/wait/deadline scheduler with WINDOW_MS as BATCH_MAX_WAIT_MS
+# (BATCH_MAX_SIZE / MAX_IN_FLIGHT from env). Default runs fixed:0, fixed:20,
+# fixed:50, dynamic:20. Saves results to experiments/runs/locust_<mode>_<window>ms_*
 # and prints comparison.
 
 set -e
@@ -19,15 +23,25 @@ RUNTIME="${LOADTEST_RUNTIME:-2m}"  # Shorter for A/B test (3 runs)
 OUT_DIR="${LOADTEST_OUT_DIR:-$REPO_ROOT/experiments/runs}"
 mkdir -p "$OUT_DIR"
 
-echo "M5 A/B test: Batching window 0 vs 20 vs 50 ms"
+CONFIGS="${ABTEST_CONFIGS:-fixed:0 fixed:20 fixed:50 dynamic:20}"
+
+echo "M5 A/B test: ${CONFIGS}"
 echo "  Runtime per config: $RUNTIME"
 echo "  Ensure vLLM is running: ./scripts/run_vllm_worker.sh"
 echo ""
 
-for WINDOW in 0 20 50; do
-  echo "--- Window ${WINDOW} ms ---"
+for CONFIG in $CONFIGS; do
+  MODE="${CONFIG%%:*}"
+  WINDOW="${CONFIG##*:}"
+  echo "--- ${MODE} ${WINDOW} ms ---"
   # Start gateway in background
-  BATCH_WINDOW_MS=$WINDOW GATEWAY_PORT=$GATEWAY_PORT uvicorn scripts.gateway:app --host 0.0.0.0 --port $GATEWAY_PORT &
+  if [ "$MODE" = "dynamic" ]; then
+    BATCH_MODE=dynamic BATCH_WINDOW_MS=0 BATCH_MAX_WAIT_MS=$WINDOW GATEWAY_PORT=$GATEWAY_PORT \
+      uvicorn scripts.gateway:app --host 0.0.0.0 --port $GATEWAY_PORT &
+  else
+    BATCH_MODE=fixed BATCH_WINDOW_MS=$WINDOW GATEWAY_PORT=$GATEWAY_PORT \
+      uvicorn scripts.gateway:app --host 0.0.0.0 --port $GATEWAY_PORT &
+  fi
   GATEWAY_PID=$!
   # Wait for gateway ready
   for i in $(seq 1 10); do
@@ -35,12 +49,13 @@ for WINDOW in 0 20 50; do
     sleep 1
   done
   # Run load test
-  LOADTEST_RUNTIME=$RUNTIME ./scripts/run_loadtest.sh "http://localhost:${GATEWAY_PORT}"
+  LOADTEST_TAG="${MODE}_${WINDOW}ms" LOADTEST_RUNTIME=$RUNTIME ./scripts/run_loadtest.sh "http://localhost:${GATEWAY_PORT}"
   kill $GATEWAY_PID 2>/dev/null || true
   wait $GATEWAY_PID 2>/dev/null || true
   sleep 2
 done
 
 echo ""
-echo "Done. Compare RPS and p95 in: $OUT_DIR/locust_*_stats.csv"
+echo "Done. Compare RPS and p95 in: $OUT_DIR/locust_{fixed,dynamic}_*_stats.csv"
+echo "Gateway-side batch size / queue wait: gateway_batch_size, gateway_queue_wait_seconds on /metrics"
 echo "Guardrail: if p95 > SLO (e.g. 5s), reduce window (50->20, 20->0)."
@@ -12,11 +12,71 @@
 #
 # Env:
 #   BATCH_WINDOW_MS   Delay before forwarding (0, 20, 50)
+#   BATCH_MODE        fixed | dynamic (BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, MAX_IN_FLIGHT; see scripts/scheduler.py)
 #   VLLM_URL          vLLM worker URL (default http://localhost:8000)
+#   VLLM_URLS         Comma-separated worker URLs to load-balance over
+#                     (ROUTING_POLICY=least_outstanding|p2c|prefix_hash, EJECT_AFTER_FAILURES,
+#                     EJECT_SEC, PREFIX_HASH_CHARS, PREFIX_HASH_LOAD_FACTOR)
 #   GATEWAY_PORT      Gateway port (default 8001)
 #   ENABLE_SUPERVISOR 1 = scale-to-zero (start worker on demand, stop after idle)
 #   IDLE_TIMEOUT_SEC  Idle seconds before stopping worker (default 180)
-#   Q_MAX             Max queue depth before 429 (default 128)
+#   STANDBY_AFTER_SEC Idle seconds before the worker is put to sleep instead of stopped
+#                     (warm standby via vLLM sleep mode; default 0 = off), SLEEP_LEVEL 1|2
+#   MIN_WARM_WINDOWS  HH:MM-HH:MM[=running|standby],... keep the worker warm in these hours
+#   PREDICTIVE_SCALING 1 = prewarm ahead of forecast traffic, idle timeout follows the forecast
+#                     (scripts/forecast.py; compare on traces: python scripts/replay_scaling.py)
+#   WORKER_POOL_MAX   >0 = gateway runs up to N worker processes (ports from WORKER_POOL_BASE_PORT)
+#                     and autoscales them on queue depth: WORKER_POOL_MIN, SCALE_UP_PER_WORKER,
+#                     SCALE_DOWN_PER_WORKER, SCALE_UP_COOLDOWN_SEC, SCALE_DOWN_COOLDOWN_SEC
+#                     (see scripts/worker_pool.py); try it with WORKER_BACKEND=mock. Replicas split
+#                     VLLM_GPU_MEMORY_UTILIZATION per device; WORKER_POOL_GPUS=0,1 spreads them over GPUs
+#   WORKER_BACKEND    mock = stub worker (scripts/mock_vllm.py) for scale-to-zero tests;
+#                     python scripts/bench_cold_start.py measures TTFR per idle tier
+#   WORKER_PROFILE    safe | throughput | aggressive (configs/model_profiles) for the supervised worker;
+#                     swap live without downtime: curl -XPOST 'localhost:8001/admin/profile?name=throughput'
+#                     (blue/green: SWAP_STEPS, SWAP_STEP_SEC, SWAP_MAX_ERROR_RATE; see scripts/hotswap.py)
+#   AUTO_PROFILE      1 = downshift the worker profile (aggressive -> throughput -> safe) on sustained
+#                     queue depth / latency / KV-cache / preemption overload, upshift back on headroom
+#                     (DOWNSHIFT_*, UPSHIFT_*, PROFILE_COOLDOWN_SEC; failed shifts back off up to
+#                     PROFILE_FAILURE_BACKOFF_MAX_SEC; see scripts/profile_controller.py)
+#   WORKER_LOG_LINES  Managed worker output kept in memory (default 1000), see GET /admin/worker/logs;
+#                     DRAIN_TIMEOUT_SEC bounds the wait for in-flight requests before SIGTERM
+#   Q_MAX             Max queue depth before 429 (default 128); starting limit when adaptive
+#   ADMISSION_MODE    static | aimd | gradient — adapt the limit to upstream latency vs SLO_P95_MS
+#                     (ADMISSION_MIN_LIMIT, ADMISSION_MAX_LIMIT, ADMISSION_WINDOW_SAMPLES)
+#   UPSTREAM_MAX_CONNECTIONS / UPSTREAM_MAX_KEEPALIVE / UPSTREAM_KEEPALIVE_EXPIRY / UPSTREAM_HTTP2
+#                     Shared keep-alive pool to vLLM (see scripts/upstream.py)
+#   RESPONSE_CACHE    1 = exact-match cache for temperature=0 requests
+#                     (CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_TTL_SEC; see scripts/cache.py)
+#   COALESCE_REQUESTS 1 = identical in-flight temperature=0 requests share one upstream call
+#                     (same class, degradation tier and X-Deadline-Ms; each copy is still admitted)
+#   PRIORITY_CLASSES  name:weight:admit_share:degrade_share,... highest first
+#                     (default interactive:4:1.0:1.0,batch:1:0.5:0.5); pick per request with
+#                     the X-Priority header or PRIORITY_API_KEYS=key:class,...; PRIORITY_DEFAULT
+#   RATE_LIMIT_RPS / RATE_LIMIT_TPS  Per-tenant (API key, else client IP) requests/s and tokens/s
+#                     token buckets (RATE_LIMIT_BURST, RATE_LIMIT_TOKEN_BURST, RATE_LIMIT_KEYS=key:rps:tps);
+#                     RATE_LIMIT_BACKEND=redis shares them across replicas (see scripts/ratelimit.py)
+#   TOKEN_ADMISSION   1 = admit on estimated prompt + max_tokens against a token budget from the worker
+#                     profile (max_num_seqs x max_model_len x TOKEN_BUDGET_FACTOR, or TOKEN_BUDGET);
+#                     TOKEN_ESTIMATOR=chars|tokenizer, CHARS_PER_TOKEN. Prompts clearly over max_model_len
+#                     (MAX_MODEL_LEN_MARGIN, default 10% for chars): MAX_MODEL_LEN_POLICY=reject (400) |
+#                     truncate (see scripts/tokens.py). Off: requests reach vLLM unchanged
+#   DEGRADE_WAIT_START_SEC / DEGRADE_WAIT_FULL_SEC  Estimated queue wait (depth x tokens per request /
+#                     measured tokens/s) over which max_tokens shrinks from DEGRADE_MAX_TOKENS to
+#                     DEGRADE_MIN_TOKENS in DEGRADE_TIERS steps (default 4s..20s, 200..64, 8);
+#                     DEGRADE_HYSTERESIS, DEGRADE_POLICIES=class:start:full:min_tokens; the tier
+#                     is returned in the X-Degradation-Tier header (see scripts/policies.py)
+#   TRACE_SAMPLE_RATE / TRACE_SLOW_MS  Keep this fraction of request traces (default 0.01) plus every
+#                     request slower than TRACE_SLOW_MS (default 2000) or answered 5xx; GET /admin/traces,
+#                     TRACE_OTLP_FILE=path appends OTLP/JSON lines (written in the background every
+#                     TRACE_FLUSH_SEC, default 1), TRACING=0 off (see scripts/tracing.py)
+#   DEFAULT_DEADLINE_MS  Deadline when the client sends no X-Deadline-Ms (default 0 = none);
+#                     expired queued requests get 504, disconnected clients cancel upstream
+#
+# Offline: uvicorn scripts.mock_vllm:app --port 8000  (mock vLLM, no GPU)
+#          MOCK_ENGINE=batching uvicorn scripts.mock_vllm:app --port 8000  (GPU-like batching model,
+#                                             fitted by python scripts/fit_mock_model.py)
+#          python scripts/bench_upstream.py           (per-request client vs shared pool)
 #
 # Load test: ./scripts/run_loadtest.sh http://localhost:8001
 
@@ -32,12 +92,13 @@ IDLE_TIMEOUT_SEC="${IDLE_TIMEOUT_SEC:-180}"
 Q_MAX="${Q_MAX:-128}"
 
 echo "Starting gateway (M5+M6+M7)"
-echo "  Batch window: ${BATCH_WINDOW_MS} ms"
+echo "  Batch window: ${BATCH_WINDOW_MS} ms (mode: ${BATCH_MODE:-fixed})"
 echo "  Port: ${GATEWAY_PORT}"
 echo "  vLLM: ${VLLM_URL:-http://localhost:8000}"
 echo "  Supervisor (scale-to-zero): ${ENABLE_SUPERVISOR}"
 [ "$ENABLE_SUPERVISOR" = "1" ] && echo "  Idle timeout: ${IDLE_TIMEOUT_SEC}s"
-echo "  Q_MAX (admission): ${Q_MAX}"
+[ "${WORKER_POOL_MAX:-0}" != "0" ] && echo "  Worker pool: ${WORKER_POOL_MIN:-1}..${WORKER_POOL_MAX} replicas"
+echo "  Q_MAX (admission): ${Q_MAX} (mode: ${ADMISSION_MODE:-static})"
 echo ""
 echo "Load test: ./scripts/run_loadtest.sh http://localhost:${GATEWAY_PORT}"
 echo ""
@@ -1,5 +1,5 @@
 #!/usr/bin/env bash
-# Milestone 2: Run load test (fixed 200/200) and collect RPS, p50/p95, error rate.
+# Milestone 2: Run load test (fixed 200/200 or a SCENARIO) and collect RPS, p50/p95, error rate.
 # Requires: vLLM server running (e.g. ./scripts/run_vllm_worker.sh), and locust installed.
 #
 # Usage:
@@ -12,6 +12,10 @@
 #   LOADTEST_RUNTIME=10m  run duration (e.g. 1m, 10m)
 #   USE_RAMP_SHAPE=1      use ramp-up then constant shape (see loadtest/README.md)
 #   LOADTEST_OUT_DIR=     dir for CSV/HTML reports (default: experiments/runs)
+#   LOADTEST_TAG=         optional tag in report names (locust_<tag>_<scenario>_<timestamp>)
+#   SCENARIO=fixed_200_200  workload (loadtest/scenarios/registry.py), e.g. lognormal,
+#                         chat_summarize, shared_prefix, 'mix?shapes=200:200:0.7,1000:100:0.3';
+#                         SCENARIO_SEED, SCENARIO_POOL. The scenario tag goes into report names
 
 set -e
 
@@ -24,11 +28,14 @@ SPAWN_RATE="${LOADTEST_SPAWN_RATE:-2}"
 RUNTIME="${LOADTEST_RUNTIME:-10m}"
 OUT_DIR="${LOADTEST_OUT_DIR:-$REPO_ROOT/experiments/runs}"
 
+export SCENARIO="${SCENARIO:-fixed_200_200}"
+SCENARIO_TAG=$(cd loadtest && python -c 'import os; from scenarios.registry import scenario_tag; print(scenario_tag(os.environ["SCENARIO"]))')
+
 mkdir -p "$OUT_DIR"
 TIMESTAMP=$(date +%Y-%m-%d_%H%M%S)
-CSV_PREFIX="$OUT_DIR/locust_${TIMESTAMP}"
+CSV_PREFIX="$OUT_DIR/locust_${LOADTEST_TAG:+${LOADTEST_TAG}_}${SCENARIO_TAG}_${TIMESTAMP}"
 
-echo "Load test (Milestone 2) — fixed 200/200"
+echo "Load test (Milestone 2) — scenario $SCENARIO"
 echo "  Base URL:   $BASE_URL"
 echo "  Users:      $USERS"
 echo "  Spawn rate: $SPAWN_RATE/s"
@@ -0,0 +1,43 @@
+#!/usr/bin/env bash
+# Start N mock vLLM workers (scripts/mock_vllm.py) for offline multi-worker tests.
+#
+# Usage:
+#   ./scripts/run_mock_workers.sh            # 3 workers on :8000, :8002, :8003
+#   MOCK_WORKERS=4 MOCK_BASE_PORT=9000 ./scripts/run_mock_workers.sh
+#
+# Then point the gateway at them (printed below) and load test as usual:
+#   VLLM_URLS=http://localhost:8000,http://localhost:8002,http://localhost:8003 \
+#     ROUTING_POLICY=p2c ./scripts/run_gateway.sh
+#
+# Env:
+#   MOCK_WORKERS      Number of workers (default 3)
+#   MOCK_BASE_PORT    First port (default 8000); the gateway port 8001 is skipped
+#   MOCK_LATENCY_MS   Passed to every worker (see scripts/mock_vllm.py)
+#   MOCK_ENGINE       batching = continuous-batching performance model (see scripts/mock_vllm.py)
+#
+# Ctrl+C stops all workers.
+
+set -e
+
+REPO_ROOT="$(cd "$(dirname "$0")/.." && pwd)"
+cd "$REPO_ROOT"
+
+N="${MOCK_WORKERS:-3}"
+PORT="${MOCK_BASE_PORT:-8000}"
+GATEWAY_PORT="${GATEWAY_PORT:-8001}"
+
+PIDS=()
+URLS=()
+trap 'kill "${PIDS[@]}" 2>/dev/null || true' EXIT INT TERM
+
+for i in $(seq 1 "$N"); do
+  [ "$PORT" = "$GATEWAY_PORT" ] && PORT=$((PORT + 1))
+  uvicorn scripts.mock_vllm:app --host 0.0.0.0 --port "$PORT" --log-level warning &
+  PIDS+=($!)
+  URLS+=("http://localhost:${PORT}")
+  PORT=$((PORT + 1))
+done
+
+echo "Mock workers: ${N}"
+echo "  VLLM_URLS=$(IFS=,; echo "${URLS[*]}")"
+wait
@@ -12,6 +12,7 @@ MODEL="${1:-${VLLM_MODEL:-Qwen/Qwen2.5-0.5B-Instruct}}"
 HOST="${VLLM_HOST:-0.0.0.0}"
 PORT="${VLLM_PORT:-8000}"
 
+MAX_MODEL_LEN="${VLLM_MAX_MODEL_LEN:-512}"
 # Conservative for 4GB (and GPUs that report ~3.7 GiB): avoid OOM during sampler warmup
 MAX_NUM_SEQS="${VLLM_MAX_NUM_SEQS:-64}"
 GPU_MEM_UTIL="${VLLM_GPU_MEMORY_UTILIZATION:-0.85}"
@@ -22,7 +23,7 @@ ENABLE_CHUNKED_PREFILL="${VLLM_ENABLE_CHUNKED_PREFILL:-true}"
 echo "Starting vLLM worker (M1 baseline, M4 grid-ready)"
 echo "  Model: ${MODEL}"
 echo "  Host:  ${HOST}:${PORT}"
-echo "  Args:  --max-model-len 512 --max-num-seqs ${MAX_NUM_SEQS} --gpu-memory-utilization ${GPU_MEM_UTIL}"
+echo "  Args:  --max-model-len ${MAX_MODEL_LEN} --max-num-seqs ${MAX_NUM_SEQS} --gpu-memory-utilization ${GPU_MEM_UTIL}"
 [ -n "${MAX_NUM_BATCHED_TOKENS}" ] && echo "        --max-num-batched-tokens ${MAX_NUM_BATCHED_TOKENS}"
 [ "${ENABLE_CHUNKED_PREFILL}" = "true" ] && echo "        --enable-chunked-prefill"
 echo ""
@@ -34,7 +35,7 @@ EXTRA_ARGS=()
 vllm serve "${MODEL}" \
   --host "${HOST}" \
   --port "${PORT}" \
-  --max-model-len 512 \
+  --max-model-len "${MAX_MODEL_LEN}" \
   --max-num-seqs "${MAX_NUM_SEQS}" \
   --gpu-memory-utilization "${GPU_MEM_UTIL}" \
   "${EXTRA_ARGS[@]}"
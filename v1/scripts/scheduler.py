@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Milestone 5: Micro-batching scheduler for the gateway.
+
+Two modes (BATCH_MODE):
+- fixed:   original behaviour — first request opens a BATCH_WINDOW_MS window,
+           then every pending request is forwarded at once (no size cap).
+- dynamic: flush on whichever comes first: the batch reaches max_batch_size,
+           the oldest request has waited max_wait_ms, or a request's deadline
+           is due. Dispatch is capped at max_in_flight concurrent upstream
+           requests (match the worker's max_num_seqs so vLLM does not queue).
+
+Requests are queued per priority class (scripts/policies.PriorityClass) and
+released by weighted deficit round robin, so each class gets a share of every
+batch proportional to its weight.
+
+Deadlines: a request whose deadline passes while it is queued gets a 504 instead
+of being dispatched. If the caller cancels its future (client disconnected), the
+request is dropped from the queue, or its upstream call is cancelled if it was
+already dispatched. The max_tokens budget of every request dropped before
+dispatch is counted as tokens spared.
+
+Env:
+  BATCH_MODE          fixed | dynamic (default fixed)
+  BATCH_MAX_SIZE      dynamic: flush when this many requests are pending (default 32)
+  BATCH_MAX_WAIT_MS   dynamic: max wait of the oldest request (default BATCH_WINDOW_MS or 20)
+  MAX_IN_FLIGHT       dynamic: concurrent upstream cap (default VLLM_MAX_NUM_SEQS or 64)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from scripts import tracing
+from scripts.metrics import Histogram
+from scripts.policies import PriorityClass
+from scripts.tracing import Trace
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+# dispatch(body, deadline) -> (status_code, response_json); deadline is time.monotonic() or None
+Dispatch = Callable[[dict, "float | None"], Awaitable[tuple[int, dict]]]
+
+
+@dataclass
+class PendingRequest:
+    """Request waiting in batching queue."""
+
+    body: dict[str, Any]
+    received_at: float  # time.monotonic()
+    future: asyncio.Future
+    deadline: float | None = None  # time.monotonic(); dispatch no later than this
+    priority: str = "default"  # PriorityClass.name
+    trace: Trace | None = None  # caller's request trace, re-activated for dispatch
+
+
+@dataclass
+class SchedulerConfig:
+    """Batching policy knobs."""
+
+    mode: str = "fixed"
+    window_ms: float = 0.0
+    max_batch_size: int = 32
+    max_wait_ms: float = 20.0
+    max_in_flight: int = 64
+
+    @classmethod
+    def from_env(cls) -> SchedulerConfig:
+        window_ms = float(os.environ.get("BATCH_WINDOW_MS", "0"))
+        return cls(
+            mode=os.environ.get("BATCH_MODE", "fixed").lower(),
+            window_ms=window_ms,
+            max_batch_size=int(os.environ.get("BATCH_MAX_SIZE", "32")),
+            max_wait_ms=float(os.environ.get("BATCH_MAX_WAIT_MS", str(window_ms or 20))),
+            max_in_flight=int(os.environ.get("MAX_IN_FLIGHT", os.environ.get("VLLM_MAX_NUM_SEQS", "64"))),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        """False = gateway forwards directly (fixed mode with a 0 ms window)."""
+        return self.mode == "dynamic" or self.window_ms > 0
+
+
+def _token_budget(body: dict[str, Any]) -> int:
+    """Upper bound on tokens a request would have generated (its max_tokens)."""
+    try:
+        return int(body.get("max_tokens") or body.get("max_completion_tokens") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class BatchScheduler:
+    """
+    Queue requests and hand them to `dispatch` in batches.
+
+    One FIFO per priority class (highest priority first). Dynamic batches are
+    filled by deficit round robin: each round a class may release `weight`
+    requests, so a burst of low-priority traffic cannot starve the others.
+    """
+
+    def __init__(
+        self,
+        config: SchedulerConfig,
+        dispatch: Dispatch,
+        classes: list[PriorityClass] | None = None,
+    ) -> None:
+        if config.mode not in ("fixed", "dynamic"):
+            raise ValueError(f"unknown BATCH_MODE {config.mode!r} (expected fixed or dynamic)")
+        self.config = config
+        self._dispatch = dispatch
+        self.classes = classes or [PriorityClass(name="default")]
+        self._queues: dict[str, deque[PendingRequest]] = {c.name: deque() for c in self.classes}
+        self._deficit: dict[str, int] = {c.name: 0 for c in self.classes}
+        self._rr = 0  # DRR position (index into classes)
+        self._mid_quantum = False  # last _take stopped at the batch cap inside the current class's quantum
+        self._active = 0  # dispatched by this scheduler, not yet answered
+        self._wakeup = asyncio.Event()
+        self._slot_freed = asyncio.Event()
+        self._flush_task: asyncio.Task | None = None
+        self._loop_task: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self.shed: dict[str, int] = {c.name: 0 for c in self.classes}
+        self.expired: dict[str, int] = {c.name: 0 for c in self.classes}
+        self.cancelled = {"queued": 0, "dispatched": 0}
+        self.spared_tokens = 0
+        self.batch_size_hist = Histogram(
+            "gateway_batch_size", "Requests released per scheduler flush", BATCH_SIZE_BUCKETS
+        )
+        self.queue_wait_hist = {
+            c.name: Histogram(
+                "gateway_queue_wait_seconds",
+                "Time a request waited in the batching queue before dispatch",
+                labels={"class": c.name},
+            )
+            for c in self.classes
+        }
+
+    @property
+    def pending_count(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def class_depth(self, name: str) -> int:
+        return len(self._queues.get(name, ()))
+
+    def _iter_pending(self):
+        for q in self._queues.values():
+            yield from q
+
+    def start(self) -> None:
+        if self.config.mode == "dynamic" and self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._run_dynamic())
+        logger.info("Batch scheduler started: %s, classes=%s", self.config, [c.name for c in self.classes])
+
+    async def aclose(self) -> None:
+        """Stop the flush loop and fail whatever is still queued."""
+        for task in (self._loop_task, self._flush_task):
+            if task is not None and not task.done():
+                task.cancel()
+        for q in self._queues.values():
+            while q:
+                p = q.popleft()
+                if not p.future.done():
+                    p.future.set_result((503, {"error": "gateway shutting down"}))
+
+    def submit(
+        self,
+        body: dict[str, Any],
+        deadline: float | None = None,
+        priority: str | None = None,
+    ) -> asyncio.Future:
+        """Queue body; the returned future resolves to (status_code, response_json)."""
+        future = asyncio.get_running_loop().create_future()
+        if priority not in self._queues:
+            priority = self.classes[0].name
+        trace = tracing.current()
+        if trace is not None:
+            trace.mark("queued")
+        self._queues[priority].append(
+            PendingRequest(
+                body=body,
+                received_at=time.monotonic(),
+                future=future,
+                deadline=deadline,
+                priority=priority,
+                trace=trace,
+            )
+        )
+        if self.config.mode == "fixed":
+            if self._flush_task is None or self._flush_task.done():
+                self._flush_task = asyncio.create_task(self._delayed_flush())
+        else:
+            self._wakeup.set()
+        return future
+
+    def shed_lower_than(self, name: str) -> bool:
+        """
+        Make room for a request of class `name`: answer the newest queued request of
+        the lowest class below it with 429. Returns False if there is nothing to shed.
+        """
+        rank = next((i for i, c in enumerate(self.classes) if c.name == name), 0)
+        for c in reversed(self.classes[rank + 1:]):
+            q = self._queues[c.name]
+            while q:
+                p = q.pop()
+                if p.future.done():
+                    continue
+                p.future.set_result((429, {"error": "overload", "reason": f"shed for higher-priority {name}"}))
+                self.shed[c.name] += 1
+                return True
+        return False
+
+    # --- fixed window ---
+
+    async def _delayed_flush(self) -> None:
+        await asyncio.sleep(self.config.window_ms / 1000.0)
+        batch = []
+        for q in self._queues.values():  # highest priority first
+            batch.extend(q)
+            q.clear()
+        self._release(batch)
+
+    # --- dynamic: size / wait / deadline triggers, capped in-flight ---
+
+    def _flush_at(self) -> float:
+        """Monotonic time at which the current queue must be flushed."""
+        oldest = min(q[0].received_at for q in self._queues.values() if q)
+        flush_at = oldest + self.config.max_wait_ms / 1000.0
+        margin = self.config.max_wait_ms / 1000.0  # leave the request time to run upstream
+        for p in self._iter_pending():
+            if p.deadline is not None and p.deadline - margin < flush_at:
+                flush_at = p.deadline - margin
+        return flush_at
+
+    def _take(self, n: int) -> list[PendingRequest]:
+        """Deficit round robin over class queues, unit cost per request.
+
+        A class cut off by the batch cap resumes its quantum in the next batch instead of
+        getting another one, and its deficit never exceeds one quantum plus one request's
+        cost, so a class that keeps filling batches cannot bank credit against the others.
+        """
+        batch: list[PendingRequest] = []
+        now = time.monotonic()
+        while len(batch) < n and self.pending_count:
+            cls = self.classes[self._rr]
+            q = self._queues[cls.name]
+            if not q:
+                self._deficit[cls.name] = 0
+                self._mid_quantum = False
+                self._rr = (self._rr + 1) % len(self.classes)
+                continue
+            if not self._mid_quantum:
+                self._deficit[cls.name] = min(self._deficit[cls.name] + cls.weight, cls.weight + 1)
+            self._mid_quantum = False
+            while q and self._deficit[cls.name] > 0 and len(batch) < n:
+                p = q.popleft()
+                if self._drop_dead(p, now):  # caller gave up or deadline passed
+                    continue
+                batch.append(p)
+                self._deficit[cls.name] -= 1
+            if not q:
+                self._deficit[cls.name] = 0
+                self._rr = (self._rr + 1) % len(self.classes)
+            elif self._deficit[cls.name] <= 0:
+                self._rr = (self._rr + 1) % len(self.classes)
+            else:
+                self._mid_quantum = True  # batch full: the rest of this quantum goes first next time
+        return batch
+
+    async def _run_dynamic(self) -> None:
+        while True:
+            try:
+                if not self.pending_count:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                # Wait for a trigger: full batch, oldest waited max_wait, or a deadline is due
+                while self.pending_count < self.config.max_batch_size:
+                    remaining = self._flush_at() - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    if not self.pending_count:  # everything was shed or cancelled
+                        break
+                # Respect the in-flight cap before releasing anything
+                while self._active >= self.config.max_in_flight:
+                    self._slot_freed.clear()
+                    await self._slot_freed.wait()
+                n = min(self.config.max_batch_size, self.config.max_in_flight - self._active)
+                self._release(self._take(n))
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.exception("Batch scheduler loop error: %s", e)
+                await asyncio.sleep(0.1)
+
+    # --- shared dispatch ---
+
+    def _drop_dead(self, p: PendingRequest, now: float) -> bool:
+        """True if p must not be dispatched: already answered, cancelled, or expired (-> 504)."""
+        if p.future.done():
+            if p.future.cancelled():
+                self.cancelled["queued"] += 1
+                self.spared_tokens += _token_budget(p.body)
+            return True
+        if p.deadline is not None and p.deadline <= now:
+            self.expired[p.priority] += 1
+            self.spared_tokens += _token_budget(p.body)
+            p.future.set_result((504, {"error": "deadline exceeded", "reason": "expired in queue"}))
+            return True
+        return False
+
+    def _release(self, batch: list[PendingRequest]) -> None:
+        now = time.monotonic()
+        batch = [p for p in batch if not self._drop_dead(p, now)]
+        if not batch:
+            return
+        self.batch_size_hist.observe(len(batch))
+        for p in batch:
+            self._active += 1
+            task = asyncio.create_task(self._run_one(p))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            # Caller gone (client disconnected): stop the upstream call as well
+            p.future.add_done_callback(lambda f, t=task: self._cancel_dispatched(f, t))
+        for p in batch:
+            self.queue_wait_hist[p.priority].observe(now - p.received_at)
+
+    def _cancel_dispatched(self, future: asyncio.Future, task: asyncio.Task) -> None:
+        if future.cancelled() and not task.done():
+            self.cancelled["dispatched"] += 1
+            task.cancel()
+
+    async def _run_one(self, p: PendingRequest) -> None:
+        tracing.activate(p.trace)  # this task was started by the scheduler, not the request
+        try:
+            res = await self._dispatch(p.body, p.deadline)
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            res = (500, {"error": str(e)})
+        finally:
+            self._active -= 1
+            self._slot_freed.set()
+        if not p.future.done():
+            p.future.set_result(res)
+
+    def metrics_lines(self) -> list[str]:
+        lines = [
+            "# HELP gateway_batch_max_in_flight Dispatch cap of the dynamic batch scheduler",
+            "# TYPE gateway_batch_max_in_flight gauge",
+            f"gateway_batch_max_in_flight {self.config.max_in_flight if self.config.mode == 'dynamic' else 0}",
+            "# HELP gateway_class_queue_depth Requests waiting in the batching queue per priority class",
+            "# TYPE gateway_class_queue_depth gauge",
+            *(f'gateway_class_queue_depth{{class="{name}"}} {len(q)}' for name, q in self._queues.items()),
+            "# HELP gateway_class_shed_total Queued requests dropped (429) to admit higher-priority traffic",
+            "# TYPE gateway_class_shed_total counter",
+            *(f'gateway_class_shed_total{{class="{name}"}} {n}' for name, n in self.shed.items()),
+            "# HELP gateway_deadline_expired_total Requests answered 504 because their deadline passed in the queue",
+            "# TYPE gateway_deadline_expired_total counter",
+            *(f'gateway_deadline_expired_total{{class="{name}"}} {n}' for name, n in self.expired.items()),
+            "# HELP gateway_cancelled_total Requests whose client went away, by where they were",
+            "# TYPE gateway_cancelled_total counter",
+            *(f'gateway_cancelled_total{{stage="{stage}"}} {n}' for stage, n in self.cancelled.items()),
+            "# HELP gateway_spared_tokens_total max_tokens budget of requests dropped before dispatch",
+            "# TYPE gateway_spared_tokens_total counter",
+            f"gateway_spared_tokens_total {self.spared_tokens}",
+            *self.batch_size_hist.lines(),
+        ]
+        for i, hist in enumerate(self.queue_wait_hist.values()):
+            lines.extend(hist.lines(header=i == 0))
+        return lines
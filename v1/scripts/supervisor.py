@@ -6,6 +6,34 @@ Milestone 6: Supervisor state machine for scale-to-zero.
 - Start worker when queue_depth > 0 (or on first request)
 - Stop worker when idle for idle_timeout (default 180s)
 - Healthcheck (HTTP) to know when worker is READY
+
+Tiered idle (standby_after_sec > 0): running -> (standby_after) -> standby ->
+(idle_timeout) -> stopping -> idle. In standby the vLLM process is kept but put
+to sleep (POST /sleep, weights offloaded / discarded, KV cache freed); a request
+wakes it with POST /wake_up, which skips process start, model load and CUDA
+graph capture. Min-warm windows (local time of day) keep the worker at least
+running or standby while they are active, and prewarm() starts / wakes it ahead
+of expected traffic.
+
+Predictive (policy = scripts/forecast.PredictivePolicy): every request arrival
+feeds an EWMA + time-of-day forecast; the worker is started when a request is
+expected within the prewarm lead window, and the idle timeout stretches or
+shrinks with the probability of another request arriving before it expires.
+
+Event-driven: every state transition sets the current `_state_changed` event
+(and installs a fresh one), so `wait_until_ready()` returns the moment the
+worker turns RUNNING instead of on the next poll. While STARTING the worker is
+probed with exponential backoff (probe_initial_sec doubling up to
+healthcheck_interval_sec); while RUNNING the loop sleeps until the idle
+deadline. Cold-start phases are timed: spawn -> listen (first HTTP answer of any
+kind) -> ready (/v1/models 200). Resume time (start request -> RUNNING) is timed
+per tier the worker was resumed from.
+
+The worker is an asyncio subprocess (scripts/worker_process.py), so spawning
+and stopping it never blocks the event loop. Readiness is still confirmed over
+HTTP, but the worker's "startup complete" log line cuts the probe backoff
+short. Before SIGTERM, requests already sent to the worker (in_flight) get up
+to drain_timeout_sec to finish.
 """
 
 from __future__ import annotations
@@ -14,24 +42,73 @@ import asyncio
 import enum
 import logging
 import time
+from dataclasses import dataclass
 from typing import Callable
+from urllib.parse import urlparse
 
 import httpx
 
+from scripts.forecast import PredictivePolicy
+from scripts.metrics import Histogram
 from scripts.worker_process import WorkerProcess
 
 logger = logging.getLogger(__name__)
 
+COLD_START_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+DRAIN_POLL_SEC = 0.1
+WINDOW_RECHECK_SEC = 30.0  # with min-warm windows / forecast, re-evaluate the floor at least this often
+
 
 class WorkerState(str, enum.Enum):
     IDLE = "idle"           # No process
-    STARTING = "starting"   # Process started, waiting for healthcheck
+    STARTING = "starting"   # Process started (or waking), waiting for healthcheck
     RUNNING = "running"     # Healthcheck OK
     STOPPING = "stopping"   # Shutting down process
+    WARM_STANDBY = "standby"  # Process kept, engine asleep
+
+
+# Warmth order for min-warm floors
+_WARMTH = {WorkerState.IDLE: 0, WorkerState.WARM_STANDBY: 1, WorkerState.RUNNING: 2}
+
+
+@dataclass
+class WarmWindow:
+    """Time-of-day window [start, end) in minutes; the worker stays at least `floor` inside it."""
+
+    start_min: int
+    end_min: int
+    floor: WorkerState = WorkerState.RUNNING
+
+    def contains(self, minute: int) -> bool:
+        if self.start_min <= self.end_min:
+            return self.start_min <= minute < self.end_min
+        return minute >= self.start_min or minute < self.end_min  # wraps midnight
+
+
+def parse_warm_windows(spec: str) -> list[WarmWindow]:
+    """Parse "HH:MM-HH:MM[=running|standby],..." (local time), e.g. "08:30-18:00,18:00-23:00=standby"."""
+    windows = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        span, _, floor = item.partition("=")
+        start, _, end = span.partition("-")
+        windows.append(WarmWindow(
+            start_min=_minute_of_day(start),
+            end_min=_minute_of_day(end),
+            floor=WorkerState(floor.strip().lower() or "running"),
+        ))
+    return windows
+
+
+def _minute_of_day(hhmm: str) -> int:
+    hours, _, minutes = hhmm.strip().partition(":")
+    return int(hours) * 60 + int(minutes or 0)
 
 
 class Supervisor:
-    """State machine: start worker on demand, stop after idle_timeout."""
+    """State machine: start worker on demand, sleep / stop it as it goes idle."""
 
     def __init__(
         self,
@@ -39,109 +116,437 @@ class Supervisor:
         idle_timeout_sec: float = 180.0,
         healthcheck_interval_sec: float = 2.0,
         idle_check_interval_sec: float = 15.0,
+        probe_initial_sec: float = 0.05,
+        standby_after_sec: float = 0.0,
+        sleep_level: int = 1,
+        warm_windows: list[WarmWindow] | None = None,
+        busy: Callable[[], bool] | None = None,
+        policy: PredictivePolicy | None = None,
+        in_flight: Callable[[], int] | None = None,
+        drain_timeout_sec: float = 30.0,
+        profile: dict | None = None,
+        profile_name: str = "env",
     ) -> None:
         self.worker_url = worker_url.rstrip("/")
         self.idle_timeout_sec = idle_timeout_sec
-        self.healthcheck_interval_sec = healthcheck_interval_sec
-        self.idle_check_interval_sec = idle_check_interval_sec
-        self._worker = WorkerProcess()
+        self.healthcheck_interval_sec = healthcheck_interval_sec  # max probe backoff while starting
+        self.idle_check_interval_sec = idle_check_interval_sec  # liveness check while running
+        self.probe_initial_sec = probe_initial_sec
+        self.standby_after_sec = standby_after_sec  # 0 = no standby tier
+        self.sleep_level = sleep_level  # vLLM: 1 = offload weights to CPU, 2 = discard
+        self.warm_windows = warm_windows or []
+        self._busy = busy  # True while requests are queued / in flight: never demote then
+        self.policy = policy
+        self._in_flight = in_flight  # requests currently sent to this worker (drained before stop)
+        self.drain_timeout_sec = drain_timeout_sec
+        self.profile_name = profile_name  # configs/model_profiles/<name>.yaml, "env" = VLLM_* only
+        self._worker = WorkerProcess(
+            sleep_mode=self.standby_enabled, port=urlparse(self.worker_url).port, profile=profile
+        )
         self._state = WorkerState.IDLE
         self._last_request_time: float | None = None
         self._task: asyncio.Task | None = None
-        self._state_changed: asyncio.Event | None = None  # set by gateway for wait_until_ready
+        self._client: httpx.AsyncClient | None = None
+        self._state_changed: asyncio.Event | None = None  # replaced on every transition
+        self._wakeup: asyncio.Event | None = None  # kicks run_loop (start requested)
+        self._restart_requested = False  # request arrived while STOPPING
+        self._spawn_pending = False  # STARTING from IDLE: run_loop spawns the process
+        self._resume_from = WorkerState.IDLE
+        self._resume_requested_at: float | None = None
+        self._spawned_at: float | None = None
+        self._listening_at: float | None = None
+        self.cold_starts = 0
+        self.failed_starts = 0
+        self.cold_start_hist = {
+            phase: Histogram(
+                "gateway_cold_start_seconds",
+                "Worker cold-start duration by phase (spawn->listen->ready)",
+                COLD_START_BUCKETS,
+                labels={"phase": phase},
+            )
+            for phase in ("spawn_to_listen", "listen_to_ready", "total")
+        }
+        self.resume_hist = {
+            tier: Histogram(
+                "gateway_worker_resume_seconds",
+                "Start request -> worker RUNNING, by the tier it was resumed from",
+                COLD_START_BUCKETS,
+                labels={"from": tier.value},
+            )
+            for tier in (WorkerState.IDLE, WorkerState.WARM_STANDBY)
+        }
+
+    def sibling(
+        self, worker_url: str, profile: dict, profile_name: str, in_flight: Callable[[], int] | None = None
+    ) -> Supervisor:
+        """Same timeouts / tiers / forecast on another port with another profile (blue/green swap)."""
+        return Supervisor(
+            worker_url=worker_url,
+            idle_timeout_sec=self.idle_timeout_sec,
+            healthcheck_interval_sec=self.healthcheck_interval_sec,
+            idle_check_interval_sec=self.idle_check_interval_sec,
+            probe_initial_sec=self.probe_initial_sec,
+            standby_after_sec=self.standby_after_sec,
+            sleep_level=self.sleep_level,
+            warm_windows=self.warm_windows,
+            busy=self._busy,
+            policy=self.policy,
+            in_flight=in_flight,
+            drain_timeout_sec=self.drain_timeout_sec,
+            profile=profile,
+            profile_name=profile_name,
+        )
+
+    @property
+    def profile(self) -> dict:
+        return self._worker.profile
 
     @property
     def state(self) -> WorkerState:
         return self._state
 
+    @property
+    def standby_enabled(self) -> bool:
+        return self.standby_after_sec > 0
+
+    def _set_state(self, state: WorkerState) -> None:
+        """Transition and wake everyone waiting on the previous state."""
+        self._state = state
+        if self._state_changed is not None:
+            self._state_changed.set()
+            self._state_changed = asyncio.Event()
+
+    def _kick(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def warm_floor(self) -> WorkerState:
+        """Coldest tier allowed right now: min-warm windows, or RUNNING if traffic is forecast."""
+        if self.policy is not None and self.policy.should_prewarm(time.time()):
+            return WorkerState.RUNNING
+        return self._window_floor()
+
+    def _window_floor(self) -> WorkerState:
+        floor = WorkerState.IDLE
+        if self.warm_windows:
+            now = time.localtime()
+            minute = now.tm_hour * 60 + now.tm_min
+            for w in self.warm_windows:
+                if w.contains(minute) and _WARMTH[w.floor] > _WARMTH[floor]:
+                    floor = w.floor
+        if floor == WorkerState.WARM_STANDBY and not self.standby_enabled:
+            floor = WorkerState.RUNNING
+        return floor
+
     def request_activity(self) -> None:
-        """Call when a request is received (for idle timeout)."""
+        """Call when a request is received (for idle timeout and the forecast)."""
         self._last_request_time = time.monotonic()
+        if self.policy is not None:
+            self.policy.record(time.time())
+
+    def idle_timeout(self) -> float:
+        """Current idle timeout: fixed, or scaled by the forecast."""
+        if self.policy is None:
+            return self.idle_timeout_sec
+        return self.policy.idle_timeout(time.time(), self.idle_timeout_sec)
+
+    @property
+    def _recheck_sec(self) -> float | None:
+        return WINDOW_RECHECK_SEC if self.warm_windows or self.policy is not None else None
 
     def start_if_needed(self) -> bool:
         """
-        If idle, transition to starting and spawn worker.
-        Returns True if we started (or are starting), False if already running/stopping.
+        If idle, transition to starting and spawn worker; if in standby, wake it.
+        Returns True if we started (or are starting); while stopping, the worker is
+        restarted as soon as the stop completes.
         """
         if self._state == WorkerState.RUNNING or self._state == WorkerState.STARTING:
             return True
         if self._state == WorkerState.STOPPING:
-            return False
-        # IDLE -> STARTING
-        self._state = WorkerState.STARTING
-        self._worker.start()
+            self._restart_requested = True
+            return True
+        self._resume_from = self._state
+        self._resume_requested_at = time.monotonic()
+        if self._state == WorkerState.IDLE:
+            self._spawn_pending = True
+            self._spawned_at = self._resume_requested_at
+            self._listening_at = None
+            self._last_request_time = self._spawned_at
+            logger.info("Supervisor: state=STARTING, spawning worker process")
+        else:
+            logger.info("Supervisor: state=STARTING, waking worker from standby")
+        self._set_state(WorkerState.STARTING)
+        self._kick()
+        return True
+
+    def prewarm(self) -> bool:
+        """Start / wake the worker ahead of traffic; it then idles out as if it had served a request."""
         self._last_request_time = time.monotonic()
-        logger.info("Supervisor: state=STARTING, worker process started (pid=%s)", self._worker.get_pid())
+        return self.start_if_needed()
+
+    async def wait_until_ready(self, timeout: float) -> bool:
+        """Block until the worker is RUNNING (True) or timeout / start failure (False)."""
+        deadline = time.monotonic() + timeout
+        while self._state != WorkerState.RUNNING:
+            if self._state in (WorkerState.IDLE, WorkerState.WARM_STANDBY) and not self._restart_requested:
+                return False  # start failed or worker was put away
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._state_changed is None:
+                return False
+            try:
+                await asyncio.wait_for(self._state_changed.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return False
         return True
 
-    async def healthcheck(self) -> bool:
-        """Return True if worker responds (e.g. /v1/models)."""
+    async def _probe(self, client: httpx.AsyncClient) -> str:
+        """'ready' (/v1/models 200), 'listening' (any other HTTP answer) or 'down'."""
         try:
-            async with httpx.AsyncClient() as client:
-                r = await client.get(
-                    f"{self.worker_url}/v1/models",
-                    timeout=5.0,
-                )
-                return r.status_code == 200
-        except Exception as e:
+            r = await client.get(f"{self.worker_url}/v1/models", timeout=5.0)
+        except httpx.TransportError as e:
             logger.debug("Healthcheck failed: %s", e)
+            return "down"
+        return "ready" if r.status_code == 200 else "listening"
+
+    async def _post(self, client: httpx.AsyncClient, path: str) -> bool:
+        """POST a sleep-mode endpoint; True on 2xx."""
+        try:
+            r = await client.post(f"{self.worker_url}{path}", timeout=120.0)
+        except httpx.HTTPError as e:
+            logger.warning("Supervisor: POST %s failed: %s", path, e)
             return False
+        if r.status_code >= 300:
+            logger.warning("Supervisor: POST %s -> %s (worker started without --enable-sleep-mode?)", path, r.status_code)
+        return r.status_code < 300
+
+    async def healthcheck(self) -> bool:
+        """Return True if worker responds (e.g. /v1/models)."""
+        async with httpx.AsyncClient() as client:
+            return await self._probe(client) == "ready"
+
+    async def _wait_for_ready(self, client: httpx.AsyncClient) -> None:
+        """STARTING: spawn or wake the worker, then probe with exponential backoff."""
+        if self._spawn_pending:
+            self._spawn_pending = False
+            try:
+                await self._worker.start()
+            except OSError as e:
+                self.failed_starts += 1
+                logger.error("Supervisor: cannot spawn worker: %s, state=IDLE", e)
+                self._set_state(WorkerState.IDLE)
+                return
+            logger.info("Supervisor: worker process started (pid=%s)", self._worker.get_pid())
+        if self._resume_from == WorkerState.WARM_STANDBY:
+            if not await self._post(client, "/wake_up"):
+                # Cannot wake it: fall back to a fresh process (waiters keep waiting)
+                self._restart_requested = True
+                await self._stop_worker()
+                return
+        delay = self.probe_initial_sec
+        log_woke = False
+        while self._state == WorkerState.STARTING:
+            if not self._worker.is_alive():
+                self.failed_starts += 1
+                logger.warning(
+                    "Supervisor: worker exited during startup (code %s), state=IDLE; last output: %s",
+                    self._worker.exit_code(), " | ".join(self._worker.tail(5)),
+                )
+                await self._worker.stop()
+                self._set_state(WorkerState.IDLE)
+                return
+            status = await self._probe(client)
+            now = time.monotonic()
+            cold = self._resume_from == WorkerState.IDLE
+            if cold and status != "down" and self._listening_at is None:
+                self._listening_at = now
+                self.cold_start_hist["spawn_to_listen"].observe(now - self._spawned_at)
+            if status == "ready":
+                if cold:
+                    self.cold_start_hist["listen_to_ready"].observe(now - self._listening_at)
+                    self.cold_start_hist["total"].observe(now - self._spawned_at)
+                    self.cold_starts += 1
+                self.resume_hist[self._resume_from].observe(now - self._resume_requested_at)
+                logger.info(
+                    "Supervisor: state=RUNNING, worker ready after %.2fs (from %s)",
+                    now - self._resume_requested_at, self._resume_from.value,
+                )
+                self._last_request_time = now  # idle time counts from ready, not from the spawn
+                self._set_state(WorkerState.RUNNING)
+                return
+            if log_woke:
+                await asyncio.sleep(delay)
+            else:
+                # The ready log line triggers the next probe immediately (once)
+                log_woke = await self._worker.wait_log_ready(delay)
+            delay = min(delay * 2, self.healthcheck_interval_sec)
+
+    async def _enter_standby(self, client: httpx.AsyncClient) -> None:
+        # Leave RUNNING first so no request is routed to an engine going to sleep
+        self._set_state(WorkerState.WARM_STANDBY)
+        ok = await self._post(client, f"/sleep?level={self.sleep_level}")
+        if self._state != WorkerState.WARM_STANDBY:
+            return  # woken meanwhile; STARTING will POST /wake_up
+        if ok:
+            logger.info("Supervisor: state=STANDBY, worker asleep (level %s)", self.sleep_level)
+        else:
+            await self._stop_worker()
+
+    async def _drain(self) -> None:
+        """Give requests already sent to the worker up to drain_timeout_sec before SIGTERM."""
+        if self._in_flight is None:
+            return
+        deadline = time.monotonic() + self.drain_timeout_sec
+        while (n := self._in_flight()) > 0:
+            if time.monotonic() >= deadline:
+                logger.warning("Supervisor: stopping worker with %d request(s) still in flight", n)
+                return
+            await asyncio.sleep(DRAIN_POLL_SEC)
+
+    async def _stop_worker(self) -> None:
+        self._set_state(WorkerState.STOPPING)
+        await self._drain()
+        await self._worker.stop()
+        self._set_state(WorkerState.IDLE)
+        logger.info("Supervisor: state=IDLE")
+        if self._restart_requested:
+            self._restart_requested = False
+            self.start_if_needed()
+
+    def _idle_for(self) -> float:
+        return time.monotonic() - (self._last_request_time or time.monotonic())
+
+    def _nap(self, seconds: float) -> float:
+        """Sleep until the next deadline, capped by the liveness / min-warm window recheck.
+
+        A deadline already passed (demotion held back by a min-warm floor) sleeps the full cap.
+        """
+        cap = min(self.idle_check_interval_sec, self._recheck_sec or self.idle_check_interval_sec)
+        return cap if seconds <= 0 else min(seconds, cap)
+
+    async def _wait_for_kick(self, timeout: float | None) -> None:
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
 
     async def run_loop(self) -> None:
         """
-        Background loop: poll health when starting, check idle when running.
+        Background loop: probe while starting, sleep until the next idle deadline
+        while running / in standby, and block on _wakeup while idle.
         """
-        while True:
-            try:
-                if self._state == WorkerState.STARTING:
-                    if await self.healthcheck():
-                        self._state = WorkerState.RUNNING
-                        logger.info("Supervisor: state=RUNNING, worker ready")
-                        if self._state_changed:
-                            self._state_changed.set()
-                    await asyncio.sleep(self.healthcheck_interval_sec)
-
-                elif self._state == WorkerState.RUNNING:
-                    if not self._worker.is_alive():
-                        self._state = WorkerState.IDLE
-                        logger.warning("Supervisor: worker died, state=IDLE")
+        async with httpx.AsyncClient() as client:
+            self._client = client
+            while True:
+                try:
+                    state = self._state
+                    floor = self.warm_floor()
+                    if state in (WorkerState.RUNNING, WorkerState.WARM_STANDBY) and not self._worker.is_alive():
+                        logger.warning(
+                            "Supervisor: worker died (code %s), state=IDLE; last output: %s",
+                            self._worker.exit_code(), " | ".join(self._worker.tail(5)),
+                        )
+                        await self._worker.stop()
+                        self._set_state(WorkerState.IDLE)
                         continue
-                    # Idle timeout
-                    if self._last_request_time is not None:
-                        elapsed = time.monotonic() - self._last_request_time
-                        if elapsed >= self.idle_timeout_sec:
-                            logger.info("Supervisor: idle %.0fs >= %s, stopping worker", elapsed, self.idle_timeout_sec)
-                            self._state = WorkerState.STOPPING
-                            await asyncio.get_event_loop().run_in_executor(None, self._worker.stop)
-                            self._state = WorkerState.IDLE
-                            logger.info("Supervisor: state=IDLE")
-                    await asyncio.sleep(self.idle_check_interval_sec)
-
-                elif self._state == WorkerState.STOPPING:
-                    await asyncio.sleep(1.0)
 
-                else:
-                    # IDLE
-                    await asyncio.sleep(self.idle_check_interval_sec)
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                logger.exception("Supervisor loop error: %s", e)
-                await asyncio.sleep(5.0)
+                    if state == WorkerState.STARTING:
+                        await self._wait_for_ready(client)
+
+                    elif state == WorkerState.RUNNING:
+                        if self._busy is not None and self._busy():
+                            self._last_request_time = time.monotonic()
+                        idle_for = self._idle_for()
+                        next_tier_after = self.standby_after_sec if self.standby_enabled else self.idle_timeout()
+                        if idle_for >= next_tier_after and _WARMTH[floor] < _WARMTH[WorkerState.RUNNING]:
+                            logger.info("Supervisor: idle %.0fs >= %s", idle_for, next_tier_after)
+                            if self.standby_enabled:
+                                await self._enter_standby(client)
+                            else:
+                                await self._stop_worker()
+                            continue
+                        # Sleep until the next idle deadline (activity just pushes it out)
+                        await asyncio.sleep(self._nap(next_tier_after - idle_for))
+
+                    elif state == WorkerState.WARM_STANDBY:
+                        if floor == WorkerState.RUNNING:
+                            self.start_if_needed()
+                            continue
+                        idle_for = self._idle_for()
+                        idle_timeout = self.idle_timeout()
+                        if idle_for >= idle_timeout and floor == WorkerState.IDLE:
+                            logger.info("Supervisor: idle %.0fs >= %.0f, stopping worker", idle_for, idle_timeout)
+                            await self._stop_worker()
+                            continue
+                        await self._wait_for_kick(self._nap(idle_timeout - idle_for))
+
+                    elif state == WorkerState.IDLE:
+                        if floor != WorkerState.IDLE:
+                            if self._window_floor() == WorkerState.IDLE:
+                                self.policy.prewarms += 1
+                                logger.info("Supervisor: traffic forecast within %.0fs, prewarming", self.policy.config.lead_sec)
+                            else:
+                                logger.info("Supervisor: min-warm window (%s) active, prewarming", floor.value)
+                            self.start_if_needed()
+                            continue
+                        # Nothing to do until start_if_needed() kicks us (or a window / forecast may open)
+                        await self._wait_for_kick(self._recheck_sec)
+
+                    else:
+                        # STOPPING is driven by _stop_worker; just yield
+                        await self._wait_for_kick(1.0)
+                except asyncio.CancelledError:
+                    break
+                except Exception as e:
+                    logger.exception("Supervisor loop error: %s", e)
+                    await asyncio.sleep(1.0)
+        self._client = None
 
     def start_background_loop(self, state_changed: asyncio.Event | None = None) -> None:
         """Start the supervisor background task."""
-        self._state_changed = state_changed
+        self._state_changed = state_changed or asyncio.Event()
+        self._wakeup = asyncio.Event()
         self._task = asyncio.create_task(self.run_loop())
         logger.info("Supervisor background loop started")
 
-    def stop_background_loop(self) -> None:
-        """Cancel the background loop and stop worker."""
+    async def shutdown(self) -> None:
+        """Cancel the background loop, drain in-flight requests and stop the worker."""
         if self._task and not self._task.done():
             self._task.cancel()
-        self._worker.stop()
-        self._state = WorkerState.IDLE
+        self._set_state(WorkerState.STOPPING)
+        await self._drain()
+        await self._worker.stop()
+        self._set_state(WorkerState.IDLE)
+
+    def worker_status(self, lines: int = 100) -> dict:
+        """Process info and the tail of its output (GET /admin/worker/logs)."""
+        return {
+            "url": self.worker_url,
+            "state": self._state.value,
+            "profile": self.profile_name,
+            "pid": self._worker.get_pid(),
+            "exit_code": self._worker.exit_code(),
+            "log": self._worker.tail(lines),
+        }
 
     def is_ready(self) -> bool:
         """True if worker is RUNNING (ready to serve)."""
         return self._state == WorkerState.RUNNING
+
+    def metrics_lines(self) -> list[str]:
+        lines = [
+            "# HELP gateway_cold_starts_total Worker starts that reached RUNNING / exited during startup",
+            "# TYPE gateway_cold_starts_total counter",
+            f'gateway_cold_starts_total{{result="ready"}} {self.cold_starts}',
+            f'gateway_cold_starts_total{{result="failed"}} {self.failed_starts}',
+            "# HELP gateway_worker_warm_floor Coldest tier allowed by min-warm windows (0=idle 1=standby 2=running)",
+            "# TYPE gateway_worker_warm_floor gauge",
+            f"gateway_worker_warm_floor {_WARMTH[self.warm_floor()]}",
+        ]
+        if self.policy is not None:
+            lines.extend(self.policy.metrics_lines(time.time(), self.idle_timeout_sec))
+        for i, hist in enumerate(self.cold_start_hist.values()):
+            lines.extend(hist.lines(header=i == 0))
+        for i, hist in enumerate(self.resume_hist.values()):
+            lines.extend(hist.lines(header=i == 0))
+        return lines
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Token-cost admission: estimate what a request costs the worker before sending it.
+
+GPU time and KV-cache space scale with prompt + completion tokens, not with the
+number of requests, so on top of the queue-depth limit (scripts/policies.py):
+
+- TokenEstimator: prompt tokens of a chat request
+    * chars      ~ len(text) / CHARS_PER_TOKEN + per-message overhead (no dependency)
+    * tokenizer  the model's HF tokenizer (transformers), loaded once; per-message
+                 counts are cached (system prompts repeat). Falls back to chars if
+                 transformers is not installed
+- fit_max_model_len (with TOKEN_ADMISSION only): prompt + max_tokens must fit the
+  worker's max_model_len. Estimates are approximate, so only a clear overflow
+  (beyond MAX_MODEL_LEN_MARGIN for the chars estimator) is acted on; anything
+  closer is left for vLLM to judge.
+    * reject    400 before the request reaches vLLM (vLLM would 400 it anyway,
+                after queueing)
+    * truncate  drop the oldest non-system messages, then cut the start of the
+                oldest remaining one
+  A max_tokens the client set is lowered to what is left; an unset one stays
+  unset (vLLM's default) and is charged as the room left in max_model_len.
+- TokenBudget: tokens of admitted, unfinished requests (prompt + max_tokens).
+  The budget follows the worker profile: max_num_seqs x min(max_model_len,
+  max_num_batched_tokens) is what one full batch can hold, times
+  TOKEN_BUDGET_FACTOR batches (one running + queued). A request that does not
+  fit gets 429 (the first request is always admitted). Profile swaps
+  (scripts/hotswap.py) move the budget with them.
+
+Env:
+  TOKEN_ADMISSION         1 = check max_model_len and admit against the token budget
+                          (default off: requests reach vLLM unchanged)
+  TOKEN_ESTIMATOR         chars | tokenizer (default chars)
+  TOKENIZER_MODEL         HF model id for the tokenizer (default VLLM_MODEL)
+  CHARS_PER_TOKEN         chars estimator ratio (default 4; ~3 for code / Vietnamese)
+  TOKEN_BUDGET            Fixed budget in tokens (default 0 = from the profile)
+  TOKEN_BUDGET_FACTOR     Full batches of tokens admitted at once (default 2)
+  MAX_MODEL_LEN_POLICY    reject | truncate (default reject)
+  MAX_MODEL_LEN_MARGIN    Relative error allowed to a chars estimate before it counts as
+                          over max_model_len (default 0.1; tokenizer counts: none)
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# Same fallbacks as scripts/worker_process.py (_build_vllm_cmd) and configs/model_profiles/safe.yaml
+DEFAULT_MAX_MODEL_LEN = 512
+DEFAULT_MAX_NUM_SEQS = 64
+DEFAULT_MAX_NUM_BATCHED_TOKENS = 4096
+MESSAGE_OVERHEAD_TOKENS = 4  # chat template tokens around each message
+
+
+@dataclass
+class TokenConfig:
+    """Estimator and budget settings."""
+
+    admission: bool = False
+    estimator: str = "chars"
+    tokenizer_model: str = "Qwen/Qwen2.5-0.5B-Instruct"
+    chars_per_token: float = 4.0
+    budget: int = 0
+    budget_factor: float = 2.0
+    overflow_policy: str = "reject"
+    overflow_margin: float = 0.1
+
+    @classmethod
+    def from_env(cls) -> TokenConfig:
+        cfg = cls(
+            admission=os.environ.get("TOKEN_ADMISSION", "").lower() in ("1", "true", "yes"),
+            estimator=os.environ.get("TOKEN_ESTIMATOR", "chars").lower(),
+            tokenizer_model=os.environ.get(
+                "TOKENIZER_MODEL", os.environ.get("VLLM_MODEL", "Qwen/Qwen2.5-0.5B-Instruct")
+            ),
+            chars_per_token=float(os.environ.get("CHARS_PER_TOKEN", "4")),
+            budget=int(os.environ.get("TOKEN_BUDGET", "0")),
+            budget_factor=float(os.environ.get("TOKEN_BUDGET_FACTOR", "2")),
+            overflow_policy=os.environ.get("MAX_MODEL_LEN_POLICY", "reject").lower(),
+            overflow_margin=float(os.environ.get("MAX_MODEL_LEN_MARGIN", "0.1")),
+        )
+        if cfg.estimator not in ("chars", "tokenizer"):
+            raise ValueError(f"unknown TOKEN_ESTIMATOR {cfg.estimator!r} (expected chars or tokenizer)")
+        if cfg.overflow_policy not in ("reject", "truncate"):
+            raise ValueError(f"unknown MAX_MODEL_LEN_POLICY {cfg.overflow_policy!r} (expected reject or truncate)")
+        return cfg
+
+
+@dataclass
+class WorkerLimits:
+    """Token limits of the worker profile that admission has to respect."""
+
+    max_model_len: int
+    max_num_seqs: int
+    max_num_batched_tokens: int
+
+    @classmethod
+    def from_profile(cls, profile: dict | None) -> WorkerLimits:
+        """Profile keys first, then VLLM_* env (what the worker was started with), then defaults."""
+        profile = profile or {}
+
+        def get(key: str, env: str, default: int) -> int:
+            value = profile.get(key)
+            if value is None:
+                value = os.environ.get(env) or default
+            return int(value)
+
+        return cls(
+            max_model_len=get("max_model_len", "VLLM_MAX_MODEL_LEN", DEFAULT_MAX_MODEL_LEN),
+            max_num_seqs=get("max_num_seqs", "VLLM_MAX_NUM_SEQS", DEFAULT_MAX_NUM_SEQS),
+            max_num_batched_tokens=get(
+                "max_num_batched_tokens", "VLLM_MAX_NUM_BATCHED_TOKENS", DEFAULT_MAX_NUM_BATCHED_TOKENS
+            ),
+        )
+
+    def batch_tokens(self) -> int:
+        """Tokens one full batch holds: every sequence slot at (at most) one step's worth."""
+        return self.max_num_seqs * min(self.max_model_len, self.max_num_batched_tokens)
+
+
+def _message_text(message: dict) -> str:
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):  # OpenAI content parts
+        return "".join(p.get("text", "") for p in content if isinstance(p, dict))
+    return ""
+
+
+class TokenEstimator:
+    """Prompt token count for a chat completion body."""
+
+    def __init__(self, config: TokenConfig) -> None:
+        self.config = config
+        self.mode = config.estimator
+        self._count = self._count_chars
+        if self.mode == "tokenizer":
+            tokenizer = self._load_tokenizer(config.tokenizer_model)
+            if tokenizer is None:
+                self.mode = "chars"
+            else:
+
+                @lru_cache(maxsize=4096)
+                def count(text: str) -> int:
+                    return len(tokenizer.encode(text, add_special_tokens=False))
+
+                self._count = count
+
+    @staticmethod
+    def _load_tokenizer(model: str):
+        try:
+            from transformers import AutoTokenizer
+        except ImportError:
+            logger.warning("TOKEN_ESTIMATOR=tokenizer needs transformers; using the chars estimator")
+            return None
+        try:
+            return AutoTokenizer.from_pretrained(model)
+        except Exception as e:
+            logger.warning("Could not load tokenizer %s (%s); using the chars estimator", model, e)
+            return None
+
+    def _count_chars(self, text: str) -> int:
+        return math.ceil(len(text) / self.config.chars_per_token)
+
+    def count_text(self, text: str) -> int:
+        return self._count(text)
+
+    def prompt_tokens(self, body: dict[str, Any]) -> int:
+        messages = body.get("messages")
+        if isinstance(messages, list):
+            return sum(
+                self._count(_message_text(m)) + MESSAGE_OVERHEAD_TOKENS for m in messages if isinstance(m, dict)
+            )
+        prompt = body.get("prompt")
+        return self._count(prompt) if isinstance(prompt, str) else 0
+
+
+@dataclass
+class FitResult:
+    """Outcome of the max_model_len check; body is only copied when it was changed."""
+
+    body: dict[str, Any]
+    prompt_tokens: int
+    completion_tokens: int = 0
+    error: str = ""
+    truncated: bool = False
+
+    @property
+    def cost(self) -> int:
+        """Tokens the request may occupy: prompt + max_tokens (or the room vLLM would fill)."""
+        return self.prompt_tokens + self.completion_tokens
+
+
+def _truncate_messages(
+    messages: list[dict], estimator: TokenEstimator, limit: int
+) -> tuple[list[dict], int] | None:
+    """Oldest non-system messages out first, then the start of the oldest kept one; None if impossible."""
+    messages = list(messages)
+
+    def total() -> int:
+        return sum(estimator.count_text(_message_text(m)) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+    tokens = total()
+    while tokens > limit:
+        movable = [i for i, m in enumerate(messages) if m.get("role") != "system"]
+        if len(movable) > 1:
+            del messages[movable[0]]
+            tokens = total()
+            continue
+        if not movable:
+            return None
+        i = movable[0]
+        text = _message_text(messages[i])
+        excess = tokens - limit
+        # Cut proportionally to the estimate, keeping the end (the actual question)
+        keep = len(text) - math.ceil(len(text) * excess / max(1, estimator.count_text(text))) - 1
+        if keep <= 0:
+            return None
+        messages[i] = {**messages[i], "content": text[-keep:]}
+        tokens = total()
+    return messages, tokens
+
+
+def fit_max_model_len(
+    body: dict[str, Any],
+    estimator: TokenEstimator,
+    max_model_len: int,
+    policy: str = "reject",
+    margin: float = 0.0,
+    min_completion: int = 16,
+) -> FitResult:
+    """
+    Make prompt + max_tokens fit max_model_len, acting only on a clear overflow.
+    A chars estimate counts as over only beyond max_model_len x (1 + margin). A prompt
+    that leaves fewer than min_completion tokens is rejected or truncated (policy); a
+    max_tokens the client set that does not fit is lowered. Without max_tokens vLLM
+    generates up to max_model_len, so the body is left alone and charged the room left.
+    """
+    limit = max_model_len * (1.0 + (margin if estimator.mode == "chars" else 0.0))
+    prompt = estimator.prompt_tokens(body)
+    if prompt + min_completion > limit:
+        messages = body.get("messages")
+        if policy != "truncate" or not isinstance(messages, list):
+            return FitResult(
+                body, prompt, error=f"prompt ~{prompt} tokens does not fit max_model_len {max_model_len}"
+            )
+        fitted = _truncate_messages(messages, estimator, max_model_len - min_completion)
+        if fitted is None:
+            return FitResult(body, prompt, error=f"prompt ~{prompt} tokens cannot be truncated to fit")
+        body = {**body, "messages": fitted[0]}
+        logger.info("Prompt truncated from ~%s to ~%s tokens (max_model_len=%s)", prompt, fitted[1], max_model_len)
+        body, completion = _fit_completion(body, fitted[1], max_model_len, limit, min_completion)
+        return FitResult(body, fitted[1], completion, truncated=True)
+    body, completion = _fit_completion(body, prompt, max_model_len, limit, min_completion)
+    return FitResult(body, prompt, completion)
+
+
+def _fit_completion(
+    body: dict[str, Any], prompt: int, max_model_len: int, limit: float, min_completion: int
+) -> tuple[dict[str, Any], int]:
+    """(body, completion tokens charged): a set max_tokens is lowered only past limit."""
+    room = max(min_completion, max_model_len - prompt)
+    max_tokens = body.get("max_tokens")
+    if not isinstance(max_tokens, int):
+        return body, room
+    if prompt + max_tokens <= limit:
+        return body, max_tokens
+    return {**body, "max_tokens": room}, room
+
+
+class TokenBudget:
+    """Tokens (prompt + max_tokens) of admitted requests that have not finished yet."""
+
+    def __init__(self, config: TokenConfig, get_profile: Callable[[], dict | None]) -> None:
+        self.config = config
+        self._get_profile = get_profile
+        self.in_use = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def limits(self) -> WorkerLimits:
+        return WorkerLimits.from_profile(self._get_profile())
+
+    @property
+    def budget(self) -> int:
+        if self.config.budget > 0:
+            return self.config.budget
+        return int(self.limits.batch_tokens() * self.config.budget_factor)
+
+    def try_acquire(self, cost: int, share: float = 1.0) -> bool:
+        """Reserve cost tokens if they fit the class's share of the budget."""
+        if self.in_use > 0 and self.in_use + cost > self.budget * share:
+            self.rejected += 1
+            return False
+        self.in_use += cost
+        self.admitted += 1
+        return True
+
+    def release(self, cost: int) -> None:
+        self.in_use = max(0, self.in_use - cost)
+
+    def retry_after_sec(self, cost: int, tokens_per_sec: float) -> int:
+        """Seconds until cost tokens free up at the measured throughput (1..60)."""
+        if tokens_per_sec <= 0:
+            return 60
+        excess = self.in_use + cost - self.budget
+        return max(1, min(60, math.ceil(excess / tokens_per_sec)))
+
+    def metrics_lines(self) -> list[str]:
+        return [
+            "# HELP gateway_token_budget Admissible prompt+completion tokens in flight (from the worker profile)",
+            "# TYPE gateway_token_budget gauge",
+            f"gateway_token_budget {self.budget}",
+            "# HELP gateway_tokens_in_use Estimated tokens of admitted, unfinished requests",
+            "# TYPE gateway_tokens_in_use gauge",
+            f"gateway_tokens_in_use {self.in_use}",
+            "# HELP gateway_token_admission_total Token-budget admission decisions",
+            "# TYPE gateway_token_admission_total counter",
+            f'gateway_token_admission_total{{result="admitted"}} {self.admitted}',
+            f'gateway_token_admission_total{{result="rejected"}} {self.rejected}',
+        ]
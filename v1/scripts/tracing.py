@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Request-phase tracing for the gateway: where did a slow request spend its time?
+
+Every request gets a Trace that collects phase marks (perf_counter offsets):
+  received      request entered chat_completions
+  admitted      passed rate limit, admission, max_model_len and token budget
+  worker_ready  cold start / wake-up finished (only when the gateway had to wait)
+  queued        handed to the batch scheduler (scripts/scheduler.py)
+  dispatched    request sent to a worker (scripts/gateway.py _forward_to_vllm / stream)
+  first_byte    first streamed chunk from the worker
+  upstream_done worker answer complete (or stream ended)
+  completed     response finished (streams: closed)
+Consecutive marks become child spans (admission, worker_ready, queue, upstream,
+streaming) under one root span. The active trace travels in a ContextVar; the
+scheduler re-activates it in the task that dispatches the request.
+
+Sampling:
+  head  TRACE_SAMPLE_RATE of requests are kept regardless of outcome (decided at
+        receive time; a W3C traceparent header with the sampled flag forces it)
+  tail  every request slower than TRACE_SLOW_MS, or answered with 5xx, is kept
+Marking costs one perf_counter_ns() and a list append, so every request is
+marked; only kept traces are converted and exported.
+
+Export:
+  GET /admin/traces          newest kept traces from an in-memory ring buffer
+                             (TRACE_BUFFER entries; ?slow=true, ?limit=N)
+  TRACE_OTLP_FILE=path       also append each kept trace as one line of OTLP/JSON
+                             (ExportTraceServiceRequest, the OpenTelemetry
+                             collector file format); needs no collector or network.
+                             Kept traces wait in memory and a background task
+                             converts and writes them off the event loop every
+                             TRACE_FLUSH_SEC (tail sampling keeps the most traces
+                             exactly when the gateway is overloaded); the rest is
+                             flushed on shutdown
+
+Env:
+  TRACING             0 = off (default on)
+  TRACE_SAMPLE_RATE   Head sampling probability (default 0.01)
+  TRACE_SLOW_MS       Tail sampling: keep requests at least this slow (default 2000)
+  TRACE_BUFFER        Traces kept in memory (default 256)
+  TRACE_OTLP_FILE     JSON-lines OTLP export file (default: none)
+  TRACE_FLUSH_SEC     Export flush period (default 1)
+  TRACE_EXPORT_QUEUE  Traces waiting for export before new ones are dropped (default 4096)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "llm-gateway"
+
+# (span name, start mark, end mark); a span is emitted when both marks exist
+PHASE_SPANS = (
+    ("admission", "received", "admitted"),
+    ("worker_ready", "admitted", "worker_ready"),
+    ("queue", "queued", "dispatched"),
+    ("upstream", "dispatched", "upstream_done"),
+    ("streaming", "first_byte", "upstream_done"),
+)
+
+
+@dataclass
+class TraceConfig:
+    """Sampling and export settings."""
+
+    enabled: bool = True
+    sample_rate: float = 0.01
+    slow_ms: float = 2000.0
+    buffer: int = 256
+    otlp_file: str = ""
+    flush_sec: float = 1.0
+    export_queue: int = 4096
+
+    @classmethod
+    def from_env(cls) -> TraceConfig:
+        return cls(
+            enabled=os.environ.get("TRACING", "1").lower() not in ("0", "false", "no"),
+            sample_rate=float(os.environ.get("TRACE_SAMPLE_RATE", "0.01")),
+            slow_ms=float(os.environ.get("TRACE_SLOW_MS", "2000")),
+            buffer=int(os.environ.get("TRACE_BUFFER", "256")),
+            otlp_file=os.environ.get("TRACE_OTLP_FILE", ""),
+            flush_sec=float(os.environ.get("TRACE_FLUSH_SEC", "1")),
+            export_queue=int(os.environ.get("TRACE_EXPORT_QUEUE", "4096")),
+        )
+
+
+class Trace:
+    """Phase marks and attributes of one request."""
+
+    __slots__ = ("trace_id", "parent_span_id", "sampled", "start_unix_ns", "_t0", "marks", "attrs")
+
+    def __init__(self, trace_id: str, parent_span_id: str = "", sampled: bool = False) -> None:
+        self.trace_id = trace_id
+        self.parent_span_id = parent_span_id
+        self.sampled = sampled  # head decision
+        self.start_unix_ns = time.time_ns()
+        self._t0 = time.perf_counter_ns()
+        self.marks: list[tuple[str, int]] = [("received", 0)]  # (phase, ns since received)
+        self.attrs: dict[str, str | int | float] = {}
+
+    def mark(self, phase: str) -> None:
+        """Record phase now; a repeated phase (e.g. a retried dispatch) keeps the first time."""
+        if not any(name == phase for name, _ in self.marks):
+            self.marks.append((phase, time.perf_counter_ns() - self._t0))
+
+    def at(self, phase: str) -> int | None:
+        for name, ns in self.marks:
+            if name == phase:
+                return ns
+        return None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.at("completed")
+        return (end if end is not None else time.perf_counter_ns() - self._t0) / 1e6
+
+    def spans(self) -> list[tuple[str, int, int]]:
+        """(name, start ns, end ns) of each phase span whose two marks were recorded."""
+        out = []
+        for name, start, end in PHASE_SPANS:
+            s, e = self.at(start), self.at(end)
+            if s is not None and e is not None and e >= s:
+                out.append((name, s, e))
+        return out
+
+    def as_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "start": self.start_unix_ns / 1e9,
+            "duration_ms": round(self.duration_ms, 3),
+            "phases_ms": {name: round(ns / 1e6, 3) for name, ns in self.marks},
+            "spans_ms": {name: round((e - s) / 1e6, 3) for name, s, e in self.spans()},
+            "attributes": self.attrs,
+        }
+
+
+_current: contextvars.ContextVar[Trace | None] = contextvars.ContextVar("gateway_trace", default=None)
+
+
+def current() -> Trace | None:
+    return _current.get()
+
+
+def activate(trace: Trace | None) -> None:
+    """Make trace the active one for this task (and tasks it creates)."""
+    _current.set(trace)
+
+
+def mark(phase: str) -> None:
+    """Mark phase on the active trace, if any."""
+    trace = _current.get()
+    if trace is not None:
+        trace.mark(phase)
+
+
+def _parse_traceparent(value: str) -> tuple[str, str, bool] | None:
+    """W3C traceparent "00-<trace id>-<parent id>-<flags>" -> (trace id, parent id, sampled)."""
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+def _attr_value(v: str | int | float) -> dict:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+
+def to_otlp(trace: Trace) -> dict:
+    """ExportTraceServiceRequest (OTLP/JSON) with the root span and its phase spans."""
+    root_id = os.urandom(8).hex()
+    base = trace.start_unix_ns
+
+    def span(name: str, span_id: str, parent: str, start: int, end: int, attrs: dict | None = None) -> dict:
+        out = {
+            "traceId": trace.trace_id,
+            "spanId": span_id,
+            "name": name,
+            "kind": 2 if span_id == root_id else 1,  # SERVER for the root, INTERNAL for phases
+            "startTimeUnixNano": str(base + start),
+            "endTimeUnixNano": str(base + end),
+        }
+        if parent:
+            out["parentSpanId"] = parent
+        if attrs:
+            out["attributes"] = [{"key": k, "value": _attr_value(v)} for k, v in attrs.items()]
+        return out
+
+    end = trace.at("completed") or max(ns for _, ns in trace.marks)
+    root = span("POST /v1/chat/completions", root_id, trace.parent_span_id, 0, end, trace.attrs)
+    root["events"] = [{"name": name, "timeUnixNano": str(base + ns)} for name, ns in trace.marks]
+    if int(trace.attrs.get("http.status_code", 200)) >= 500:
+        root["status"] = {"code": 2}
+    spans = [root] + [span(name, os.urandom(8).hex(), root_id, s, e) for name, s, e in trace.spans()]
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "scripts.tracing"}, "spans": spans}],
+        }]
+    }
+
+
+class Tracer:
+    """Starts traces, applies head/tail sampling and exports the kept ones."""
+
+    def __init__(self, config: TraceConfig) -> None:
+        self.config = config
+        self.buffer: deque[Trace] = deque(maxlen=max(1, config.buffer))
+        self.kept = {"head": 0, "slow": 0, "error": 0}
+        self.dropped = 0
+        self.export_errors = 0
+        self.export_dropped = 0
+        self._otlp_path = Path(config.otlp_file) if config.otlp_file else None
+        self._pending: list[Trace] = []  # kept, not yet written to the OTLP file
+        self._task: asyncio.Task | None = None
+
+    def start(self, traceparent: str | None = None) -> Trace | None:
+        """New active trace for this request (None when tracing is off)."""
+        if not self.config.enabled:
+            return None
+        parent = _parse_traceparent(traceparent) if traceparent else None
+        if parent is not None:
+            trace = Trace(parent[0], parent[1], sampled=parent[2] or random.random() < self.config.sample_rate)
+        else:
+            trace = Trace(os.urandom(16).hex(), sampled=random.random() < self.config.sample_rate)
+        _current.set(trace)
+        return trace
+
+    def finish(self, trace: Trace | None, status: int) -> None:
+        """Mark completed and keep the trace if head- or tail-sampled."""
+        if trace is None:
+            return
+        trace.mark("completed")
+        trace.attrs["http.status_code"] = status
+        if status >= 500:
+            reason = "error"
+        elif trace.duration_ms >= self.config.slow_ms:
+            reason = "slow"
+        elif trace.sampled:
+            reason = "head"
+        else:
+            self.dropped += 1
+            return
+        trace.attrs["sampling.reason"] = reason
+        self.kept[reason] += 1
+        self.buffer.append(trace)
+        if self._otlp_path is not None:
+            if len(self._pending) < self.config.export_queue:
+                self._pending.append(trace)
+            else:
+                self.export_dropped += 1
+
+    def start_export(self) -> None:
+        """Start the background OTLP file writer (no-op without TRACE_OTLP_FILE)."""
+        if self._otlp_path is not None and self._task is None:
+            self._task = asyncio.create_task(self._export_loop())
+
+    async def aclose(self) -> None:
+        """Stop the writer and flush the traces still waiting."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _export_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.flush_sec)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write the waiting traces in a worker thread, off the event loop."""
+        if not self._pending or self._otlp_path is None:
+            return
+        batch, self._pending = self._pending, []
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except OSError as e:
+            self.export_errors += len(batch)
+            logger.warning("Trace export of %d traces to %s failed: %s", len(batch), self._otlp_path, e)
+
+    def _write(self, batch: list[Trace]) -> None:
+        lines = "".join(json.dumps(to_otlp(t), separators=(",", ":")) + "\n" for t in batch)
+        with self._otlp_path.open("a") as f:
+            f.write(lines)
+
+    def recent(self, limit: int = 50, slow_only: bool = False) -> list[dict]:
+        traces = [t for t in reversed(self.buffer) if not slow_only or t.attrs.get("sampling.reason") != "head"]
+        return [t.as_dict() for t in traces[:limit]]
+
+    def metrics_lines(self) -> list[str]:
+        return [
+            "# HELP gateway_traces_total Request traces by sampling outcome",
+            "# TYPE gateway_traces_total counter",
+            *(f'gateway_traces_total{{result="{reason}"}} {n}' for reason, n in self.kept.items()),
+            f'gateway_traces_total{{result="dropped"}} {self.dropped}',
+            "# HELP gateway_trace_export_errors_total Traces lost to failed writes to TRACE_OTLP_FILE",
+            "# TYPE gateway_trace_export_errors_total counter",
+            f"gateway_trace_export_errors_total {self.export_errors}",
+            "# HELP gateway_trace_export_dropped_total Traces dropped because the export queue was full",
+            "# TYPE gateway_trace_export_dropped_total counter",
+            f"gateway_trace_export_dropped_total {self.export_dropped}",
+            "# HELP gateway_trace_export_pending Kept traces waiting to be written to TRACE_OTLP_FILE",
+            "# TYPE gateway_trace_export_pending gauge",
+            f"gateway_trace_export_pending {len(self._pending)}",
+        ]
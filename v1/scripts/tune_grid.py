@@ -5,6 +5,15 @@ Milestone 4: Grid search for throughput optimization.
 Sweep max_num_seqs × max_num_batched_tokens, run load test for each config,
 record RPS, p50/p95, error rate. Output best point against SLO.
 
+Workload mix (--scenario SPEC[@weight], repeatable; default fixed_200_200):
+each config is load-tested once per scenario (loadtest/scenarios/registry.py,
+reports tagged grid_<config>_<scenario>_*), then scored as the mix:
+  rps         requests/s of the weighted mix = 1 / sum(weight_i / rps_i)
+              (time to serve one "average" request of the mix)
+  p95_ms      worst scenario p95; p50_ms weight-averaged
+  error_rate  all failures / all requests
+A config is within SLO only if every scenario is. Weights are normalised.
+
 Usage:
   # Mode 1: Run load test for current vLLM config (env vars), append to results
   python scripts/tune_grid.py --single
@@ -15,11 +24,15 @@ Usage:
   # Mode 3: Run load test only (vLLM already running), save to specific file
   python scripts/tune_grid.py --run-loadtest --config-name my_config
 
+  # Optimise for a traffic mix instead of 200/200
+  python scripts/tune_grid.py --quick --scenario chat_summarize@0.7 --scenario 'lognormal?prompt_median=400@0.3'
+
 Env:
   QUICK=1              Use 1 min run per config (default 10 min)
   SLO_P95_MS=5000      p95 latency SLO in ms (default 5000)
   SLO_ERROR_RATE=0.001 Max error rate (default 0.001)
   VLLM_*               Passed to run_vllm_worker.sh in full-grid mode
+  SCENARIO_SEED        Seed of the generated requests (default 0, same for every config)
 """
 
 from __future__ import annotations
@@ -42,6 +55,9 @@ LOADTEST_DIR = REPO_ROOT / "loadtest"
 OUT_DIR = REPO_ROOT / "experiments" / "runs"
 RUN_SCRIPT = REPO_ROOT / "scripts" / "run_vllm_worker.sh"
 LOADTEST_SCRIPT = REPO_ROOT / "scripts" / "run_loadtest.sh"
+sys.path.insert(0, str(LOADTEST_DIR))
+
+from scenarios.registry import DEFAULT_SCENARIO, scenario_tag  # noqa: E402
 
 
 def load_profile(profile_name: str) -> dict:
@@ -99,12 +115,26 @@ def parse_locust_stats(csv_path: Path) -> dict | None:
     return None
 
 
+def parse_workload(values: list[str]) -> list[tuple[str, float]]:
+    """["chat_summarize@0.7", "lognormal"] -> [(spec, normalised weight)]; raises ValueError on bad specs."""
+    workload = []
+    for value in values or [DEFAULT_SCENARIO]:
+        spec, _, weight = value.rpartition("@") if "@" in value else (value, "", "1")
+        scenario_tag(spec)  # validates name and parameters
+        if float(weight) <= 0:
+            raise ValueError(f"scenario weight must be positive: {value!r}")
+        workload.append((spec, float(weight)))
+    total = sum(w for _, w in workload)
+    return [(spec, w / total) for spec, w in workload]
+
+
 def run_loadtest(
     base_url: str = "http://localhost:8000",
     runtime: str | None = None,
     out_prefix: str | None = None,
+    scenario: str = DEFAULT_SCENARIO,
 ) -> Path | None:
-    """Run Locust load test, return path to stats CSV."""
+    """Run Locust load test with one scenario, return path to stats CSV."""
     OUT_DIR.mkdir(parents=True, exist_ok=True)
     quick = os.environ.get("QUICK", "").lower() in ("1", "true", "yes")
     runtime = runtime or ("1m" if quick else "10m")
@@ -114,6 +144,7 @@ def run_loadtest(
 
     env = os.environ.copy()
     env["LOADTEST_RUNTIME"] = runtime
+    env["SCENARIO"] = scenario
 
     cmd = [
         "locust",
@@ -174,17 +205,54 @@ def wait_for_vllm(url: str = "http://localhost:8000", timeout: float = 120) -> b
     return False
 
 
+def run_workload(
+    base_url: str,
+    config_name: str,
+    workload: list[tuple[str, float]],
+    runtime: str | None = None,
+) -> dict | None:
+    """Load test every scenario of the workload and score the mix (see module docstring)."""
+    per_scenario = {}
+    for spec, weight in workload:
+        prefix = f"grid_{config_name}_{scenario_tag(spec)}_{int(time.time())}"
+        stats_path = run_loadtest(base_url=base_url, runtime=runtime, out_prefix=prefix, scenario=spec)
+        metrics = parse_locust_stats(stats_path) if stats_path else None
+        if metrics is None:
+            print(f"  scenario {spec}: load test failed")
+            return None
+        per_scenario[spec] = {**metrics, "weight": weight}
+        if len(workload) > 1:
+            print(f"  {spec}: RPS={metrics['rps']:.2f} p95={metrics['p95_ms']:.0f}ms error={metrics['error_rate']:.4f}")
+    scenarios = per_scenario.values()
+    requests = sum(m["request_count"] for m in scenarios)
+    failures = sum(m["failure_count"] for m in scenarios)
+    return {
+        "request_count": requests,
+        "failure_count": failures,
+        "rps": 0.0 if any(m["rps"] <= 0 for m in scenarios) else 1 / sum(m["weight"] / m["rps"] for m in scenarios),
+        "p50_ms": sum(m["weight"] * m["p50_ms"] for m in scenarios),
+        "p95_ms": max(m["p95_ms"] for m in scenarios),
+        "error_rate": failures / requests if requests else 0,
+        "scenarios": per_scenario,
+    }
+
+
+def within_slo(metrics: dict, slo_p95_ms: float, slo_error_rate: float) -> bool:
+    """Every scenario of the mix meets the SLO."""
+    return all(
+        m["p95_ms"] <= slo_p95_ms and m["error_rate"] <= slo_error_rate for m in metrics["scenarios"].values()
+    )
+
+
 def run_single_config(
     config: dict,
     base_url: str = "http://localhost:8000",
     config_name: str = "single",
+    workload: list[tuple[str, float]] | None = None,
 ) -> dict | None:
     """Run load test for one config (vLLM must already be running with this config)."""
     print(f"Running load test for config: {config_name}")
-    stats_path = run_loadtest(base_url=base_url, out_prefix=f"grid_{config_name}_{int(time.time())}")
-    if not stats_path:
-        return None
-    metrics = parse_locust_stats(stats_path)
+    metrics = run_workload(base_url, config_name, workload or [(DEFAULT_SCENARIO, 1.0)])
     if metrics:
         metrics["config"] = config
         metrics["config_name"] = config_name
@@ -197,8 +265,10 @@ def run_full_grid(
     quick: bool = False,
     slo_p95_ms: float = 5000,
     slo_error_rate: float = 0.001,
+    workload: list[tuple[str, float]] | None = None,
 ) -> list[dict]:
-    """Run full grid: spawn vLLM per config, run load test, record."""
+    """Run full grid: spawn vLLM per config, run the workload's load tests, record."""
+    workload = workload or [(DEFAULT_SCENARIO, 1.0)]
     runtime = "1m" if quick else "10m"
     results = []
 
@@ -238,22 +308,19 @@ def run_full_grid(
                 )
                 continue
 
-            stats_path = run_loadtest(base_url=base_url, runtime=runtime, out_prefix=f"grid_{config_name}_{int(time.time())}")
+            metrics = run_workload(base_url, config_name, workload, runtime=runtime)
             proc.terminate()
             try:
                 proc.wait(timeout=30)
             except subprocess.TimeoutExpired:
                 proc.kill()
 
-            if stats_path:
-                metrics = parse_locust_stats(stats_path)
-                if metrics:
-                    metrics["config"] = {"max_num_seqs": max_num_seqs, "max_num_batched_tokens": max_num_batched_tokens}
-                    metrics["config_name"] = config_name
-                    within_slo = metrics["p95_ms"] <= slo_p95_ms and metrics["error_rate"] <= slo_error_rate
-                    metrics["within_slo"] = within_slo
-                    results.append(metrics)
-                    print(f"  RPS={metrics['rps']:.2f} p95={metrics['p95_ms']:.0f}ms within_slo={within_slo}")
+            if metrics:
+                metrics["config"] = {"max_num_seqs": max_num_seqs, "max_num_batched_tokens": max_num_batched_tokens}
+                metrics["config_name"] = config_name
+                metrics["within_slo"] = within_slo(metrics, slo_p95_ms, slo_error_rate)
+                results.append(metrics)
+                print(f"  RPS={metrics['rps']:.2f} p95={metrics['p95_ms']:.0f}ms within_slo={metrics['within_slo']}")
 
     return results
 
@@ -266,13 +333,19 @@ def main():
     parser.add_argument("--quick", action="store_true", help="Short run (1 min per config)")
     parser.add_argument("--base-url", default="http://localhost:8000", help="vLLM or gateway URL")
     parser.add_argument("--profile", default="throughput", help="Model profile to load (for --single)")
+    parser.add_argument("--scenario", action="append", default=[],
+                        help="Workload scenario SPEC[@weight], repeatable (default fixed_200_200)")
     args = parser.parse_args()
+    try:
+        workload = parse_workload(args.scenario)
+    except ValueError as e:
+        parser.error(str(e))
 
     OUT_DIR.mkdir(parents=True, exist_ok=True)
 
     if args.run_loadtest or args.single:
         config = load_profile(args.profile) if args.single else {}
-        metrics = run_single_config(config, base_url=args.base_url, config_name=args.config_name)
+        metrics = run_single_config(config, base_url=args.base_url, config_name=args.config_name, workload=workload)
         if metrics:
             out_file = OUT_DIR / f"grid_{args.config_name}_{int(time.time())}.json"
             out_file.write_text(json.dumps(metrics, indent=2))
@@ -284,14 +357,18 @@ def main():
     slo_p95 = float(os.environ.get("SLO_P95_MS", "5000"))
     slo_err = float(os.environ.get("SLO_ERROR_RATE", "0.001"))
 
-    results = run_full_grid(base_url=args.base_url, quick=quick, slo_p95_ms=slo_p95, slo_error_rate=slo_err)
+    results = run_full_grid(
+        base_url=args.base_url, quick=quick, slo_p95_ms=slo_p95, slo_error_rate=slo_err, workload=workload
+    )
 
     valid = [r for r in results if r.get("within_slo") and "error" not in r]
     best = max(valid, key=lambda x: x["rps"]) if valid else None
 
     timestamp = time.strftime("%Y-%m-%d_%H%M%S")
     out_file = OUT_DIR / f"grid_full_{timestamp}.json"
-    out_file.write_text(json.dumps({"results": results, "best": best, "slo_p95_ms": slo_p95}, indent=2))
+    out_file.write_text(
+        json.dumps({"results": results, "best": best, "slo_p95_ms": slo_p95, "workload": dict(workload)}, indent=2)
+    )
 
     print(f"\n--- Results saved: {out_file} ---")
     if best:
@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""
+Shared upstream HTTP client and worker pool for gateway -> vLLM traffic.
+
+The gateway used to open a new httpx.AsyncClient per request (or per batch),
+paying a TCP handshake and a fresh pool every time. UpstreamClient owns one
+pooled client for the whole gateway lifespan so requests reuse keep-alive
+connections, and keeps per-upstream counters for /metrics.
+
+UpstreamPool spreads requests over several vLLM workers (VLLM_URLS):
+- least_outstanding: worker with fewest in-flight requests (EWMA latency breaks ties)
+- p2c:               power of two choices — sample two healthy workers, take the less loaded
+- prefix_hash:       consistent hash of the leading PREFIX_HASH_CHARS characters of
+                     `messages` onto a ring of workers, so requests sharing a prompt
+                     prefix land on the same vLLM prefix cache. Bounded load: a worker
+                     already above PREFIX_HASH_LOAD_FACTOR x the average in-flight is
+                     skipped and the request spills to the next worker on the ring.
+A worker that fails EJECT_AFTER_FAILURES times in a row (5xx or transport
+error) is ejected for EJECT_SEC, then gets traffic again (passive health).
+
+Env:
+  UPSTREAM_MAX_CONNECTIONS    Max open connections in the pool (default 256)
+  UPSTREAM_MAX_KEEPALIVE      Max idle keep-alive connections kept (default 64)
+  UPSTREAM_KEEPALIVE_EXPIRY   Seconds an idle connection is kept (default 30)
+  UPSTREAM_HTTP2              1 = negotiate HTTP/2 (needs `h2`, else HTTP/1.1)
+  UPSTREAM_DRAIN_TIMEOUT_SEC  Max seconds to wait for in-flight on shutdown (default 30)
+  VLLM_URLS                   Comma-separated worker URLs (default VLLM_URL)
+  ROUTING_POLICY              least_outstanding | p2c | prefix_hash (default least_outstanding)
+  PREFIX_HASH_CHARS           prefix_hash: characters of messages hashed (default 512, ~128 tokens)
+  PREFIX_HASH_LOAD_FACTOR     prefix_hash: bounded-load factor c >= 1 (default 1.25)
+  PREFIX_HASH_VNODES          prefix_hash: virtual nodes per worker on the ring (default 100)
+  EJECT_AFTER_FAILURES        Consecutive failures before ejection (default 5)
+  EJECT_SEC                   Ejection duration in seconds (default 30)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import random
+import time
+from bisect import bisect
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class UpstreamConfig:
+    """Connection pool settings for the shared upstream client."""
+
+    max_connections: int = 256
+    max_keepalive_connections: int = 64
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    drain_timeout_sec: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> UpstreamConfig:
+        return cls(
+            max_connections=int(os.environ.get("UPSTREAM_MAX_CONNECTIONS", "256")),
+            max_keepalive_connections=int(os.environ.get("UPSTREAM_MAX_KEEPALIVE", "64")),
+            keepalive_expiry=float(os.environ.get("UPSTREAM_KEEPALIVE_EXPIRY", "30")),
+            http2=os.environ.get("UPSTREAM_HTTP2", "").lower() in ("1", "true", "yes"),
+            drain_timeout_sec=float(os.environ.get("UPSTREAM_DRAIN_TIMEOUT_SEC", "30")),
+        )
+
+
+@dataclass
+class UpstreamStats:
+    """Counters for one upstream base URL."""
+
+    requests_total: int = 0
+    errors_total: int = 0
+    in_flight: int = 0
+
+
+def _hash64(text: str) -> int:
+    """Stable 64-bit hash (Python's hash() is salted per process)."""
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class UpstreamClient:
+    """One pooled httpx.AsyncClient shared by every upstream call of the gateway."""
+
+    def __init__(self, config: UpstreamConfig | None = None) -> None:
+        self.config = config or UpstreamConfig()
+        self._client: httpx.AsyncClient | None = None
+        self._transport: httpx.AsyncHTTPTransport | None = None
+        self._stats: dict[str, UpstreamStats] = {}
+        self._draining = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._in_flight_total = 0
+
+    async def start(self) -> None:
+        """Create the pooled client. Idempotent."""
+        if self._client is not None:
+            return
+        http2 = self.config.http2
+        if http2 and not _h2_available():
+            logger.warning("UPSTREAM_HTTP2=1 but package 'h2' is not installed; using HTTP/1.1")
+            http2 = False
+        limits = httpx.Limits(
+            max_connections=self.config.max_connections,
+            max_keepalive_connections=self.config.max_keepalive_connections,
+            keepalive_expiry=self.config.keepalive_expiry,
+        )
+        self._transport = httpx.AsyncHTTPTransport(limits=limits, http2=http2)
+        self._client = httpx.AsyncClient(transport=self._transport)
+        self._draining = False
+        logger.info(
+            "Upstream client started: max_connections=%s keepalive=%s expiry=%ss http2=%s",
+            self.config.max_connections,
+            self.config.max_keepalive_connections,
+            self.config.keepalive_expiry,
+            http2,
+        )
+
+    async def aclose(self) -> None:
+        """Stop taking new requests, wait for in-flight to drain (bounded), close the pool."""
+        if self._client is None:
+            return
+        self._draining = True
+        if self._in_flight_total > 0:
+            logger.info("Upstream client draining %s in-flight request(s)", self._in_flight_total)
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout=self.config.drain_timeout_sec)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "Upstream drain timeout after %ss, %s request(s) still in flight",
+                    self.config.drain_timeout_sec,
+                    self._in_flight_total,
+                )
+        await self._client.aclose()
+        self._client = None
+        self._transport = None
+
+    @property
+    def draining(self) -> bool:
+        return self._draining
+
+    def stats(self, base_url: str) -> UpstreamStats:
+        """Counters for base_url (created on first use)."""
+        st = self._stats.get(base_url)
+        if st is None:
+            st = self._stats[base_url] = UpstreamStats()
+        return st
+
+    def _begin(self, base_url: str) -> UpstreamStats:
+        if self._client is None or self._draining:
+            raise RuntimeError("upstream client is not accepting requests")
+        st = self.stats(base_url)
+        st.requests_total += 1
+        st.in_flight += 1
+        self._in_flight_total += 1
+        self._idle.clear()
+        return st
+
+    def _end(self, st: UpstreamStats) -> None:
+        st.in_flight -= 1
+        self._in_flight_total -= 1
+        if self._in_flight_total == 0:
+            self._idle.set()
+
+    async def request(
+        self,
+        method: str,
+        base_url: str,
+        path: str,
+        *,
+        json: Any = None,
+        timeout: float = 120.0,
+    ) -> httpx.Response:
+        """Send one request to base_url + path on the shared pool (body read eagerly)."""
+        st = self._begin(base_url)
+        try:
+            r = await self._client.request(method, f"{base_url}{path}", json=json, timeout=timeout)
+            if r.status_code >= 500:
+                st.errors_total += 1
+            return r
+        except Exception:
+            st.errors_total += 1
+            raise
+        finally:
+            self._end(st)
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        method: str,
+        base_url: str,
+        path: str,
+        *,
+        json: Any = None,
+        timeout: float = 120.0,
+    ) -> AsyncIterator[httpx.Response]:
+        """Open a streaming response on the shared pool; the request stays in flight until exit.
+
+        Leaving the block early (client disconnect, cancellation) closes the upstream
+        connection, which makes vLLM abort the generation.
+        """
+        st = self._begin(base_url)
+        try:
+            async with self._client.stream(method, f"{base_url}{path}", json=json, timeout=timeout) as r:
+                if r.status_code >= 500:
+                    st.errors_total += 1
+                yield r
+        except Exception:
+            st.errors_total += 1
+            raise
+        finally:
+            self._end(st)
+
+    def connection_counts(self) -> dict[str, tuple[int, int]]:
+        """Per-origin (active, idle) connection counts from the transport's pool."""
+        # httpx keeps its httpcore pool private; read it defensively.
+        pool = getattr(self._transport, "_pool", None)
+        out: dict[str, tuple[int, int]] = {}
+        if pool is None:
+            return out
+        for conn in list(pool.connections):
+            origin = str(getattr(conn, "_origin", "unknown"))
+            active, idle = out.get(origin, (0, 0))
+            if conn.is_idle():
+                idle += 1
+            else:
+                active += 1
+            out[origin] = (active, idle)
+        return out
+
+    def metrics_lines(self) -> list[str]:
+        """Prometheus lines: per-upstream requests/errors/in-flight and pool connections."""
+        lines = [
+            "# HELP gateway_upstream_requests_total Requests sent to each upstream",
+            "# TYPE gateway_upstream_requests_total counter",
+        ]
+        lines += [f'gateway_upstream_requests_total{{upstream="{u}"}} {s.requests_total}' for u, s in self._stats.items()]
+        lines += [
+            "# HELP gateway_upstream_errors_total Upstream transport errors and 5xx responses",
+            "# TYPE gateway_upstream_errors_total counter",
+        ]
+        lines += [f'gateway_upstream_errors_total{{upstream="{u}"}} {s.errors_total}' for u, s in self._stats.items()]
+        lines += [
+            "# HELP gateway_upstream_in_flight Requests awaiting a response from each upstream",
+            "# TYPE gateway_upstream_in_flight gauge",
+        ]
+        lines += [f'gateway_upstream_in_flight{{upstream="{u}"}} {s.in_flight}' for u, s in self._stats.items()]
+        lines += [
+            "# HELP gateway_upstream_connections Pooled connections per upstream origin",
+            "# TYPE gateway_upstream_connections gauge",
+        ]
+        for origin, (active, idle) in sorted(self.connection_counts().items()):
+            lines.append(f'gateway_upstream_connections{{upstream="{origin}",state="active"}} {active}')
+            lines.append(f'gateway_upstream_connections{{upstream="{origin}",state="idle"}} {idle}')
+        return lines
+
+
+@dataclass
+class Endpoint:
+    """One vLLM worker as seen by the router."""
+
+    url: str
+    in_flight: int = 0
+    ewma_latency_sec: float = 0.0
+    consecutive_failures: int = 0
+    ejected_until: float = 0.0  # time.monotonic()
+    weight: float = 1.0  # share of traffic while a blue/green swap shifts it (see pick)
+    requests_total: int = 0
+    failures_total: int = 0
+    ejections_total: int = 0
+    prefix_home_total: int = 0  # prefix_hash: routed to the prefix's home worker
+    prefix_spill_total: int = 0  # prefix_hash: home was over its load bound
+
+    def available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+
+class UpstreamPool:
+    """Route requests across worker endpoints; track load, latency and passive health."""
+
+    POLICIES = ("least_outstanding", "p2c", "prefix_hash")
+
+    def __init__(
+        self,
+        urls: list[str],
+        policy: str = "least_outstanding",
+        eject_after_failures: int = 5,
+        eject_sec: float = 30.0,
+        ewma_alpha: float = 0.3,
+        prefix_chars: int = 512,
+        load_factor: float = 1.25,
+        vnodes: int = 100,
+    ) -> None:
+        if policy not in self.POLICIES:
+            raise ValueError(f"unknown ROUTING_POLICY {policy!r} (expected one of {self.POLICIES})")
+        self.policy = policy
+        self.eject_after_failures = eject_after_failures
+        self.eject_sec = eject_sec
+        self.ewma_alpha = ewma_alpha
+        self.prefix_chars = prefix_chars
+        self.load_factor = max(1.0, load_factor)
+        self.vnodes = vnodes
+        self.endpoints: list[Endpoint] = [Endpoint(url=u.rstrip("/")) for u in urls]
+        self._removed: list[Endpoint] = []  # out of routing, still finishing requests
+        self._ring: list[tuple[int, Endpoint]] = []
+        self._ring_keys: list[int] = []
+        self._rebuild_ring()
+
+    @classmethod
+    def from_env(cls, default_url: str, managed: bool = False) -> UpstreamPool:
+        """managed=True: start empty, endpoints are added as managed workers become ready."""
+        raw = os.environ.get("VLLM_URLS", "")
+        urls = [] if managed else ([u.strip() for u in raw.split(",") if u.strip()] or [default_url])
+        return cls(
+            urls,
+            policy=os.environ.get("ROUTING_POLICY", "least_outstanding").lower(),
+            eject_after_failures=int(os.environ.get("EJECT_AFTER_FAILURES", "5")),
+            eject_sec=float(os.environ.get("EJECT_SEC", "30")),
+            prefix_chars=int(os.environ.get("PREFIX_HASH_CHARS", "512")),
+            load_factor=float(os.environ.get("PREFIX_HASH_LOAD_FACTOR", "1.25")),
+            vnodes=int(os.environ.get("PREFIX_HASH_VNODES", "100")),
+        )
+
+    def _rebuild_ring(self) -> None:
+        """Place `vnodes` points per worker on the hash ring (call after endpoints change)."""
+        ring = [(_hash64(f"{e.url}#{i}"), e) for e in self.endpoints for i in range(self.vnodes)]
+        ring.sort(key=lambda item: item[0])
+        self._ring = ring
+        self._ring_keys = [h for h, _ in ring]
+
+    def endpoint(self, url: str) -> Endpoint | None:
+        url = url.rstrip("/")
+        return next((e for e in self.endpoints if e.url == url), None)
+
+    def in_flight(self, url: str) -> int:
+        """Requests in flight to url, counting those on an endpoint already removed from routing."""
+        url = url.rstrip("/")
+        return sum(e.in_flight for e in (*self.endpoints, *self._removed) if e.url == url)
+
+    def add_endpoint(self, url: str) -> Endpoint:
+        """Start routing to url (idempotent); used when a managed worker becomes ready."""
+        url = url.rstrip("/")
+        for e in self.endpoints:
+            if e.url == url:
+                return e
+        ep = Endpoint(url=url)
+        self.endpoints.append(ep)
+        self._rebuild_ring()
+        return ep
+
+    def remove_endpoint(self, url: str) -> Endpoint | None:
+        """Stop routing new requests to url; in-flight ones finish on the returned Endpoint."""
+        url = url.rstrip("/")
+        for e in self.endpoints:
+            if e.url == url:
+                self.endpoints.remove(e)
+                self._rebuild_ring()
+                self._removed = [r for r in self._removed if r.in_flight > 0] + [e]
+                return e
+        return None
+
+    def prefix_key(self, body: dict[str, Any]) -> str:
+        """Leading prefix_chars characters of the conversation (roles included)."""
+        parts: list[str] = []
+        size = 0
+        for m in body.get("messages") or []:
+            part = f"{m.get('role', '')}:{m.get('content', '')}\n"
+            parts.append(part)
+            size += len(part)
+            if size >= self.prefix_chars:
+                break
+        return "".join(parts)[: self.prefix_chars]
+
+    def _candidates(self) -> list[Endpoint]:
+        now = time.monotonic()
+        healthy = [e for e in self.endpoints if e.available(now)]
+        # Everyone ejected: trying a worker beats failing every request
+        return healthy or self.endpoints
+
+    def pick(self, body: dict[str, Any] | None = None) -> Endpoint:
+        """Choose a worker for the next request (body is needed for prefix_hash)."""
+        candidates = self._candidates()
+        if not candidates:
+            raise RuntimeError("no upstream worker available")
+        if len(candidates) == 1:
+            return candidates[0]
+        weights = [e.weight for e in candidates]
+        if any(w != 1.0 for w in weights) and sum(weights) > 0:
+            # Traffic shift in progress (scripts/hotswap.py): weights override the policy
+            return random.choices(candidates, weights=weights)[0]
+        if self.policy == "prefix_hash" and body is not None:
+            return self._pick_prefix(body, candidates)
+        if self.policy == "p2c":
+            candidates = random.sample(candidates, 2)
+        # Failing workers answer fast and would look idle; rank them last until they recover
+        return min(candidates, key=lambda e: (e.consecutive_failures > 0, e.in_flight, e.ewma_latency_sec))
+
+    def _pick_prefix(self, body: dict[str, Any], candidates: list[Endpoint]) -> Endpoint:
+        """Consistent hashing with bounded loads: walk the ring from the prefix's point."""
+        allowed = {id(e) for e in candidates}
+        total = sum(e.in_flight for e in candidates)
+        capacity = math.ceil(self.load_factor * (total + 1) / len(candidates))
+        start = bisect(self._ring_keys, _hash64(self.prefix_key(body)))
+        home: Endpoint | None = None
+        seen: set[int] = set()
+        for i in range(len(self._ring)):
+            ep = self._ring[(start + i) % len(self._ring)][1]
+            if id(ep) in seen or id(ep) not in allowed:
+                continue
+            seen.add(id(ep))
+            if home is None:
+                home = ep
+            if ep.in_flight < capacity:
+                if ep is home:
+                    ep.prefix_home_total += 1
+                else:
+                    home.prefix_spill_total += 1
+                return ep
+            if len(seen) == len(allowed):
+                break
+        # Unreachable while capacity > average load; keep a safe fallback
+        return min(candidates, key=lambda e: e.in_flight)
+
+    def begin(self, ep: Endpoint) -> float:
+        """Mark a request as sent to ep; returns the start time for end()."""
+        ep.in_flight += 1
+        ep.requests_total += 1
+        return time.monotonic()
+
+    def end(self, ep: Endpoint, started_at: float, ok: bool) -> None:
+        """Record the outcome of a request started with begin()."""
+        ep.in_flight -= 1
+        if ok:
+            elapsed = time.monotonic() - started_at
+            if ep.ewma_latency_sec == 0.0:
+                ep.ewma_latency_sec = elapsed
+            else:
+                ep.ewma_latency_sec += self.ewma_alpha * (elapsed - ep.ewma_latency_sec)
+            ep.consecutive_failures = 0
+            return
+        ep.failures_total += 1
+        ep.consecutive_failures += 1
+        now = time.monotonic()
+        if ep.consecutive_failures >= self.eject_after_failures and ep.available(now):
+            ep.ejected_until = now + self.eject_sec
+            ep.ejections_total += 1
+            logger.warning(
+                "Upstream %s ejected for %ss after %s consecutive failures",
+                ep.url,
+                self.eject_sec,
+                ep.consecutive_failures,
+            )
+
+    def metrics_lines(self) -> list[str]:
+        now = time.monotonic()
+        specs = [
+            ("gateway_worker_in_flight", "gauge", "Requests in flight per worker", lambda e: e.in_flight),
+            ("gateway_worker_ewma_latency_seconds", "gauge", "EWMA of successful request latency per worker",
+             lambda e: round(e.ewma_latency_sec, 6)),
+            ("gateway_worker_requests_total", "counter", "Requests routed to each worker", lambda e: e.requests_total),
+            ("gateway_worker_failures_total", "counter", "Failed requests (5xx or transport) per worker",
+             lambda e: e.failures_total),
+            ("gateway_worker_ejections_total", "counter", "Passive health ejections per worker",
+             lambda e: e.ejections_total),
+            ("gateway_worker_healthy", "gauge", "1 if the worker is not ejected", lambda e: int(e.available(now))),
+        ]
+        if self.policy == "prefix_hash":
+            specs += [
+                ("gateway_worker_prefix_home_total", "counter",
+                 "prefix_hash: requests served by the prefix's home worker", lambda e: e.prefix_home_total),
+                ("gateway_worker_prefix_spill_total", "counter",
+                 "prefix_hash: requests whose home worker was over the load bound", lambda e: e.prefix_spill_total),
+                ("gateway_worker_prefix_affinity_ratio", "gauge",
+                 "prefix_hash: home / (home + spill) for prefixes homed on the worker",
+                 lambda e: round(e.prefix_home_total / max(1, e.prefix_home_total + e.prefix_spill_total), 4)),
+            ]
+        lines: list[str] = []
+        for name, kind, help_text, value in specs:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [f'{name}{{worker="{e.url}"}} {value(e)}' for e in self.endpoints]
+        return lines
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Pool of worker processes on consecutive ports, autoscaled on gateway load.
+
+Each replica is a scripts/supervisor.Supervisor (own WorkerProcess, readiness
+probes, cold-start metrics) with idle demotion disabled; the pool decides how
+many replicas run. Ready replicas are added to the gateway's UpstreamPool, so
+the routing policy (least_outstanding / p2c / prefix_hash) spreads traffic
+over them.
+
+  load         gateway queue depth (batch queue + in flight)
+  per replica  load / replicas (starting + ready, not draining)
+  scale up     load / replicas > SCALE_UP_PER_WORKER
+               -> start up to ceil(load / SCALE_UP_PER_WORKER) replicas,
+                  at most once per SCALE_UP_COOLDOWN_SEC
+  scale down   load / (replicas - 1) < SCALE_DOWN_PER_WORKER, continuously for
+               SCALE_DOWN_COOLDOWN_SEC and that long after the last scale-up
+               -> drain one replica
+
+The gap between the two thresholds is the hysteresis band: a load that just
+triggered a scale-up does not trigger a scale-down on the new replica count.
+Draining: the replica leaves routing first; its process is stopped once its
+in-flight requests reach 0 (or after DRAIN_TIMEOUT_SEC). A replica that dies
+is dropped and replaced on the next evaluation if still needed. With
+WORKER_POOL_MIN=0 the first request starts a replica and waits for it.
+
+GPU memory: every vLLM replica claims gpu_memory_utilization of its device up
+front, so replicas sharing a GPU would not fit at the full VLLM_GPU_MEMORY_UTILIZATION.
+Replicas go to the WORKER_POOL_GPUS device with the fewest replicas
+(CUDA_VISIBLE_DEVICES; default one shared device), and each gets
+VLLM_GPU_MEMORY_UTILIZATION / ceil(WORKER_POOL_MAX / devices), e.g. 0.85 / 2 for
+two replicas on one GPU. A small card fits only a small model / max_model_len
+at that share.
+
+/metrics exports gateway_worker_pool_* (replicas by state, desired replicas,
+load per replica) for an external autoscaler; v2/k8s/worker-hpa.yaml scales the
+worker Deployment on the same signal.
+
+Env:
+  WORKER_POOL_MAX           Max replicas (default 0 = pool off, single worker via ENABLE_SUPERVISOR)
+  WORKER_POOL_MIN           Min replicas kept running (default 1; 0 = scale to zero)
+  WORKER_POOL_BASE_PORT     Port of the first replica, the others follow (default VLLM_PORT or 8000;
+                            GATEWAY_PORT is skipped)
+  SCALE_UP_PER_WORKER       Load per replica above which to scale up (default 8)
+  SCALE_DOWN_PER_WORKER     Load per remaining replica below which to scale down (default 2)
+  SCALE_UP_COOLDOWN_SEC     Min seconds between scale-ups (default 30)
+  SCALE_DOWN_COOLDOWN_SEC   Low load / time since last scale event before draining (default 120)
+  SCALE_EVAL_SEC            Evaluation period (default 1)
+  DRAIN_TIMEOUT_SEC         Max seconds to wait for a draining replica's in-flight (default 120)
+  WORKER_POOL_GPUS          Comma-separated CUDA device ids to spread replicas over (default: none,
+                            all replicas on the visible GPU)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from scripts.supervisor import Supervisor, WorkerState
+from scripts.upstream import Endpoint, UpstreamPool
+from scripts.worker_process import gpu_memory_utilization
+
+logger = logging.getLogger(__name__)
+
+READY_TIMEOUT_SEC = 600.0  # a replica not RUNNING by then counts as failed
+
+
+@dataclass
+class AutoscaleConfig:
+    """Replica bounds, thresholds and cooldowns."""
+
+    max_workers: int = 0
+    min_workers: int = 1
+    base_port: int = 8000
+    host: str = "127.0.0.1"
+    skip_port: int | None = None
+    scale_up_per_worker: float = 8.0
+    scale_down_per_worker: float = 2.0
+    scale_up_cooldown_sec: float = 30.0
+    scale_down_cooldown_sec: float = 120.0
+    eval_sec: float = 1.0
+    drain_timeout_sec: float = 120.0
+    gpus: tuple[str, ...] = ()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_workers > 0
+
+    @classmethod
+    def from_env(cls) -> AutoscaleConfig:
+        max_workers = int(os.environ.get("WORKER_POOL_MAX", "0"))
+        return cls(
+            max_workers=max_workers,
+            min_workers=min(max_workers, int(os.environ.get("WORKER_POOL_MIN", "1"))),
+            base_port=int(os.environ.get("WORKER_POOL_BASE_PORT", os.environ.get("VLLM_PORT", "8000"))),
+            skip_port=int(os.environ.get("GATEWAY_PORT", "8001")),
+            scale_up_per_worker=float(os.environ.get("SCALE_UP_PER_WORKER", "8")),
+            scale_down_per_worker=float(os.environ.get("SCALE_DOWN_PER_WORKER", "2")),
+            scale_up_cooldown_sec=float(os.environ.get("SCALE_UP_COOLDOWN_SEC", "30")),
+            scale_down_cooldown_sec=float(os.environ.get("SCALE_DOWN_COOLDOWN_SEC", "120")),
+            eval_sec=float(os.environ.get("SCALE_EVAL_SEC", "1")),
+            drain_timeout_sec=float(os.environ.get("DRAIN_TIMEOUT_SEC", "120")),
+            gpus=tuple(g.strip() for g in os.environ.get("WORKER_POOL_GPUS", "").split(",") if g.strip()),
+        )
+
+    def replica_gpu_share(self) -> float:
+        """gpu_memory_utilization per replica: the device's share split over the replicas it may hold."""
+        per_device = math.ceil(self.max_workers / max(1, len(self.gpus)))
+        return gpu_memory_utilization() / max(1, per_device)
+
+
+@dataclass
+class _Replica:
+    port: int
+    url: str
+    supervisor: Supervisor
+    endpoint: Endpoint | None = None  # set while routed
+    gpu: str | None = None  # CUDA_VISIBLE_DEVICES of the replica (WORKER_POOL_GPUS)
+    draining: bool = False
+
+
+class WorkerPool:
+    """Starts, routes and drains Supervisor-managed replicas to follow `load()`."""
+
+    def __init__(self, config: AutoscaleConfig, upstream_pool: UpstreamPool, load: Callable[[], int]) -> None:
+        self.config = config
+        self.upstream_pool = upstream_pool
+        self._load = load
+        self.replicas: dict[int, _Replica] = {}  # port -> replica
+        self._task: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()  # replica admit / retire, kept until done
+        self._ready_changed: asyncio.Event | None = None  # replaced whenever a replica joins routing
+        self._last_scale_up = -math.inf
+        self._last_scale_down = -math.inf
+        self._low_since: float | None = None  # load has fit in one replica fewer since
+        self.scale_ups = 0
+        self.scale_downs = 0
+        self.failed_replicas = 0
+
+    @property
+    def active(self) -> list[_Replica]:
+        return [r for r in self.replicas.values() if not r.draining]
+
+    @property
+    def ready(self) -> list[_Replica]:
+        return [r for r in self.active if r.endpoint is not None]
+
+    def desired(self, load: int) -> int:
+        """Replicas the scale-up threshold asks for at this load, within [min, max]."""
+        want = math.ceil(load / self.config.scale_up_per_worker) if load > 0 else 0
+        return max(self.config.min_workers, min(self.config.max_workers, want))
+
+    def _free_port(self) -> int:
+        port = self.config.base_port
+        while port in self.replicas or port == self.config.skip_port:
+            port += 1
+        return port
+
+    def _notify(self) -> None:
+        if self._ready_changed is not None:
+            self._ready_changed.set()
+            self._ready_changed = asyncio.Event()
+
+    def _background(self, coro) -> None:
+        """Run coro as a task the pool holds on to (the loop keeps only weak references)."""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Worker pool task failed", exc_info=task.exception())
+
+    def _placement(self) -> tuple[str | None, dict]:
+        """(device, profile) of a new replica: least-used WORKER_POOL_GPUS device, split memory share."""
+        profile = {}
+        share = self.config.replica_gpu_share()
+        if share > 0:  # 0 = mock backend, no GPU
+            profile["gpu_memory_utilization"] = round(share, 3)
+        if not self.config.gpus:
+            return None, profile
+        # Draining replicas still hold their memory until stopped
+        used = {g: 0 for g in self.config.gpus}
+        for r in self.replicas.values():
+            if r.gpu in used:
+                used[r.gpu] += 1
+        gpu = min(self.config.gpus, key=lambda g: used[g])
+        profile["cuda_visible_devices"] = gpu
+        return gpu, profile
+
+    def _spawn(self) -> _Replica:
+        port = self._free_port()
+        url = f"http://{self.config.host}:{port}"
+        gpu, profile = self._placement()
+        # The pool decides when a replica goes away: no idle demotion in the supervisor
+        sup = Supervisor(
+            worker_url=url,
+            idle_timeout_sec=math.inf,
+            in_flight=lambda: self.upstream_pool.in_flight(url),
+            drain_timeout_sec=self.config.drain_timeout_sec,
+            profile=profile,
+        )
+        replica = _Replica(port=port, url=url, supervisor=sup, gpu=gpu)
+        self.replicas[port] = replica
+        sup.start_background_loop()
+        sup.start_if_needed()
+        self._background(self._admit(replica))
+        logger.info(
+            "Worker pool: starting replica on port %s (%d active, %s)", port, len(self.active), profile or "env"
+        )
+        return replica
+
+    async def _admit(self, replica: _Replica) -> None:
+        """Route to the replica once its supervisor reports RUNNING."""
+        ok = await replica.supervisor.wait_until_ready(READY_TIMEOUT_SEC)
+        if replica.draining:
+            return
+        if not ok:
+            logger.warning("Worker pool: replica on port %s failed to start", replica.port)
+            self.failed_replicas += 1
+            await self._retire(replica)
+            return
+        replica.endpoint = self.upstream_pool.add_endpoint(replica.url)
+        logger.info("Worker pool: replica on port %s ready (%d ready)", replica.port, len(self.ready))
+        self._notify()
+
+    def _drain(self, replica: _Replica) -> None:
+        replica.draining = True
+        if replica.endpoint is not None:
+            self.upstream_pool.remove_endpoint(replica.url)
+        logger.info("Worker pool: draining replica on port %s (%d active)", replica.port, len(self.active))
+        self._background(self._retire(replica))
+
+    async def _retire(self, replica: _Replica) -> None:
+        """Stop the replica; its supervisor drains in-flight requests first (bounded)."""
+        replica.draining = True
+        await replica.supervisor.shutdown()
+        self.replicas.pop(replica.port, None)
+        logger.info("Worker pool: replica on port %s stopped", replica.port)
+
+    def _pick_victim(self) -> _Replica:
+        """Prefer a replica that is still starting, else the least busy one."""
+        return min(
+            self.active,
+            key=lambda r: (r.endpoint is not None, r.endpoint.in_flight if r.endpoint is not None else 0, -r.port),
+        )
+
+    def evaluate(self, now: float | None = None) -> None:
+        """One autoscaling step: replace dead replicas, then scale up or down."""
+        now = time.monotonic() if now is None else now
+        for r in self.active:
+            if r.endpoint is not None and r.supervisor.state == WorkerState.IDLE:
+                logger.warning("Worker pool: replica on port %s died", r.port)
+                self.failed_replicas += 1
+                self._drain(r)
+
+        cfg = self.config
+        load = self._load()
+        n = len(self.active)
+
+        while n < cfg.min_workers:
+            self._spawn()
+            n += 1
+
+        overloaded = load > cfg.scale_up_per_worker * n if n else load > 0
+        cooled = n == 0 or now - self._last_scale_up >= cfg.scale_up_cooldown_sec
+        if overloaded and n < cfg.max_workers and cooled:
+            target = max(n + 1, self.desired(load))
+            logger.info("Worker pool: load %d over %d replica(s), scaling up to %d", load, n, target)
+            for _ in range(target - n):
+                self._spawn()
+            self._last_scale_up = now
+            self.scale_ups += 1
+            self._low_since = None
+            return
+
+        fits_fewer = n > cfg.min_workers and load <= cfg.scale_down_per_worker * (n - 1)
+        if not fits_fewer:
+            self._low_since = None
+            return
+        if self._low_since is None:
+            self._low_since = now
+        settle = cfg.scale_down_cooldown_sec
+        if now - self._low_since >= settle and now - max(self._last_scale_up, self._last_scale_down) >= settle:
+            logger.info("Worker pool: load %d fits in %d replica(s), scaling down", load, n - 1)
+            self._drain(self._pick_victim())
+            self._last_scale_down = now
+            self.scale_downs += 1
+            self._low_since = now
+
+    async def ensure_ready(self, timeout: float) -> bool:
+        """Wait until at least one replica is routed (scale from zero starts one)."""
+        deadline = time.monotonic() + timeout
+        while not self.ready:
+            if not self.active:
+                self._spawn()
+                self._last_scale_up = time.monotonic()
+                self.scale_ups += 1
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._ready_changed is None:
+                return False
+            try:
+                await asyncio.wait_for(self._ready_changed.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                self.evaluate()
+            except Exception as e:
+                logger.exception("Worker pool loop error: %s", e)
+            await asyncio.sleep(self.config.eval_sec)
+
+    def start(self) -> None:
+        """Start min_workers replicas and the autoscaling loop."""
+        self._ready_changed = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info("Worker pool started: %s", self.config)
+
+    async def aclose(self) -> None:
+        """Stop the loop and every replica (callers drain upstream traffic first)."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        replicas = list(self.replicas.values())
+        for r in replicas:
+            if r.endpoint is not None and not r.draining:
+                self.upstream_pool.remove_endpoint(r.url)
+            r.draining = True
+        await asyncio.gather(*(r.supervisor.shutdown() for r in replicas))
+        self.replicas.clear()
+
+    def metrics_lines(self) -> list[str]:
+        load = self._load()
+        starting = sum(1 for r in self.active if r.endpoint is None)
+        draining = len(self.replicas) - len(self.active)
+        n_ready = len(self.ready)
+        return [
+            "# HELP gateway_worker_pool_replicas Worker replicas by state",
+            "# TYPE gateway_worker_pool_replicas gauge",
+            f'gateway_worker_pool_replicas{{state="starting"}} {starting}',
+            f'gateway_worker_pool_replicas{{state="ready"}} {n_ready}',
+            f'gateway_worker_pool_replicas{{state="draining"}} {draining}',
+            "# HELP gateway_worker_pool_desired_replicas Replicas wanted at the current load (SCALE_UP_PER_WORKER)",
+            "# TYPE gateway_worker_pool_desired_replicas gauge",
+            f"gateway_worker_pool_desired_replicas {self.desired(load)}",
+            "# HELP gateway_worker_pool_load_per_replica Gateway queue depth per ready replica (HPA target)",
+            "# TYPE gateway_worker_pool_load_per_replica gauge",
+            f"gateway_worker_pool_load_per_replica {load / max(1, n_ready):.3f}",
+            "# HELP gateway_worker_pool_scale_events_total Autoscaling decisions by direction",
+            "# TYPE gateway_worker_pool_scale_events_total counter",
+            f'gateway_worker_pool_scale_events_total{{direction="up"}} {self.scale_ups}',
+            f'gateway_worker_pool_scale_events_total{{direction="down"}} {self.scale_downs}',
+            "# HELP gateway_worker_pool_failed_replicas_total Replicas that failed to start or died",
+            "# TYPE gateway_worker_pool_failed_replicas_total counter",
+            f"gateway_worker_pool_failed_replicas_total {self.failed_replicas}",
+        ]
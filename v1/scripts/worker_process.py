@@ -4,28 +4,119 @@ Milestone 6: Spawn and control vLLM worker process (scale-to-zero).
 
 Builds the same command as run_vllm_worker.sh so the worker runs with
 identical args (model, max-model-len, max-num-seqs, etc.).
+
+The process is an asyncio subprocess: start() / stop() never block the event
+loop. stdout and stderr are merged into one pipe that a background task reads
+line by line into a bounded ring buffer (so a chatty worker can never stall on
+a full pipe); the tail is served by the gateway at GET /admin/worker/logs. A
+line matching WORKER_READY_PATTERN sets `log_ready`, which the supervisor uses
+to probe readiness right away instead of waiting for the next backoff step.
+stop() sends SIGTERM, then SIGKILL after WORKER_STOP_TIMEOUT_SEC.
+
+A profile (configs/model_profiles/<name>.yaml, or a dict of the same keys)
+overrides the matching VLLM_* env vars for this process only, so two workers
+with different profiles can run side by side (blue/green swap, scripts/hotswap.py).
+
+Env:
+  WORKER_BACKEND          vllm (default) | mock: run scripts/mock_vllm.py on VLLM_PORT
+                          instead, with simulated spawn/load time (MOCK_SPAWN_SEC,
+                          MOCK_LOAD_SEC) for testing scale-to-zero without a GPU
+  WORKER_LOG_LINES        Worker output lines kept in memory (default 1000)
+  WORKER_READY_PATTERN    Regex on worker output that signals "probably ready"
+                          (default: uvicorn's "Application startup complete")
+  WORKER_STOP_TIMEOUT_SEC Seconds between SIGTERM and SIGKILL (default 30)
 """
 
 from __future__ import annotations
 
+import asyncio
+import collections
+import logging
 import os
+import re
 import shutil
-import subprocess
 import sys
 from pathlib import Path
 
 REPO_ROOT = Path(__file__).resolve().parent.parent
+WORKER_LOG_LINES = int(os.environ.get("WORKER_LOG_LINES", "1000"))
+WORKER_READY_PATTERN = re.compile(os.environ.get("WORKER_READY_PATTERN", r"Application startup complete"))
+WORKER_STOP_TIMEOUT_SEC = float(os.environ.get("WORKER_STOP_TIMEOUT_SEC", "30"))
+_READ_LIMIT = 1 << 20  # longest worker output line buffered (longer ones are dropped)
+
+PROFILES_DIR = REPO_ROOT / "configs" / "model_profiles"
+# Profile key -> env var read by _build_vllm_cmd (and run_vllm_worker.sh)
+PROFILE_ENV = {
+    "max_model_len": "VLLM_MAX_MODEL_LEN",
+    "max_num_seqs": "VLLM_MAX_NUM_SEQS",
+    "max_num_batched_tokens": "VLLM_MAX_NUM_BATCHED_TOKENS",
+    "gpu_memory_utilization": "VLLM_GPU_MEMORY_UTILIZATION",
+    "enable_chunked_prefill": "VLLM_ENABLE_CHUNKED_PREFILL",
+    "cuda_visible_devices": "CUDA_VISIBLE_DEVICES",  # GPU placement (worker pool replicas)
+}
+
+DEFAULT_GPU_MEMORY_UTILIZATION = 0.85
+
+logger = logging.getLogger(__name__)
+
+
+def list_profiles() -> list[str]:
+    return sorted(p.stem for p in PROFILES_DIR.glob("*.yaml"))
+
+
+def load_profile(name: str) -> dict:
+    """configs/model_profiles/<name>.yaml as a dict (ValueError if unknown)."""
+    import yaml
+
+    path = PROFILES_DIR / f"{name}.yaml"
+    if not path.is_file():
+        raise ValueError(f"unknown profile {name!r} (have: {', '.join(list_profiles())})")
+    return yaml.safe_load(path.read_text()) or {}
+
+
+def profile_env(profile: dict) -> dict[str, str]:
+    """VLLM_* env overrides for a profile; unknown keys raise ValueError."""
+    unknown = set(profile) - set(PROFILE_ENV)
+    if unknown:
+        raise ValueError(f"unknown profile keys: {', '.join(sorted(unknown))}")
+    env = {}
+    for key, value in profile.items():
+        env[PROFILE_ENV[key]] = str(value).lower() if isinstance(value, bool) else str(value)
+    return env
+
+
+def gpu_memory_utilization(profile: dict | None = None) -> float:
+    """GPU memory fraction a worker with this profile claims (0 with WORKER_BACKEND=mock)."""
+    if os.environ.get("WORKER_BACKEND", "vllm").lower() == "mock":
+        return 0.0
+    value = (profile or {}).get("gpu_memory_utilization")
+    if value is None:
+        value = os.environ.get("VLLM_GPU_MEMORY_UTILIZATION") or DEFAULT_GPU_MEMORY_UTILIZATION
+    return float(value)
 
 
-def _build_vllm_cmd() -> list[str]:
+def _build_mock_cmd(port: int | None = None) -> list[str]:
+    """Stub worker: mock vLLM with the same host/port as the real one."""
+    return [
+        sys.executable, "-m", "uvicorn", "scripts.mock_vllm:app",
+        "--host", os.environ.get("VLLM_HOST", "0.0.0.0"),
+        "--port", str(port or os.environ.get("VLLM_PORT", "8000")),
+        "--log-level", "info",
+        "--no-access-log",
+    ]
+
+
+def _build_vllm_cmd(sleep_mode: bool = False, port: int | None = None, env: dict[str, str] | None = None) -> list[str]:
     """Build vllm serve command from env (mirror run_vllm_worker.sh)."""
-    model = os.environ.get("VLLM_MODEL", "Qwen/Qwen2.5-0.5B-Instruct")
-    host = os.environ.get("VLLM_HOST", "0.0.0.0")
-    port = os.environ.get("VLLM_PORT", "8000")
-    max_num_seqs = os.environ.get("VLLM_MAX_NUM_SEQS", "64")
-    gpu_mem = os.environ.get("VLLM_GPU_MEMORY_UTILIZATION", "0.85")
-    max_batched = os.environ.get("VLLM_MAX_NUM_BATCHED_TOKENS", "")
-    chunked = os.environ.get("VLLM_ENABLE_CHUNKED_PREFILL", "true").lower() in ("true", "1", "yes")
+    env = os.environ if env is None else env
+    model = env.get("VLLM_MODEL", "Qwen/Qwen2.5-0.5B-Instruct")
+    host = env.get("VLLM_HOST", "0.0.0.0")
+    port = str(port or env.get("VLLM_PORT", "8000"))
+    max_model_len = env.get("VLLM_MAX_MODEL_LEN", "512")
+    max_num_seqs = env.get("VLLM_MAX_NUM_SEQS", "64")
+    gpu_mem = env.get("VLLM_GPU_MEMORY_UTILIZATION", str(DEFAULT_GPU_MEMORY_UTILIZATION))
+    max_batched = env.get("VLLM_MAX_NUM_BATCHED_TOKENS", "")
+    chunked = env.get("VLLM_ENABLE_CHUNKED_PREFILL", "true").lower() in ("true", "1", "yes")
 
     vllm_exe = shutil.which("vllm")
     if vllm_exe:
@@ -36,7 +127,7 @@ def _build_vllm_cmd() -> list[str]:
     args = base + [
         "--host", host,
         "--port", port,
-        "--max-model-len", "512",
+        "--max-model-len", max_model_len,
         "--max-num-seqs", max_num_seqs,
         "--gpu-memory-utilization", gpu_mem,
     ]
@@ -44,53 +135,122 @@ def _build_vllm_cmd() -> list[str]:
         args.extend(["--max-num-batched-tokens", max_batched])
     if chunked:
         args.append("--enable-chunked-prefill")
+    if sleep_mode:
+        # Exposes POST /sleep and /wake_up (dev-mode endpoints) for warm standby
+        args.append("--enable-sleep-mode")
     return args
 
 
 class WorkerProcess:
-    """Start/stop vLLM worker as a subprocess."""
+    """Start/stop vLLM worker as an asyncio subprocess, keeping the tail of its output."""
 
-    def __init__(self) -> None:
-        self._process: subprocess.Popen | None = None
+    def __init__(self, sleep_mode: bool = False, port: int | None = None, profile: dict | None = None) -> None:
+        self._process: asyncio.subprocess.Process | None = None
+        self._reader: asyncio.Task | None = None
+        self.sleep_mode = sleep_mode
+        self.port = port  # None = VLLM_PORT
+        self.profile = profile or {}  # overrides VLLM_* env (see PROFILE_ENV)
+        self.backend = os.environ.get("WORKER_BACKEND", "vllm").lower()
+        self.log: collections.deque[str] = collections.deque(maxlen=WORKER_LOG_LINES)
+        self.log_ready = asyncio.Event()  # WORKER_READY_PATTERN seen since the last start
+        self.returncode: int | None = None  # exit code of the last process
 
-    def start(self) -> None:
+    async def start(self) -> None:
         """Start vLLM worker subprocess. Idempotent: no-op if already running."""
-        if self._process is not None and self._process.poll() is None:
+        if self.is_alive():
             return
         env = os.environ.copy()
         env.setdefault("VLLM_MODEL", "Qwen/Qwen2.5-0.5B-Instruct")
-        cmd = _build_vllm_cmd()
-        self._process = subprocess.Popen(
-            cmd,
+        env.update(profile_env(self.profile))
+        if self.backend == "mock":
+            cmd = _build_mock_cmd(self.port)
+        else:
+            cmd = _build_vllm_cmd(self.sleep_mode, self.port, env)
+            if self.sleep_mode:
+                env["VLLM_SERVER_DEV_MODE"] = "1"
+        self.log_ready.clear()
+        self.returncode = None
+        self._process = await asyncio.create_subprocess_exec(
+            *cmd,
             cwd=str(REPO_ROOT),
             env=env,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.PIPE,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            limit=_READ_LIMIT,
         )
+        self.log.append(f"--- started pid={self._process.pid}: {' '.join(cmd)}")
+        self._reader = asyncio.create_task(self._read_output(self._process.stdout))
 
-    def stop(self) -> None:
-        """Terminate worker process. Idempotent."""
-        if self._process is None:
-            return
+    async def _read_output(self, stream: asyncio.StreamReader) -> None:
+        """Drain the worker's output into the ring buffer until EOF."""
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:  # line over _READ_LIMIT: the reader already discarded it
+                continue
+            if not line:
+                return
+            text = line.decode(errors="replace").rstrip()
+            self.log.append(text)
+            logger.debug("worker[%s]: %s", self.port, text)
+            if not self.log_ready.is_set() and WORKER_READY_PATTERN.search(text):
+                self.log_ready.set()
+
+    async def wait_log_ready(self, timeout: float) -> bool:
+        """Sleep up to timeout, returning early (True) once the ready line was logged."""
         try:
-            self._process.terminate()
+            await asyncio.wait_for(self.log_ready.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def stop(self) -> None:
+        """SIGTERM the worker, SIGKILL after WORKER_STOP_TIMEOUT_SEC. Idempotent."""
+        proc = self._process
+        if proc is None:
+            return
+        if proc.returncode is None:
+            try:
+                proc.terminate()
+                try:
+                    await asyncio.wait_for(proc.wait(), timeout=WORKER_STOP_TIMEOUT_SEC)
+                except asyncio.TimeoutError:
+                    logger.warning("Worker pid=%s ignored SIGTERM for %.0fs, killing", proc.pid, WORKER_STOP_TIMEOUT_SEC)
+                    proc.kill()
+                    await proc.wait()
+            except ProcessLookupError:
+                await proc.wait()
+        if self._reader is not None:
             try:
-                self._process.wait(timeout=30)
-            except subprocess.TimeoutExpired:
-                self._process.kill()
-                self._process.wait(timeout=10)
-        except Exception:
-            pass
+                await asyncio.wait_for(self._reader, timeout=5.0)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+            self._reader = None
+        self.returncode = proc.returncode
+        self.log.append(f"--- exited pid={proc.pid} code={proc.returncode}")
         self._process = None
 
     def is_alive(self) -> bool:
         """Return True if process is running."""
         if self._process is None:
             return False
-        return self._process.poll() is None
+        return self._process.returncode is None
+
+    def exit_code(self) -> int | None:
+        """Exit code if the process has exited on its own, else None."""
+        if self._process is None:
+            return self.returncode
+        return self._process.returncode
 
     def get_pid(self) -> int | None:
         """Return process PID or None."""
         if self._process is None:
             return None
         return self._process.pid
+
+    def tail(self, lines: int = 100) -> list[str]:
+        """Last `lines` lines of worker output."""
+        if lines <= 0:
+            return []
+        return list(self.log)[-lines:]
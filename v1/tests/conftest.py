@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Modules are imported as scripts.X from the v1 directory, as the gateway does
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,39 @@
+from scripts import policies
+from scripts.policies import DegradationConfig, DegradationEngine, PriorityClass
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_slow_backend_raises_wait_estimate(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(policies.time, "monotonic", clock)
+    engine = DegradationEngine(DegradationConfig(tokens_per_sec=1000.0), [PriorityClass("interactive")])
+    assumed_wait = engine.estimated_wait_sec(8)
+    assert engine.tier_for("interactive", 8) == 0
+
+    # Gateway idle for an hour before traffic: must not count in the first window
+    clock.now += 3600
+    # 50 tok/s backend: one 100-token completion every 2s
+    for _ in range(10):
+        engine.on_completion(100)
+        clock.now += 2.0
+
+    assert 40 <= engine.tokens_per_sec <= 110
+    assert engine.estimated_wait_sec(8) > 5 * assumed_wait
+    assert engine.tier_for("interactive", 8) > 0
+
+
+def test_fast_backend_raises_throughput(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(policies.time, "monotonic", clock)
+    engine = DegradationEngine(DegradationConfig(tokens_per_sec=1000.0), [PriorityClass("interactive")])
+    for _ in range(20):
+        engine.on_completion(200)
+        clock.now += 0.1
+    assert engine.tokens_per_sec > 1000.0
@@ -1,5 +1,5 @@
 #!/usr/bin/env bash
-# v2: Deploy to Kubernetes (namespace, worker, gateway, HPA).
+# v2: Deploy to Kubernetes (namespace, worker, redis, gateway, HPA).
 #
 # Prerequisites:
 #   - kubectl configured (minikube, kind, or cloud cluster)
@@ -22,6 +22,7 @@ kubectl apply -f "$K8S_DIR/namespace.yaml"
 kubectl apply -f "$K8S_DIR/worker-deployment.yaml"
 kubectl apply -f "$K8S_DIR/worker-service.yaml"
 kubectl apply -f "$K8S_DIR/worker-hpa.yaml"
+kubectl apply -f "$K8S_DIR/redis.yaml"
 kubectl apply -f "$K8S_DIR/gateway-deployment.yaml"
 kubectl apply -f "$K8S_DIR/gateway-service.yaml"
 kubectl apply -f "$K8S_DIR/gateway-hpa.yaml"